@@ -0,0 +1,90 @@
+"""
+Benchmark of the `stash` and `index` snapshot engines on a generated repository.
+
+Usage:
+    python benchmarks/snapshot_engines.py --files 20000 --modified 2000 --untracked 2000
+
+For each engine this reports the wall time of `PITRepo.snapshot(...)` and the number of worktree files whose mtime was changed by the snapshot. The `stash` engine is measured with its default (no dedup) and with dedup, which builds the tree of the snapshot before stashing. A file is modified before each snapshot, so dedup never finds an existing snapshot and its full cost is measured.
+"""
+import os
+import time
+import argparse
+import subprocess
+from tempfile import TemporaryDirectory
+
+from point_in_time.repo import PITRepo
+from point_in_time.utils.fs import ChDir
+from point_in_time.utils.main import flatten_status_paths
+
+def git(*args: str):
+    subprocess.run(['git', *args], check=True, capture_output=True)
+
+def write_files(root: str, count: int, size: int, prefix: str):
+    for i in range(count):
+        d = os.path.join(root, prefix, f'{i // 1000:04d}')
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f'file_{i}.txt'), 'wb') as f:
+            f.write(os.urandom(size // 2).hex().encode())
+
+def mtimes(root: str) -> dict:
+    state = {}
+    for dirpath, dirs, files in os.walk(root):
+        for skip in ('.git', '.pit'):
+            if skip in dirs:
+                dirs.remove(skip)
+        for f in files:
+            p = os.path.join(dirpath, f)
+            state[p] = os.stat(p).st_mtime_ns
+    return state
+
+CONFIGURATIONS = [
+    # (name, engine, dedup)
+    ('stash', 'stash', None),
+    ('stash+dedup', 'stash', True),
+    ('index', 'index', None),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20000, help='Number of committed files')
+    parser.add_argument('--modified', type=int, default=2000, help='Number of committed files to modify')
+    parser.add_argument('--untracked', type=int, default=2000, help='Number of untracked files')
+    parser.add_argument('--size', type=int, default=1024, help='Size of each file in bytes')
+    parser.add_argument('--repeat', type=int, default=3, help='Snapshots per engine')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as root, ChDir(root):
+        git('init')
+        git('config', 'user.email', 'bench@pit')
+        git('config', 'user.name', 'Pit Benchmark')
+
+        write_files(root, args.files, args.size, 'tracked')
+        git('add', '-A')
+        git('commit', '-m', 'Initial commit')
+
+        write_files(root, args.modified, args.size, 'tracked')
+        write_files(root, args.untracked, args.size, 'untracked')
+
+        repo = PITRepo.create_repo(os.path.join(root, '.pit'))
+        paths = flatten_status_paths(repo.get_snapshot_paths())
+
+        print(f'{"engine":<12} {"mean (s)":>10} {"min (s)":>10} {"mtimes changed":>16}')
+        for name, engine, dedup in CONFIGURATIONS:
+            timings = []
+            changed = 0
+            for i in range(args.repeat):
+                with open(os.path.join(root, 'tracked', '0000', 'file_0.txt'), 'w') as f:
+                    f.write(f'{name} {i}')
+
+                before = mtimes(root)
+                start = time.perf_counter()
+                repo.snapshot(paths, engine=engine, dedup=dedup)
+                timings.append(time.perf_counter() - start)
+
+                after = mtimes(root)
+                changed = max(changed, sum(before[p] != after.get(p) for p in before))
+
+            print(f'{name:<12} {sum(timings) / len(timings):>10.3f} {min(timings):>10.3f} {changed:>16}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark of CLI cold start, for scripts which call `pit` many times.
+
+Usage:
+    python benchmarks/startup.py --repeat 20
+
+Reports the wall time of `pit --help`, and of `pit log` in a generated repository with and without the daemon running.
+"""
+import os
+import time
+import argparse
+import subprocess
+from tempfile import TemporaryDirectory
+
+from point_in_time.constants.main import PIT_NO_DAEMON_ENV
+
+def git(*args: str):
+    subprocess.run(['git', *args], check=True, capture_output=True)
+
+def timed(args, repeat: int, env=None) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, capture_output=True, env=env)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per command, the best is reported')
+    parser.add_argument('--snapshots', type=int, default=20, help='Snapshots in the generated repository')
+    args = parser.parse_args()
+
+    print(f"{'pit --help':<24} {timed(['pit', '--help'], args.repeat):.3f}s")
+
+    with TemporaryDirectory() as root:
+        os.chdir(root)
+        git('init')
+        git('config', 'user.email', 'bench@pit')
+        git('config', 'user.name', 'Pit Benchmark')
+        subprocess.run(['pit', 'init'], check=True, capture_output=True)
+        for i in range(args.snapshots):
+            with open('file.txt', 'w') as f:
+                f.write(str(i))
+            subprocess.run(['pit', 'snapshot', '-y', '--engine', 'index'], check=True, capture_output=True)
+
+        no_daemon = dict(os.environ, **{PIT_NO_DAEMON_ENV: '1'})
+        print(f"{'pit log':<24} {timed(['pit', 'log'], args.repeat, no_daemon):.3f}s")
+
+        subprocess.run(['pit', 'daemon', 'start'], check=True, capture_output=True)
+        try:
+            print(f"{'pit log (daemon)':<24} {timed(['pit', 'log'], args.repeat):.3f}s")
+        finally:
+            subprocess.run(['pit', 'daemon', 'stop'], check=True, capture_output=True)
+
+if __name__ == '__main__':
+    main()
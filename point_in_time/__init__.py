@@ -0,0 +1,19 @@
+"""
+Lightweight tooling for tracking experiment state in git based repositories. See `point_in_time.api` for use from Python.
+"""
+
+__all__ = [
+    'open_repo',
+    'snapshot',
+    'log',
+    'show',
+    'query',
+    'compare',
+]
+
+def __getattr__(name: str):
+    # Note: Imported lazily so the CLI does not pay for the API's dependencies, see `point_in_time.cli.main`
+    if name in __all__:
+        from point_in_time import api
+        return getattr(api, name)
+    raise AttributeError(f"module 'point_in_time' has no attribute '{name}'")
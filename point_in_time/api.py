@@ -0,0 +1,245 @@
+"""
+Library API for using pit from Python, e.g. from a training script:
+
+```python
+>>> import point_in_time
+>>> future = point_in_time.snapshot(metadata={'run': 'lr-sweep-3'}, background=True)
+>>> train() # Starts immediately, the snapshot completes in parallel
+>>> future.result().pit_id
+'amber-heron-1a2b3c4'
+```
+
+All functions are thread-safe. Each call works on its own `PITRepo`, which runs git with an explicit working directory, so the process working directory is never relied upon or changed.
+"""
+from __future__ import annotations
+import socket
+import getpass
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from point_in_time.repo import PITRepo, PITLogEntry, SnapshotDetails
+from point_in_time.metadata_table import Column
+from point_in_time.errors import PITInternalError, PITRepoLoadError, PITIdNotFoundError
+from point_in_time.query_index import PITQueryIndex, QueryFilter
+from point_in_time.utils.context import RepoContext
+from point_in_time.utils.main import flatten_status_paths
+
+__all__ = [
+    'open_repo',
+    'snapshot',
+    'log',
+    'show',
+    'query',
+    'compare',
+    'default_metadata',
+]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Note: Snapshots run one at a time, they are IO bound and mostly wait on git
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pit-snapshot')
+        return _executor
+
+def default_metadata() -> Dict[str, Any]:
+    """
+    Returns:
+        Dict[str, Any]: The metadata recorded by `pit snapshot`, the user and host name.
+    """
+    return {
+        'username': getpass.getuser(),
+        'hostname': socket.gethostname()
+    }
+
+def open_repo(path: Optional[str] = None) -> PITRepo:
+    """
+    Opens the pit repository containing a directory.
+
+    Args:
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory.
+
+    Raises:
+        PITRepoLoadError: If the directory is not inside of a git working tree with an initialized pit repository.
+
+    Returns:
+        PITRepo: The repository.
+    """
+    context = RepoContext.current(path)
+    if not context.is_inside_working_tree:
+        raise PITRepoLoadError("Not a git repository: %s" % context.cwd)
+
+    repo = PITRepo(context.pit_path)
+    # Note: Raises if the repository was not initialized
+    repo._open_log()
+    return repo
+
+def _snapshot(
+    repo: PITRepo,
+    metadata: Optional[Dict[str, Any]],
+    untracked: bool,
+    engine: str
+) -> PITLogEntry:
+    paths = repo.get_snapshot_paths()
+    if not untracked:
+        paths.pop('??', None)
+
+    return repo.snapshot(
+        paths=flatten_status_paths(
+            paths,
+            codes=[c for c in paths.keys() if c != '!!']
+        ),
+        metadata=metadata,
+        force_paths=flatten_status_paths(paths, codes=['!!']),
+        engine=engine
+    )
+
+def snapshot(
+    path: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    untracked: bool = True,
+    engine: str = 'index',
+    background: bool = False
+) -> Union[PITLogEntry, Future]:
+    """
+    Snapshots the paths selected by the include file, the same as `pit snapshot -y`.
+
+    With `background=True` the snapshot runs on a background thread and a `concurrent.futures.Future` is returned immediately, its result is the new `PITLogEntry`. Background snapshots are completed before the interpreter exits.
+
+    The default `index` engine never modifies the worktree, so the caller can keep working on (and writing to) the repository while a background snapshot runs. Files modified before git reads them are captured in their modified state.
+
+    Args:
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory. Resolved immediately, not when a background snapshot runs.
+        metadata (Optional[Dict[str, Any]], optional): Metadata to record with the log entry, defaults to `default_metadata()`.
+        untracked (bool, optional): Include untracked files.
+        engine (str, optional): One of `SNAPSHOT_ENGINES`. The `stash` engine temporarily removes changes from the worktree so is not allowed in the background.
+        background (bool, optional): Return a future instead of waiting for the snapshot.
+
+    Raises:
+        PITRepoLoadError: If the directory is not inside of an initialized pit repository.
+        PITInternalError: If the `stash` engine is requested in the background.
+
+    Returns:
+        Union[PITLogEntry, Future]: The new log entry, or a future of it.
+    """
+    if metadata is None:
+        metadata = default_metadata()
+
+    # Note: Opened now so errors are raised to the caller, and the background thread does not depend on the working directory later
+    repo = open_repo(path)
+
+    if not background:
+        return _snapshot(repo, metadata, untracked, engine)
+
+    if engine == 'stash':
+        raise PITInternalError("The 'stash' engine modifies the worktree and can not be used in the background")
+    return _get_executor().submit(_snapshot, repo, metadata, untracked, engine)
+
+def log(path: Optional[str] = None, limit: Optional[int] = None) -> List[SnapshotDetails]:
+    """
+    Args:
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory.
+        limit (Optional[int], optional): Return at most this many of the newest entries.
+
+    Returns:
+        List[SnapshotDetails]: Details of the logged snapshots, newest first.
+    """
+    repo = open_repo(path)
+    return list(repo.iter_details(repo.iter_log(limit=limit)))
+
+def show(pit_id: str, path: Optional[str] = None) -> SnapshotDetails:
+    """
+    Args:
+        pit_id (str): The id of the snapshot.
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory.
+
+    Raises:
+        PITIdNotFoundError: If the id does not exist in the log.
+
+    Returns:
+        SnapshotDetails: Details of the snapshot.
+    """
+    repo = open_repo(path)
+    e = repo.get_entry(pit_id)
+    if e is None:
+        raise PITIdNotFoundError("Specified Pit id does not exist in log.")
+
+    return repo.get_details(e)
+
+def query(
+    filters: Sequence[str] = (),
+    path: Optional[str] = None,
+    sort: Optional[str] = None,
+    ascending: bool = False,
+    limit: Optional[int] = None
+) -> List[SnapshotDetails]:
+    """
+    Finds snapshots by their metadata, the same as `pit query`:
+
+    ```python
+    >>> point_in_time.query(['metadata.lr>1e-3', 'host=gpu-01'], sort='metadata.loss', ascending=True)
+    ```
+
+    Args:
+        filters (Sequence[str], optional): Conditions the snapshots must meet, see `QueryFilter`.
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory.
+        sort (Optional[str], optional): Field to sort by, defaults to the order of the log.
+        ascending (bool, optional): Sort in ascending order, by default the newest or largest are first.
+        limit (Optional[int], optional): Return at most this many snapshots.
+
+    Raises:
+        PITQueryError: If a filter or the sort field is invalid.
+
+    Returns:
+        List[SnapshotDetails]: Details of the matching snapshots.
+    """
+    parsed = [QueryFilter.parse(f) for f in filters]
+
+    repo = open_repo(path)
+    index = PITQueryIndex(repo)
+    index.sync()
+    pit_ids = index.query(parsed, sort=sort, ascending=ascending, limit=limit)
+
+    return list(repo.iter_details(repo.get_entry(pit_id) for pit_id in pit_ids))
+
+def compare(
+    filters: Sequence[str] = (),
+    columns: Optional[Sequence[str]] = None,
+    path: Optional[str] = None,
+    sort: Optional[str] = None,
+    ascending: bool = False,
+    limit: Optional[int] = None
+) -> Dict[str, Column]:
+    """
+    The metadata of many snapshots as columns, the same as `pit compare`. Reads the log directly rather than building a `SnapshotDetails` per snapshot, so it is suited to comparing thousands of runs:
+
+    ```python
+    >>> columns = point_in_time.compare(['metadata.opt.name=adam'], columns=['metadata.lr', 'metadata.loss'])
+    >>> numpy.frombuffer(columns['metadata.loss'].values)
+    array([0.31, 0.29, ...])
+    ```
+
+    Args:
+        filters (Sequence[str], optional): Conditions the snapshots must meet, see `QueryFilter`. Only `pit_id`, `hash` and metadata fields are available.
+        columns (Optional[Sequence[str]], optional): Fields to return, defaults to all. `pit_id` is always returned.
+        path (Optional[str], optional): Any directory inside of the git working tree, defaults to the current working directory.
+        sort (Optional[str], optional): Field to sort by, defaults to the order of the log.
+        ascending (bool, optional): Sort in ascending order, by default the newest or largest are first.
+        limit (Optional[int], optional): Return at most this many snapshots.
+
+    Raises:
+        PITQueryError: If a filter, column or the sort field is invalid.
+
+    Returns:
+        Dict[str, Column]: Columns by field name, with one value per matching snapshot. Fields no snapshot in the log has a value for are missing.
+    """
+    parsed = [QueryFilter.parse(f) for f in filters]
+
+    table = open_repo(path).get_metadata_table()
+    rows = table.select(parsed, sort=sort, ascending=ascending, limit=limit)
+    names = None if columns is None else ['pit_id'] + [c for c in columns if c != 'pit_id']
+    return table.take(rows, names)
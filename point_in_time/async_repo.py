@@ -0,0 +1,385 @@
+"""
+Asyncio counterpart of `PITRepo`, for services driving many repositories from one event loop:
+
+```python
+>>> async def snapshot_all(paths):
+...     repos = [AsyncPITRepo(p) for p in paths]
+...     return await asyncio.gather(*(r.snapshot_included() for r in repos))
+```
+
+Git runs through `asyncio.create_subprocess_exec` and its output is parsed as it streams in, by the same parsers as `PITRepo`. Everything which does not run git (the include file, log and details cache) is shared with `PITRepo`.
+"""
+from __future__ import annotations
+import os
+import asyncio
+import weakref
+import subprocess
+from tempfile import TemporaryDirectory
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Union
+
+from point_in_time.constants.main import PIT_ASYNC_MAX_GIT_PROCESSES
+from point_in_time.errors import (
+    PITInternalError,
+    PITIdNotFoundError,
+    PITSnapshotFailedError
+)
+from point_in_time.repo import PITRepo, PITLogEntry, SnapshotDetails, index_snapshot_steps
+from point_in_time.utils.main import GitStatus, flatten_status_paths
+from point_in_time.utils.git_async import (
+    git_run_async,
+    git_status_porcelain_v2_async,
+    git_commit_details_batch_async
+)
+
+__all__ = ['AsyncPITRepo']
+
+T = TypeVar('T')
+
+_limiters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+def default_limiter() -> asyncio.Semaphore:
+    """
+    Returns:
+        asyncio.Semaphore: The limiter shared by all `AsyncPITRepo`s on the running event loop, allowing `PIT_ASYNC_MAX_GIT_PROCESSES` git processes at once.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        # Note: Created inside of the loop, older versions of python bind semaphores to the loop on creation
+        limiter = asyncio.Semaphore(PIT_ASYNC_MAX_GIT_PROCESSES)
+        _limiters[loop] = limiter
+    return limiter
+
+class AsyncPITRepo:
+    """
+    Covers the status, snapshot, log and show operations of `PITRepo`. Only the `index` snapshot engine is available, as it builds the tree in a private index without writing to the worktree.
+
+    Concurrency is bounded by a limiter which each git process holds while it runs. By default all repositories on an event loop share one (see `default_limiter`), pass a semaphore to bound a group of repositories separately. Steps shared with `PITRepo` run in the default executor, holding the limiter for as long as they run as they start git themselves (see `_run_blocking`).
+    """
+    def __init__(self, path: str, limiter: Optional[asyncio.Semaphore] = None):
+        """
+        Args:
+            path (str): Path to the `.pit/` directory.
+            limiter (Optional[asyncio.Semaphore], optional): Bounds the git processes run at once, defaults to `default_limiter()`.
+        """
+        self._repo = PITRepo(path)
+        self._toplevel = self._repo._toplevel
+        self._limiter = limiter
+
+    @property
+    def repo(self) -> PITRepo:
+        """
+        The blocking repository sharing this repository's caches.
+        """
+        return self._repo
+
+    def _get_limiter(self) -> asyncio.Semaphore:
+        if self._limiter is None:
+            return default_limiter()
+        return self._limiter
+
+    async def _git(
+        self,
+        args: List[str],
+        input: Optional[bytes] = None,
+        env: Optional[dict] = None
+    ) -> subprocess.CompletedProcess:
+        return await git_run_async(
+            args,
+            input=input,
+            env=env,
+            cwd=self._toplevel,
+            limiter=self._get_limiter()
+        )
+
+    async def _run_blocking(self, fn: Callable[..., T], *args) -> T:
+        """
+        Runs a blocking step of `PITRepo` in the default executor, holding the limiter throughout as the step runs git processes (one at a time) itself.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._get_limiter():
+            return await loop.run_in_executor(None, fn, *args)
+
+    async def _collect_status(
+        self,
+        pathspecs: Optional[List[str]] = None,
+        ignored: str = 'traditional',
+        untracked: str = 'normal'
+    ) -> GitStatus:
+        status = GitStatus({}, pathspecs=pathspecs)
+        args = GitStatus.collect_args(pathspecs, ignored, untracked)
+        if args is None:
+            return status
+
+        async for entry in git_status_porcelain_v2_async(
+            args,
+            cwd=self._toplevel,
+            limiter=self._get_limiter()
+        ):
+            status.add_entry(entry)
+        return status
+
+    async def get_status(self, scoped: bool = False) -> GitStatus:
+        """
+        See `PITRepo.get_status(...)`. When the include file has a force section both scans run concurrently.
+        """
+        include = self._repo._load_include()
+
+        pathspecs = None
+        if scoped:
+            pathspecs = include.include_pathspecs
+        scans = [self._collect_status(pathspecs=pathspecs, ignored='no')]
+        if include.force is not None:
+            scans.append(self._collect_status(
+                pathspecs=include.force_pathspecs,
+                ignored='traditional',
+                untracked='all'
+            ))
+
+        git_status, *forced = await asyncio.gather(*scans)
+        if len(forced) != 0:
+            git_status.merge_ignored(forced[0])
+        return git_status
+
+    async def get_snapshot_paths(
+        self,
+        git_status: Optional[GitStatus] = None
+    ) -> Dict[str, Set[Union[str, Tuple[str]]]]:
+        """
+        See `PITRepo.get_snapshot_paths(...)`.
+        """
+        if git_status is None:
+            git_status = await self.get_status(scoped=True)
+
+        scoped_status = None
+        include = self._repo._load_include()
+        included = self._repo._filter_included(git_status, include)
+        if len(self._repo._partly_included_directories(git_status, included, include)) != 0:
+            scoped_status = await self._collect_status(pathspecs=include.include_pathspecs, ignored='no')
+        return self._repo.get_snapshot_paths(git_status, scoped_status=scoped_status)
+
+    async def get_snapshot_paths_status(
+        self,
+        snapshot_paths: Optional[Dict[str, Set[Union[str, Tuple[str]]]]] = None,
+        cli: bool = False,
+        git_status: Optional[GitStatus] = None
+    ) -> List[str]:
+        """
+        See `PITRepo.get_snapshot_paths_status(...)`.
+        """
+        if git_status is None or git_status.pathspecs is not None:
+            # The paths not included can only be found from a full scan
+            git_status = await self.get_status()
+        return self._repo.get_snapshot_paths_status(
+            snapshot_paths=snapshot_paths,
+            cli=cli,
+            git_status=git_status
+        )
+
+    async def snapshot(
+        self,
+        paths: List[str],
+        metadata: Optional[dict] = None,
+        force_paths: Optional[List[str]] = None,
+        engine: str = 'index',
+        dedup: bool = True
+    ) -> PITLogEntry:
+        """
+        See `PITRepo.snapshot(...)`.
+
+        Raises:
+            PITInternalError: If an engine other than `index` is requested.
+            PITSizeBudgetError: If the included files exceed the size budgets.
+        """
+        if engine != 'index':
+            raise PITInternalError("Only the 'index' engine is available to AsyncPITRepo")
+        if metadata is None:
+            metadata = {}
+        if force_paths is None:
+            force_paths = []
+
+        # Note: Stat calls block, so the size budget is checked off of the event loop
+        loop = asyncio.get_running_loop()
+        await self._run_blocking(self._repo.check_size_budget, paths, force_paths)
+
+        result = await self._git(['rev-parse', '--verify', '-q', 'HEAD^{commit}'])
+        parent = result.stdout.decode().strip() if result.returncode == 0 else None
+        # Note: Scanned before the tree is built, see `point_in_time.worktree_cache`
+        scan = await self._run_blocking(self._repo._scan_worktree, force_paths)
+        tree = await self._snapshot_tree(parent, paths, force_paths)
+
+        # Note: Looking up and appending may wait on other processes holding the log lock, so are kept off of the event loop
+        if dedup:
+            original = await self._run_blocking(self._repo.find_snapshot, tree, parent)
+            if original is not None:
+                s = PITRepo._new_alias(original, metadata)
+                await loop.run_in_executor(None, self._repo.append_log, s)
+                await self._run_blocking(self._repo._record_worktree, scan, tree, parent)
+                return s
+
+        commit_args = ['commit-tree', tree]
+        if parent is not None:
+            commit_args += ['-p', parent]
+        result = await self._git(commit_args, input=b'Pit snapshot')
+        if result.returncode != 0:
+            raise PITSnapshotFailedError(result.stderr.decode())
+        commit = result.stdout.decode().strip()
+
+        s = PITRepo._new_entry(commit, metadata, tree_hash=tree)
+        await loop.run_in_executor(None, self._repo.append_log, s)
+        await self._run_blocking(self._repo._record_worktree, scan, tree, parent)
+        async for details in git_commit_details_batch_async(
+            [commit],
+            cwd=self._toplevel,
+            limiter=self._get_limiter()
+        ):
+            self._repo._details_cache.put(details)
+
+        return s
+
+    async def snapshot_included(
+        self,
+        metadata: Optional[dict] = None,
+        untracked: bool = True
+    ) -> PITLogEntry:
+        """
+        Snapshots the paths selected by the include file, the same as `pit snapshot -y --engine index`.
+
+        Args:
+            metadata (Optional[dict], optional): Metadata to record with the log entry.
+            untracked (bool, optional): Include untracked files.
+
+        Returns:
+            PITLogEntry: The new log entry.
+        """
+        paths = await self.get_snapshot_paths()
+        if not untracked:
+            paths.pop('??', None)
+
+        return await self.snapshot(
+            paths=flatten_status_paths(
+                paths,
+                codes=[c for c in paths.keys() if c != '!!']
+            ),
+            metadata=metadata,
+            force_paths=flatten_status_paths(paths, codes=['!!'])
+        )
+
+    async def _snapshot_tree(self, parent: Optional[str], paths: List[str], force_paths: List[str]) -> str:
+        with TemporaryDirectory() as tmp:
+            env = os.environ.copy()
+            env['GIT_INDEX_FILE'] = os.path.join(tmp, 'index')
+
+            # Note: Hashing files is CPU bound, so is kept off of the event loop
+            pointer_tree = os.path.join(tmp, 'pointers')
+            paths, force_paths, pointer_paths = await self._run_blocking(
+                self._repo._prepare_large_files,
+                paths,
+                force_paths,
+                pointer_tree
+            )
+
+            # Note: A single worker, so the git processes hashing blobs stay within the one slot of the limiter held
+            hashed = await self._run_blocking(self._repo._hash_blobs, parent, paths, force_paths, 1)
+
+            async def run(args: List[str], input: Optional[bytes] = None) -> str:
+                result = await self._git(args, input=input, env=env)
+                if result.returncode != 0:
+                    raise PITSnapshotFailedError(result.stderr.decode())
+                return result.stdout.decode().strip()
+
+            for args, input in index_snapshot_steps(
+                parent,
+                hashed.paths,
+                hashed.force_paths,
+                pointer_tree,
+                pointer_paths,
+                hashed.index_info
+            ):
+                await run(args, input=input)
+
+            return await run(['write-tree'])
+
+    async def get_details(self, e: PITLogEntry) -> SnapshotDetails:
+        """
+        See `PITRepo.get_details(...)`.
+        """
+        details = self.iter_details([e])
+        try:
+            return await details.__anext__()
+        finally:
+            await details.aclose()
+
+    async def iter_details(self, entries: Iterable[PITLogEntry]) -> AsyncIterator[SnapshotDetails]:
+        """
+        See `PITRepo.iter_details(...)`, entries missing from the details cache are resolved by a single git process.
+
+        A consumer which stops early should `aclose()` the iterator to release the git process (and its limiter) immediately, rather than when the iterator is garbage collected.
+        """
+        entries = list(entries)
+        cache = self._repo._details_cache
+        cached = {}
+        for e in entries:
+            d = cache.get(e.git_hash)
+            if d is not None:
+                cached[e.git_hash] = d
+
+        misses = [e.git_hash for e in entries if e.git_hash not in cached]
+        git_details = git_commit_details_batch_async(
+            misses,
+            cwd=self._toplevel,
+            limiter=self._get_limiter()
+        )
+        resolved = []
+        try:
+            for e in entries:
+                d = cached.get(e.git_hash)
+                if d is None:
+                    d = await git_details.__anext__()
+                    resolved.append(d)
+
+                yield SnapshotDetails(
+                    _log_entry=e,
+                    _git_details=d
+                )
+        finally:
+            await git_details.aclose()
+            cache.put_many(resolved)
+
+    def load_log(self) -> Dict[str, PITLogEntry]:
+        """
+        Returns:
+            Dict[str, PITLogEntry]: The log entries keyed by pit id, oldest first.
+        """
+        return self._repo._load_log()
+
+    async def log(self, limit: Optional[int] = None) -> AsyncIterator[SnapshotDetails]:
+        """
+        Args:
+            limit (Optional[int], optional): Yield at most this many of the newest entries.
+
+        Yields:
+            SnapshotDetails: Details of the logged snapshots, newest first.
+        """
+        # Note: Reading the log may wait on the log lock, so is kept off of the event loop
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(None, lambda: list(self._repo.iter_log(limit=limit)))
+        details = self.iter_details(entries)
+        try:
+            async for d in details:
+                yield d
+        finally:
+            # Note: Closed explicitly so the git process is released as soon as the consumer stops
+            await details.aclose()
+
+    async def show(self, pit_id: str) -> SnapshotDetails:
+        """
+        Raises:
+            PITIdNotFoundError: If the id does not exist in the log.
+        """
+        loop = asyncio.get_running_loop()
+        e = await loop.run_in_executor(None, self._repo.get_entry, pit_id)
+        if e is None:
+            raise PITIdNotFoundError("Specified Pit id does not exist in log.")
+
+        return await self.get_details(e)
@@ -0,0 +1,176 @@
+"""
+Parallel hashing of the files of an `index` engine snapshot.
+
+`git add` hashes and compresses the files it adds one at a time, so snapshotting many new files (e.g. a fresh experiment directory) is bound by a single core rather than the disk. Instead the regular files of a snapshot are split into batches of about equal size, each written to the object database by its own `git hash-object -w --stdin-paths` process, and the resulting blobs are added to the snapshot's index with `git update-index --index-info` (see `index_snapshot_steps`). Everything else, e.g. deleted files, symlinks or nested repositories, is still added by `git add`.
+
+Small snapshots are left to `git add` entirely, starting the worker processes would cost more than it saves.
+
+Modes follow `git add`: the executable bit of a file decides between `100755` and `100644`, unless `core.fileMode` is false, in which case files keep their mode in `HEAD` and new files are `100644`.
+"""
+import os
+import stat
+import heapq
+import subprocess
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from point_in_time.errors import PITSnapshotFailedError
+from point_in_time.utils.git import git_config_bool, git_hash_objects, git_ls_files_others, git_ls_tree
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['HashedBlobs', 'hash_blobs']
+
+logger = get_logger(__name__)
+
+PARALLEL_HASH_MIN_BYTES = 32 * 1024 * 1024
+"""
+Snapshots with fewer bytes of regular files than this are added by a single `git add`.
+"""
+
+@dataclass
+class HashedBlobs:
+    paths: List[str]
+    """
+    The paths still to add with `git add`.
+    """
+    force_paths: List[str]
+    """
+    The ignored paths still to add with `git add --force`.
+    """
+    index_info: bytes
+    """
+    Input for `git update-index -z --index-info` adding the hashed files, empty if none were hashed.
+    """
+    files: int = 0
+    bytes: int = 0
+    workers: int = 0
+
+def partition_by_size(sizes: Dict[str, int], n: int) -> List[List[str]]:
+    """
+    Splits files into at most `n` batches of about equal total size, the largest files first each into the smallest batch.
+
+    Returns:
+        List[List[str]]: The non empty batches.
+    """
+    heap: List[Tuple[int, int]] = [(0, i) for i in range(n)]
+    batches: List[List[str]] = [[] for _ in range(n)]
+    for path in sorted(sizes, key=lambda p: sizes[p], reverse=True):
+        total, i = heapq.heappop(heap)
+        batches[i].append(path)
+        heapq.heappush(heap, (total + sizes[path], i))
+    return [b for b in batches if len(b) != 0]
+
+def file_mode(st: os.stat_result, base_mode: Optional[str], trust_executable: bool) -> str:
+    """
+    Args:
+        st (os.stat_result): The stat information of a regular file.
+        base_mode (Optional[str]): The mode of the file in `HEAD`, `None` if it is new.
+        trust_executable (bool): The value of `core.fileMode`.
+
+    Returns:
+        str: The mode `git add` gives the file.
+    """
+    if not trust_executable:
+        if base_mode in ('100644', '100755'):
+            return base_mode
+        return '100644'
+    return '100755' if st.st_mode & stat.S_IXUSR else '100644'
+
+def _split_regular_files(
+    toplevel: str,
+    paths: List[str],
+    ignored: bool
+) -> Tuple[List[str], Dict[str, os.stat_result]]:
+    """
+    Returns:
+        Tuple[List[str], Dict[str, os.stat_result]]: The paths which are not regular files, and the stat information of those which are. Untracked directories collapsed by `git status` are expanded to their files.
+    """
+    others = []
+    files = {}
+    directories = [p for p in paths if p.endswith('/')]
+    if len(directories) != 0:
+        paths = [p for p in paths if not p.endswith('/')]
+        paths += git_ls_files_others(directories, ignored=ignored, cwd=toplevel)
+
+    for p in paths:
+        try:
+            st = os.lstat(os.path.join(toplevel, p))
+        except FileNotFoundError:
+            others.append(p) # Deleted
+            continue
+        if stat.S_ISREG(st.st_mode):
+            files[p] = st
+        else:
+            others.append(p)
+    return others, files
+
+def hash_blobs(
+    toplevel: str,
+    paths: List[str],
+    force_paths: List[str],
+    workers: int,
+    min_bytes: Optional[int] = None,
+    parent: Optional[str] = None
+) -> HashedBlobs:
+    """
+    Writes the blobs of the regular files of a snapshot with up to `workers` git processes at once, see the module documentation.
+
+    Args:
+        toplevel (str): The root of the worktree.
+        paths (List[str]): The paths to include, relative to the repository root.
+        force_paths (List[str]): Ignored paths to force into the snapshot.
+        workers (int): The maximum number of git processes, `1` leaves every path to `git add`.
+        min_bytes (Optional[int], optional): Leave every path to `git add` for snapshots with fewer bytes of regular files, defaults to `PARALLEL_HASH_MIN_BYTES`.
+        parent (Optional[str], optional): The commit the snapshot is built on, whose modes are kept when `core.fileMode` is false.
+
+    Raises:
+        PITSnapshotFailedError: If git fails to write a blob.
+
+    Returns:
+        HashedBlobs: The paths left to `git add`, and the index entries of the hashed files.
+    """
+    if min_bytes is None:
+        min_bytes = PARALLEL_HASH_MIN_BYTES
+    if workers <= 1 or len(paths) + len(force_paths) == 0:
+        return HashedBlobs(paths, force_paths, b'')
+
+    other_paths, files = _split_regular_files(toplevel, paths, ignored=False)
+    other_force_paths, forced_files = _split_regular_files(toplevel, force_paths, ignored=True)
+    files.update(forced_files)
+
+    sizes = {p: st.st_size for p, st in files.items()}
+    total = sum(sizes.values())
+    if len(sizes) == 0 or total < min_bytes:
+        return HashedBlobs(paths, force_paths, b'')
+
+    batches = partition_by_size(sizes, min(workers, len(sizes)))
+    try:
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            results = list(executor.map(lambda b: git_hash_objects(b, cwd=toplevel), batches))
+    except subprocess.CalledProcessError as err:
+        raise PITSnapshotFailedError(err.stderr.decode())
+
+    trust_executable = git_config_bool('core.fileMode', True, cwd=toplevel)
+    base_modes = {}
+    if not trust_executable and parent is not None:
+        try:
+            base_modes = {t.path: t.mode for t in git_ls_tree(parent, cwd=toplevel)}
+        except subprocess.CalledProcessError as err:
+            raise PITSnapshotFailedError(err.stderr.decode())
+
+    entries = []
+    for batch, hashes in zip(batches, results):
+        for p, h in zip(batch, hashes):
+            mode = file_mode(files[p], base_modes.get(p), trust_executable)
+            entries.append(f'{mode} {h}\t'.encode() + os.fsencode(p) + b'\0')
+
+    logger.debug("Hashed %d files (%d bytes) with %d git processes" % (len(files), total, len(batches)))
+    return HashedBlobs(
+        other_paths,
+        other_force_paths,
+        b''.join(entries),
+        files=len(files),
+        bytes=total,
+        workers=len(batches)
+    )
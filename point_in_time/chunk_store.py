@@ -0,0 +1,342 @@
+"""
+Deduplicated storage for large files under `.pit/objects`, the large file mode of the `index` engine (see `PITConfig.large_file_threshold`).
+
+Files are split into chunks with content-defined boundaries, so an edit only changes the chunks around it and the rest are shared with earlier versions. Chunks are stored once each, keyed by their sha256, along with a manifest listing the chunks of a file. The snapshot commit only holds a small pointer to the manifest:
+
+```text
+pit-pointer 1
+manifest 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae
+size 734003200
+```
+
+Unchanged files are recognised by their stat information (see `ChunkStore.store_files`), so snapshot time and storage both scale with the changed bytes rather than the file size.
+"""
+import os
+import json
+import stat
+import time
+import zlib
+import hashlib
+from tempfile import mkstemp
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from point_in_time.constants.main import (
+    PIT_CHUNK_MIN_BYTES,
+    PIT_CHUNK_MAX_BYTES,
+    PIT_STAT_CACHE_NAME
+)
+from point_in_time.errors import PITObjectNotFoundError
+from point_in_time.utils.fs import FileLock, atomic_write
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['ChunkStore', 'iter_chunks', 'parse_pointer', 'is_large_file']
+
+logger = get_logger(__name__)
+
+POINTER_HEADER = b'pit-pointer 1\n'
+MANIFEST_HEADER = b'pit-manifest 1\n'
+POINTER_MAX_BYTES = 256
+"""
+Pointers are never larger than this, blobs which are can be skipped without reading them.
+"""
+
+CHUNK_TABLE = b''.join(hashlib.sha256(b'pit-chunk %d' % i).digest() for i in range(8))
+CHUNK_SHIFTS = (9, 18, 36)
+CHUNK_WINDOW = 10
+"""
+Chunk boundaries are found with a rolling hash over every byte, in the style of buzhash: each byte is mapped through the random `CHUNK_TABLE`, then the mapped bytes are mixed with their neighbours by xor-ing shifted copies (`CHUNK_SHIFTS`), giving a hash byte per position of the 9 bytes ending at it. A boundary is placed after two consecutive zero hash bytes, so depends on the `CHUNK_WINDOW` bytes preceding it and moves with insertions and deletions, in binary and text data alike.
+
+Looping over every byte is too slow in python for files of hundreds of MB. Instead the hash of a whole buffer is computed at C speed, by `bytes.translate` and shifts of the buffer as a single integer, and `bytes.find` looks for boundaries in it. Data other than long runs of a single byte averages a chunk every 64KiB past the minimum.
+"""
+
+OBJECT_RAW = b'r'
+OBJECT_ZLIB = b'z'
+"""
+Stored objects start with a byte marking whether the rest is zlib compressed, incompressible chunks are stored raw.
+"""
+
+RACY_NS = 2_000_000_000
+"""
+Files modified this recently could be modified again without changing their mtime, their stat information is not cached.
+"""
+
+def _rolling_hash(data: bytes) -> bytes:
+    """
+    Returns:
+        bytes: The hash byte of each position of `data`, see `CHUNK_WINDOW`. Positions less than `CHUNK_WINDOW` from the start hash fewer bytes.
+    """
+    h = int.from_bytes(data.translate(CHUNK_TABLE), 'little')
+    for shift in CHUNK_SHIFTS:
+        h ^= h << shift
+    return h.to_bytes(len(data) + sum(CHUNK_SHIFTS) // 8 + 1, 'little')[:len(data)]
+
+def _find_cut(hashes: bytes, start: int, min_size: int, max_size: int) -> int:
+    end = min(start + max_size, len(hashes))
+    pos = hashes.find(b'\0\0', start + min_size - 2, end)
+    if pos == -1:
+        return end
+    return pos + 2
+
+def iter_chunks(
+    f: BinaryIO,
+    min_size: int = PIT_CHUNK_MIN_BYTES,
+    max_size: int = PIT_CHUNK_MAX_BYTES,
+    block_size: int = 8*1024*1024
+) -> Iterator[bytes]:
+    """
+    Splits a file into content-defined chunks, reading it in blocks so memory use is independent of the file size.
+
+    Args:
+        f (BinaryIO): The file to split.
+        min_size (int, optional): Minimum size of chunks, except the last.
+        max_size (int, optional): Maximum size of chunks.
+        block_size (int, optional): Size of reads from the file.
+
+    Yields:
+        bytes: The chunks, which concatenated are the file contents.
+    """
+    # Note: Boundaries only depend on bytes of the chunk they end, which is what makes streaming possible
+    assert CHUNK_WINDOW <= min_size <= max_size <= block_size
+
+    buffer = b''
+    hashes = b''
+    start = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - start < max_size:
+            block = f.read(block_size)
+            if len(block) == 0:
+                eof = True
+            else:
+                buffer = buffer[start:] + block
+                hashes = _rolling_hash(buffer)
+                start = 0
+            continue
+
+        if start >= len(buffer):
+            return
+        cut = _find_cut(hashes, start, min_size, max_size)
+        yield buffer[start:cut]
+        start = cut
+
+def format_pointer(manifest: str, size: int) -> bytes:
+    return POINTER_HEADER + f'manifest {manifest}\nsize {size}\n'.encode()
+
+def parse_pointer(data: bytes) -> Optional[Tuple[str, int]]:
+    """
+    Args:
+        data (bytes): Contents of a blob.
+
+    Returns:
+        Optional[Tuple[str, int]]: The manifest id and file size, `None` if the blob is not a pointer.
+    """
+    if not data.startswith(POINTER_HEADER) or len(data) > POINTER_MAX_BYTES:
+        return None
+
+    fields = dict(
+        line.split(' ', 1)
+        for line in data[len(POINTER_HEADER):].decode().splitlines()
+        if ' ' in line
+    )
+    try:
+        return fields['manifest'], int(fields['size'])
+    except (KeyError, ValueError):
+        return None
+
+class ChunkStore:
+    """
+    The content addressed store of chunks and manifests, objects are files named by the sha256 of their content in the same fan out layout as git (`ab/cdef...`).
+
+    Writes are atomic and objects immutable, so any number of processes can store files at once.
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path to the objects directory, created when first written to.
+        """
+        self.path = path
+        self._stat_cache_path = os.path.join(path, PIT_STAT_CACHE_NAME)
+        self._stat_cache_lock_path = self._stat_cache_path + '.lock'
+
+    def _object_path(self, oid: str) -> str:
+        return os.path.join(self.path, oid[:2], oid[2:])
+
+    def has(self, oid: str) -> bool:
+        return os.path.isfile(self._object_path(oid))
+
+    def put(self, data: bytes) -> str:
+        """
+        Args:
+            data (bytes): Contents of the object.
+
+        Returns:
+            str: The id of the object, its sha256.
+        """
+        oid = hashlib.sha256(data).hexdigest()
+        path = self._object_path(oid)
+        if os.path.isfile(path):
+            return oid
+
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            payload = OBJECT_ZLIB + compressed
+        else:
+            payload = OBJECT_RAW + data
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, payload)
+        return oid
+
+    def get(self, oid: str) -> bytes:
+        """
+        Raises:
+            PITObjectNotFoundError: If the object does not exist or its contents do not match its id.
+        """
+        try:
+            with open(self._object_path(oid), 'rb') as f:
+                payload = f.read()
+        except FileNotFoundError:
+            raise PITObjectNotFoundError("Object missing from chunk store: %s" % oid)
+
+        try:
+            if payload[:1] == OBJECT_ZLIB:
+                data = zlib.decompress(payload[1:])
+            else:
+                data = payload[1:]
+        except zlib.error:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != oid:
+            raise PITObjectNotFoundError("Corrupt object in chunk store: %s" % oid)
+        return data
+
+    def _load_stat_cache(self) -> Dict[str, list]:
+        try:
+            with open(self._stat_cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def store_files(self, paths: List[str]) -> Dict[str, bytes]:
+        """
+        Stores files, skipping those whose stat information is unchanged since they were last stored.
+
+        Args:
+            paths (List[str]): Absolute paths of the files.
+
+        Returns:
+            Dict[str, bytes]: The pointer of each file.
+        """
+        cache = self._load_stat_cache()
+        now = time.time_ns()
+
+        pointers = {}
+        updates = {}
+        for path in paths:
+            st = os.stat(path)
+            key = [st.st_size, st.st_mtime_ns, st.st_ino]
+            cached = cache.get(path)
+            if cached is not None and cached[:3] == key and self.has(cached[3]):
+                pointers[path] = format_pointer(cached[3], st.st_size)
+                continue
+
+            manifest = self._store_file(path)
+            pointers[path] = format_pointer(manifest, st.st_size)
+            if now - st.st_mtime_ns > RACY_NS:
+                updates[path] = key + [manifest]
+
+        if len(updates) != 0:
+            # Note: Read again under the lock, so entries other processes stored meanwhile are kept
+            with FileLock(self._stat_cache_lock_path):
+                cache = self._load_stat_cache()
+                cache.update(updates)
+                atomic_write(self._stat_cache_path, json.dumps(cache).encode())
+        return pointers
+
+    def store_file(self, path: str) -> bytes:
+        """
+        Args:
+            path (str): Absolute path of the file.
+
+        Returns:
+            bytes: The pointer of the file.
+        """
+        return self.store_files([path])[path]
+
+    def _store_file(self, path: str) -> str:
+        lines = [MANIFEST_HEADER]
+        stored = 0
+        with open(path, 'rb') as f:
+            for chunk in iter_chunks(f):
+                oid = hashlib.sha256(chunk).hexdigest()
+                if not self.has(oid):
+                    self.put(chunk)
+                    stored += len(chunk)
+                lines.append(f'{oid} {len(chunk)}\n'.encode())
+
+        logger.debug("Stored %s, %d new bytes in chunk store" % (path, stored))
+        return self.put(b''.join(lines))
+
+    def iter_file(self, manifest: str) -> Iterator[bytes]:
+        """
+        Args:
+            manifest (str): Id of the file's manifest.
+
+        Raises:
+            PITObjectNotFoundError: If an object of the file is missing or corrupt.
+
+        Yields:
+            bytes: The chunks of the file.
+        """
+        data = self.get(manifest)
+        if not data.startswith(MANIFEST_HEADER):
+            raise PITObjectNotFoundError("Object is not a manifest: %s" % manifest)
+
+        for line in data[len(MANIFEST_HEADER):].decode().splitlines():
+            oid, _ = line.split(' ')
+            yield self.get(oid)
+
+    def materialize(self, pointer: bytes, dest: str, executable: bool = False):
+        """
+        Writes the file a pointer refers to. The file is written to a temporary file first, so `dest` is never left partially written.
+
+        Args:
+            pointer (bytes): Contents of the pointer.
+            dest (str): Path to write the file to.
+            executable (bool, optional): Mark the file executable, as for git mode `100755`.
+
+        Raises:
+            PITObjectNotFoundError: If the pointer is invalid, or an object of the file is missing or corrupt.
+        """
+        parsed = parse_pointer(pointer)
+        if parsed is None:
+            raise PITObjectNotFoundError("Not a pit pointer: %s" % dest)
+        manifest, size = parsed
+
+        directory = os.path.dirname(dest) or os.curdir
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = mkstemp(dir=directory, prefix='.pit-materialize-')
+        try:
+            written = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self.iter_file(manifest):
+                    f.write(chunk)
+                    written += len(chunk)
+            if written != size:
+                raise PITObjectNotFoundError("Size mismatch materializing %s: %d != %d" % (dest, written, size))
+            # Note: Temporary files are only readable by the owner
+            os.chmod(tmp, 0o755 if executable else 0o644)
+            os.replace(tmp, dest)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+def is_large_file(path: str, threshold: int) -> bool:
+    """
+    Returns:
+        bool: If `path` is a regular file (not a symlink) of at least `threshold` bytes.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_size >= threshold
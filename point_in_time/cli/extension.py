@@ -14,14 +14,23 @@ class MultiCommandGroup(click.Group):
         def decorator(f):
             if isinstance(args[0], list):
                 _args = [args[0][0]] + list(args[1:])
-                for alias in args[0][1:]:
-                    cmd = super(MultiCommandGroup, self).command(
-                        alias, *args[1:], **kwargs)(f)
-                    cmd.short_help = "Alias for '{}'".format(_args[0])
+                aliases = args[0][1:]
             else:
                 _args = args
+                aliases = []
             cmd = super(MultiCommandGroup, self).command(
                 *_args, **kwargs)(f)
+
+            # Note: Aliases share the parameters of the primary command, decorating `f` again would find its click parameters already consumed.
+            for alias in aliases:
+                alias_cmd = click.Command(
+                    alias,
+                    callback=cmd.callback,
+                    params=cmd.params,
+                    help=cmd.help,
+                    short_help="Alias for '{}'".format(_args[0])
+                )
+                self.add_command(alias_cmd)
             return cmd
 
         return decorator
\ No newline at end of file
@@ -1,38 +1,42 @@
 import os
 import sys
+import time
 import socket
 import getpass
 import logging
-from functools import reduce
-from typing import List, Tuple, Union
 
 import click
 
-from point_in_time.repo import PITRepo
+from point_in_time.constants.main import (
+    PIT_DAEMON_START_TIMEOUT,
+    PIT_SNAPSHOT_ENGINES
+)
 from point_in_time.constants.return_codes import *
 from point_in_time.errors import (
     PITRepoExistsError,
     PITInternalError,
     PITStashFailedError,
     PITStashPopFailedError,
-    PITCommitParseFailed
-)
-from point_in_time.utils.main import (
-    get_pit_path,
-    is_pit_path_ignored,
-    status_filter_pathspec
-)
-from point_in_time.utils.git import (
-    git_show_toplevel
+    PITSnapshotFailedError,
+    PITSizeBudgetError,
+    PITCommitParseFailed,
+    PITIdNotFoundError,
+    PITDaemonError,
+    PITMaterializeError,
+    PITConfigLoadError,
+    PITQueryError
 )
+from point_in_time.utils.context import RepoContext
 from point_in_time.utils.logging import (
     get_logger,
     set_cli_level,
 )
 from point_in_time.cli.util import *
+from point_in_time.daemon import daemon_request, daemon_socket_path, spawn_daemon
 
 from .extension import MultiCommandGroup
 
+# IMPORT NOTE: Modules depending on pydantic, colorama, pathspec etc. (`point_in_time.repo` and anything importing it) are imported inside the commands which use them. This keeps `pit --help` and commands served by the daemon fast, see `tests/cli/test_startup.py`.
 
 logger = get_logger(__name__, cli=True)
 
@@ -42,7 +46,6 @@ def pit(verbose: int):
     """
     Lightweight tooling for tracking experiment state in git based repositories.
     """
-    print("Log level: ", verbose)
     set_cli_level(verbose)
 
 @pit.command('init')
@@ -55,18 +58,22 @@ def init(directory: str, no_ignore: bool):
     if directory is None:
         directory = os.curdir
 
-    result_git_check = cli_check_git_repo()
+    try:
+        context = RepoContext.current(directory)
+    except NotADirectoryError:
+        logger.error("Path specified is not a directory: %s" % directory)
+        sys.exit(PIT_CODE_INIT_FAILED)
+
+    result_git_check = cli_check_git_repo(context)
     if result_git_check != 0:
         sys.exit(result_git_check)
 
+    from point_in_time.repo import PITRepo
+
     try:
-        pit_path = get_pit_path(directory)
-        r = PITRepo.create_repo(pit_path)
-    except (PITRepoExistsError, PITInternalError, NotADirectoryError) as err:
-        if isinstance(err, NotADirectoryError):
-            logger.error("Path specified is not a directory: %s" % directory)
-        else:
-            logger.error(err.msg)
+        r = PITRepo.create_repo(context.pit_path)
+    except (PITRepoExistsError, PITInternalError) as err:
+        logger.error(err.msg)
 
         if isinstance(err, PITRepoExistsError):
             sys.exit(PIT_CODE_REPO_EXISTS)
@@ -74,85 +81,327 @@ def init(directory: str, no_ignore: bool):
 
     logger.info('Initialized empty Pit repository in %s' % r._path)
 
-    if not no_ignore and not is_pit_path_ignored():
-        ignore_path = os.path.join(git_show_toplevel(), '.gitignore')
+    if not no_ignore and not context.is_pit_path_ignored:
+        ignore_path = os.path.join(context.toplevel, '.gitignore')
         logger.debug("Adding .pit to %s" % ignore_path)
         with open(ignore_path, 'a') as f:
             f.write('\n# Pit repo directory')
             f.write('\n.pit/')
+        context.invalidate_ignored()
 
     # Run standard checks
-    result_checks = cli_check_standard()
+    result_checks = cli_check_standard(context)
     if result_checks != 0:
         sys.exit(result_checks)
 
 @pit.command('status')
 def status():
+    cli_daemon_forward('status')
+
     # Run standard checks
     result_checks = cli_check_standard()
     if result_checks != 0:
         sys.exit(result_checks)
 
+    from point_in_time.cli.render import render_status
+
     repo = cli_load_pit_repo()
-    status = repo.get_snapshot_paths_status(cli=True)
-    print('\n'.join(status))
+    try:
+        for output in render_status(repo):
+            print(output)
+    except PITConfigLoadError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_REPO_LOAD_FAILED)
 
 @pit.command('show')
 @click.argument('id')
 @click.option('--verbose', is_flag=True, help="Displays more details.")
 def show(id: str, verbose: bool):
+    cli_daemon_forward('show', id=id, verbose=verbose)
+
     # Run standard checks
     result_checks = cli_check_standard()
     if result_checks != 0:
         sys.exit(result_checks)
 
+    from point_in_time.cli.render import render_show
+
     repo = cli_load_pit_repo()
-    log = repo._load_log()
+    try:
+        for output in render_show(repo, id, verbose):
+            print(output)
+    except PITIdNotFoundError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_ID_NOT_FOUND)
+
+@pit.command('log')
+@click.option('--limit', required=False, default=50, help="Set the limit of number of logs displayed")
+@click.option('--offset', required=False, default=0, help="Skip this many of the newest logs, e.g. to show the next page")
+@click.option('--pager/--no-pager', default=True, help="Page output when writing to a terminal")
+def log(limit: int, offset: int, pager: bool):
+    """
+    Lists snapshots, newest first.
+    """
+    cli_daemon_forward('log', pager=pager, limit=limit, offset=offset)
+
+    # Run standard checks
+    result_checks = cli_check_standard()
+    if result_checks != 0:
+        sys.exit(result_checks)
 
-    if id not in log:
+    from point_in_time.cli.render import render_log
+
+    repo = cli_load_pit_repo()
+    cli_echo(render_log(repo, limit, offset), pager=pager)
+
+@pit.command('query')
+@click.argument('filters', nargs=-1)
+@click.option('--sort', default=None, help="Field to sort by, e.g. date or metadata.loss. Defaults to the order of the log.")
+@click.option('--asc', is_flag=True, help="Sort in ascending order, by default the newest or largest are first.")
+@click.option('--limit', required=False, default=50, help="Set the limit of number of snapshots displayed")
+@click.option('--offset', required=False, default=0, help="Skip this many matching snapshots")
+@click.option('--ids', is_flag=True, help="Only print the pit ids.")
+@click.option('--pager/--no-pager', default=True, help="Page output when writing to a terminal")
+def query(filters: tuple, sort: str, asc: bool, limit: int, offset: int, ids: bool, pager: bool):
+    """
+    Lists snapshots matching all FILTERS, written <field><op><value>.
+
+    Fields are pit_id, hash, date, origin, file, host, user and metadata.<key>. Operators are =, !=, <, <=, >, >= and ~ (glob match). For example:
+
+    \b
+        pit query 'metadata.lr>1e-3' host=gpu-01 date>=2024-03-01
+        pit query 'file~src/*.py' --sort metadata.loss --asc
+    """
+    # Run standard checks
+    result_checks = cli_check_standard()
+    if result_checks != 0:
+        sys.exit(result_checks)
+
+    from point_in_time.cli.render import render_query
+
+    repo = cli_load_pit_repo()
+    try:
+        output = render_query(
+            repo,
+            list(filters),
+            sort=sort,
+            ascending=asc,
+            limit=limit,
+            offset=offset,
+            ids_only=ids
+        )
+    except PITQueryError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_QUERY_INVALID)
+    cli_echo(output, pager=pager)
+
+@pit.command('compare')
+@click.argument('filters', nargs=-1)
+@click.option('-c', '--column', 'columns', multiple=True, help="Field to show, may be repeated. Defaults to the fields any listed snapshot has a value for.")
+@click.option('--group-by', default=None, help="Show one row per value of this field, with the count of snapshots and the mean of numeric fields.")
+@click.option('--sort', default=None, help="Field to sort by, e.g. metadata.loss. Defaults to the order of the log.")
+@click.option('--asc', is_flag=True, help="Sort in ascending order, by default the newest or largest are first.")
+@click.option('--limit', required=False, default=50, help="Set the limit of number of rows displayed")
+@click.option('--offset', required=False, default=0, help="Skip this many rows")
+@click.option('--pager/--no-pager', default=True, help="Page output when writing to a terminal")
+def compare(filters: tuple, columns: tuple, group_by: str, sort: str, asc: bool, limit: int, offset: int, pager: bool):
+    """
+    Tabulates the metadata of snapshots matching all FILTERS, see `pit query` for their syntax. Only pit_id, hash and metadata fields are available. For example:
+
+    \b
+        pit compare 'metadata.lr<1e-2' --sort metadata.loss --asc -c metadata.lr -c metadata.loss
+        pit compare --group-by metadata.opt.name -c metadata.loss
+    """
+    # Run standard checks
+    result_checks = cli_check_standard()
+    if result_checks != 0:
+        sys.exit(result_checks)
+
+    from point_in_time.cli.render import render_compare
+
+    repo = cli_load_pit_repo()
+    try:
+        output = render_compare(
+            repo,
+            list(filters),
+            columns=list(columns),
+            sort=sort,
+            ascending=asc,
+            limit=limit,
+            offset=offset,
+            group_by=group_by
+        )
+    except PITQueryError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_QUERY_INVALID)
+    cli_echo(output, pager=pager)
+
+@pit.command('materialize')
+@click.argument('id')
+@click.argument('paths', nargs=-1)
+@click.option('-o', '--output', default=None, help="Directory to write files to, defaults to the repository root.")
+@click.option('-f', '--force', is_flag=True, help="Overwrite existing files.")
+def materialize(id: str, paths: tuple, output: str, force: bool):
+    """
+    Writes the large files of a snapshot back out of the chunk store, optionally only those under PATHS.
+    """
+    # Run standard checks
+    result_checks = cli_check_standard()
+    if result_checks != 0:
+        sys.exit(result_checks)
+
+    repo = cli_load_pit_repo()
+    e = repo.get_entry(id)
+    if e is None:
         logger.error("Specified Pit id does not exist in log.")
         sys.exit(PIT_CODE_ID_NOT_FOUND)
 
-    details = repo.get_details(log[id])
+    # Note: Paths are given relative to the working directory, but the snapshot's paths are relative to the root
+    pathspecs = None
+    if len(paths) != 0:
+        pathspecs = [os.path.relpath(os.path.abspath(p), repo._toplevel) for p in paths]
+    if output is not None:
+        output = os.path.abspath(output)
+
+    try:
+        written = repo.materialize(
+            e,
+            paths=pathspecs,
+            output_dir=output,
+            overwrite=force
+        )
+    except PITMaterializeError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_MATERIALIZE_FAILED)
+
+    if len(written) == 0:
+        logger.info("No large files to materialize.")
+    for p in written:
+        logger.info("Materialized %s" % p)
 
-    print(details.format(cli=True, verbose=verbose))
+@pit.group('daemon')
+def daemon():
+    """
+    Manage the background process which serves status, log and show for this repository with warm in-memory state.
+    """
+    pass
 
-@pit.command('log')
-@click.option('--limit', required=False, default=50, help="Set the limit of number of logs displayed")
-def log(limit: int):
+@daemon.command('start')
+@click.option('--foreground', is_flag=True, help="Run the daemon in this process instead of in the background.")
+def daemon_start(foreground: bool):
+    """
+    Starts the daemon for this repository.
+    """
     # Run standard checks
     result_checks = cli_check_standard()
     if result_checks != 0:
         sys.exit(result_checks)
 
     repo = cli_load_pit_repo()
-    log = repo._load_log()
+    if daemon_request(repo._path, 'ping', timeout=1) is not None:
+        logger.error("A pit daemon is already running for this repository.")
+        sys.exit(PIT_CODE_DAEMON_RUNNING)
+
+    try:
+        if foreground:
+            from point_in_time.daemon.server import PITDaemon
+            PITDaemon(repo._path).serve_forever()
+        else:
+            response = spawn_daemon(repo._path)
+            logger.info("Started pit daemon (pid %d)" % response['pid'])
+    except PITDaemonError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_DAEMON_START_FAILED)
+
+@daemon.command('stop')
+def daemon_stop():
+    """
+    Stops the daemon for this repository.
+    """
+    repo = cli_load_pit_repo()
+    response = daemon_request(repo._path, 'shutdown', timeout=PIT_DAEMON_START_TIMEOUT)
+    if response is None:
+        logger.error("No pit daemon is running for this repository.")
+        sys.exit(PIT_CODE_DAEMON_NOT_RUNNING)
 
-    keys = list(log.keys())[:limit]
-    keys.reverse()
-    for id in keys:
-        details = repo.get_details(log[id])
-        print(details.format(cli=True, verbose=False))
-        print()
+    # Wait for the socket to be removed so following commands do not attempt to use it
+    socket_path = daemon_socket_path(repo._path)
+    deadline = time.monotonic() + PIT_DAEMON_START_TIMEOUT
+    while os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
 
+    logger.info("Stopped pit daemon (pid %d)" % response['pid'])
 
+@daemon.command('status')
+def daemon_status():
+    """
+    Reports if the daemon for this repository is running.
+    """
+    repo = cli_load_pit_repo()
+    response = daemon_request(repo._path, 'ping', timeout=1)
+    if response is None:
+        logger.info("No pit daemon is running for this repository.")
+        sys.exit(PIT_CODE_DAEMON_NOT_RUNNING)
+
+    logger.info("Pit daemon running (pid %d)" % response['pid'])
 
 @pit.command(['snapshot', 'snap'])
 @click.option('--no-untracked', is_flag=True, help="Disables inclusion of '.pit' directory in git ignore")
 @click.option('--no-metadata', is_flag=True, help="Disable recording of metadata such as user and hostname")
 @click.option('-y', '--yes', is_flag=True, help="Skip the acceptance prompt")
+@click.option(
+    '--engine',
+    type=click.Choice(PIT_SNAPSHOT_ENGINES),
+    default='stash',
+    show_default=True,
+    help="Snapshot engine. 'index' builds the snapshot with a private git index and never modifies the worktree or stash."
+)
+@click.option('--dedup', is_flag=True, help="Record an alias of an existing snapshot with the same contents instead of a new commit. Always on for the 'index' engine, with 'stash' it costs hashing the included files before stashing them. Implied by --if-changed.")
+@click.option('--if-changed', is_flag=True, help="Skip the snapshot if nothing included changed since the last one. Untracked files count as included, so it can not be combined with --no-untracked.")
+@click.option('--timings', is_flag=True, help="Report the time spent in each phase of the snapshot")
+@click.option('--ignore-budget', is_flag=True, help="Snapshot even if the included files exceed the size budgets of the pit config")
 def snapshot(
     no_untracked: bool,
     no_metadata: bool,
-    yes: bool
+    yes: bool,
+    engine: str,
+    dedup: bool,
+    if_changed: bool,
+    timings: bool,
+    ignore_budget: bool
 ):
+    if if_changed and no_untracked:
+        # Note: The worktree cache can not tell untracked files from those added since, so changes always include them
+        raise click.UsageError("--if-changed can not be combined with --no-untracked")
+
     # Run standard checks
     result_checks = cli_check_standard()
     if result_checks != 0:
         sys.exit(result_checks)
 
+    from point_in_time.utils.main import flatten_status_paths
+    from point_in_time.utils.timing import PhaseTimer
+    from point_in_time.repo import SpeculativeSnapshot
+
     repo = cli_load_pit_repo()
-    paths = repo.get_snapshot_paths()
+    if if_changed:
+        # Note: Changes are found by the tree of the last snapshot, which stash snapshots only record with dedup
+        dedup = True
+
+        # Note: Usually answered from the worktree cache, without scanning the worktree with git
+        latest = next(repo.iter_log(limit=1), None)
+        try:
+            unchanged = latest is not None and not repo.is_dirty_since(latest.pit_id)
+        except PITConfigLoadError as err:
+            logger.error(err.msg)
+            sys.exit(PIT_CODE_REPO_LOAD_FAILED)
+        if unchanged:
+            logger.info(f"No changes since snapshot: {latest.pit_id}")
+            return
+
+    # Note: Without the prompt only included paths are needed, so git can skip the rest of the worktree
+    git_status = repo.get_status(scoped=yes)
+    paths = repo.get_snapshot_paths(git_status)
 
     if no_untracked and '??' in paths:
         del paths['??']
@@ -165,38 +414,83 @@ def snapshot(
             'hostname': socket.gethostname()
         }
 
-    if not yes:
-        status = repo.get_snapshot_paths_status(paths, cli=True)
-        print('\n'.join(status))
-
-        r = input('Create snapshot with the contents above [Y/n]: ')
-        if r.lower() not in ('', 'yes', 'y'):
-            logger.error('Snapshot aborted.')
-            sys.exit(PIT_CODE_SNAPSHOT_ABORTED)
-
     # Flatten paths
-    def flatten_pathspec(a: List[str], b: List[Union[str, Tuple[str]]]):
-        if isinstance(b[0], tuple):
-            for t in b:
-                a += t
-        else:
-            a += b
-        return a
-    flattened = reduce(
-        flatten_pathspec,
-        paths.values(),
-        []
+    flattened = flatten_status_paths(
+        paths,
+        codes=[c for c in paths.keys() if c != '!!']
     )
+    force_paths = flatten_status_paths(paths, codes=['!!'])
 
     logger.debug('Creating snapshots with following paths:')
-    for p in flattened:
+    for p in flattened + force_paths:
         logger.debug("\t'%s'" % p)
 
+    timer = PhaseTimer()
+    speculative = None
+    if not yes:
+        # Note: Sizes are shown with the status, and the budgets enforced before anything is written
+        try:
+            with timer.phase('budget'):
+                report = repo.get_size_report(flattened, force_paths)
+        except PITConfigLoadError as err:
+            logger.error(err.msg)
+            sys.exit(PIT_CODE_REPO_LOAD_FAILED)
+        if not ignore_budget:
+            try:
+                report.check()
+            except PITSizeBudgetError as err:
+                print('\n'.join(report.format(cli=True)))
+                logger.error(err.msg)
+                sys.exit(PIT_CODE_SIZE_BUDGET_EXCEEDED)
+
+        # Note: Prepared while the user reads the prompt, checked for changes made meanwhile once confirmed. Stash snapshots without dedup have nothing to prepare.
+        if repo.prepares_tree(engine, dedup or None):
+            speculative = SpeculativeSnapshot(
+                repo,
+                flattened,
+                force_paths,
+                engine=engine,
+                dedup=dedup or None,
+                timer=timer,
+                check_budget=False
+            )
+        try:
+            status = repo.get_snapshot_paths_status(
+                paths,
+                cli=True,
+                git_status=git_status
+            )
+            print('\n'.join(status))
+            print('\n'.join(report.format(cli=True)))
+
+            r = input('Create snapshot with the contents above [Y/n]: ')
+        except BaseException:
+            if speculative is not None:
+                speculative.discard()
+            raise
+        if r.lower() not in ('', 'yes', 'y'):
+            if speculative is not None:
+                speculative.discard()
+            logger.error('Snapshot aborted.')
+            sys.exit(PIT_CODE_SNAPSHOT_ABORTED)
+
     try:
-        s = repo.snapshot(
-            paths=flattened,
-            metadata=metadata
-        )
+        if speculative is not None:
+            s = speculative.commit(metadata)
+        else:
+            s = repo.snapshot(
+                paths=flattened,
+                metadata=metadata,
+                force_paths=force_paths,
+                engine=engine,
+                dedup=dedup or None,
+                timer=timer,
+                # Note: Already checked with the prompt
+                check_budget=yes and not ignore_budget
+            )
+    except PITSizeBudgetError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_SIZE_BUDGET_EXCEEDED)
     except PITStashFailedError as err:
         logger.error('Git stash failed: \n%s', err.msg)
         sys.exit(PIT_CODE_STASH_PUSH_FAILED)
@@ -206,5 +500,13 @@ def snapshot(
     except PITCommitParseFailed as err:
         logger.error('Failed to parse commit hash: %s', err.msg)
         sys.exit(PIT_CODE_COMMIT_PARSE_FAILED)
-
-    logger.info(f"Created new snapshot: {s.pit_id}")
\ No newline at end of file
+    except PITSnapshotFailedError as err:
+        logger.error('Failed to build snapshot: \n%s', err.msg)
+        sys.exit(PIT_CODE_SNAPSHOT_FAILED)
+    except PITConfigLoadError as err:
+        logger.error(err.msg)
+        sys.exit(PIT_CODE_REPO_LOAD_FAILED)
+
+    logger.info(f"Created new snapshot: {s.pit_id}")
+    if timings:
+        logger.info(f"Snapshot timings: {timer.format()}")
\ No newline at end of file
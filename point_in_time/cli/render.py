@@ -0,0 +1,153 @@
+"""
+Output of the read only commands. These are shared by the CLI and the daemon so both produce identical output, each yielded item is one `print(...)` of the command.
+"""
+import itertools
+from typing import Any, Iterator, List, Optional
+
+from point_in_time.constants.main import PIT_LOG_DETAILS_BATCH
+from point_in_time.repo import PITRepo, PITLogEntry
+from point_in_time.errors import PITIdNotFoundError
+from point_in_time.query_index import PITQueryIndex, QueryFilter
+from point_in_time.utils.main import flatten_status_paths
+
+def render_status(repo: PITRepo) -> Iterator[str]:
+    git_status = repo.get_status()
+    paths = repo.get_snapshot_paths(git_status)
+    status = repo.get_snapshot_paths_status(paths, cli=True, git_status=git_status)
+    yield '\n'.join(status)
+
+    report = repo.get_size_report(
+        flatten_status_paths(paths, codes=[c for c in paths.keys() if c != '!!']),
+        flatten_status_paths(paths, codes=['!!'])
+    )
+    yield '\n'.join(report.format(cli=True))
+
+def render_show(repo: PITRepo, id: str, verbose: bool) -> Iterator[str]:
+    """
+    Raises:
+        PITIdNotFoundError: If the id does not exist in the log.
+    """
+    e = repo.get_entry(id)
+
+    if e is None:
+        raise PITIdNotFoundError("Specified Pit id does not exist in log.")
+
+    details = repo.get_details(e)
+
+    yield details.format(cli=True, verbose=verbose)
+
+def render_entries(repo: PITRepo, entries: Iterator[PITLogEntry]) -> Iterator[str]:
+    """
+    Entries are read and their details resolved in batches, so output starts before all entries are read.
+    """
+    try:
+        while True:
+            batch = list(itertools.islice(entries, PIT_LOG_DETAILS_BATCH))
+            if len(batch) == 0:
+                return
+            for details in repo.iter_details(batch):
+                yield details.format(cli=True, verbose=False)
+                yield ''
+    finally:
+        entries.close()
+
+def render_log(repo: PITRepo, limit: Optional[int], offset: int = 0) -> Iterator[str]:
+    """
+    Newest entries first.
+    """
+    return render_entries(repo, repo.iter_log(offset=offset, limit=limit))
+
+def render_query(
+    repo: PITRepo,
+    filters: List[str],
+    sort: Optional[str] = None,
+    ascending: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    ids_only: bool = False
+) -> Iterator[str]:
+    """
+    The query runs when called, so errors are raised before any output.
+
+    Raises:
+        PITQueryError: If a filter or the sort field is invalid.
+    """
+    parsed = [QueryFilter.parse(f) for f in filters]
+    index = PITQueryIndex(repo)
+    index.sync()
+    pit_ids = index.query(parsed, sort=sort, ascending=ascending, limit=limit, offset=offset)
+
+    if ids_only:
+        return iter(pit_ids)
+    return render_entries(repo, (repo.get_entry(pit_id) for pit_id in pit_ids))
+
+def format_cell(value: Any) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        return '%.6g' % value
+    return str(value)
+
+def format_table(header: List[str], rows: List[List[Any]]) -> Iterator[str]:
+    cells = [[format_cell(v) for v in row] for row in rows]
+    widths = [max([len(h)] + [len(row[i]) for row in cells]) for i, h in enumerate(header)]
+    for row in [header] + cells:
+        yield '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+
+def render_compare(
+    repo: PITRepo,
+    filters: List[str],
+    columns: Optional[List[str]] = None,
+    sort: Optional[str] = None,
+    ascending: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    group_by: Optional[str] = None
+) -> Iterator[str]:
+    """
+    A table of snapshots and their metadata, one row per snapshot or, with `group_by`, one row per value of that field with the count of snapshots and the mean of numeric columns. By default the columns are those with a value for any of the rows.
+
+    The comparison runs when called, so errors are raised before any output.
+
+    Raises:
+        PITQueryError: If a filter, column or the sort field is invalid.
+    """
+    table = repo.get_metadata_table()
+    parsed = [QueryFilter.parse(f) for f in filters]
+
+    if group_by is None:
+        rows = table.select(parsed, sort=sort, ascending=ascending, limit=limit, offset=offset)
+        names = ['pit_id'] + (list(columns) if columns else [n for n in table.columns if n != 'pit_id'])
+        taken = table.take(rows, names)
+        if not columns:
+            taken = {n: c for n, c in taken.items() if n == 'pit_id' or len(c.present(range(len(c)))) != 0}
+
+        header = [n[len('metadata.'):] if n.startswith('metadata.') else n for n in taken]
+        body = [[c.get(i) for c in taken.values()] for i in range(len(rows))]
+        return format_table(header, body)
+
+    rows = table.select(parsed, sort=sort, ascending=ascending)
+    groups = list(table.group(rows, group_by).items())
+    groups = groups[offset:None if limit is None else offset + limit]
+    if columns:
+        selected = [table.column(n) for n in columns]
+        numeric = [c for c in selected if c is not None and c.kind == 'number']
+    else:
+        numeric = [table.column(n) for n, c in table.columns.items() if n.startswith('metadata.') and c.kind == 'number']
+
+    header = [group_by, 'count']
+    body = [[value, len(group)] for value, group in groups]
+    for column in numeric:
+        header.append('mean(%s)' % column.name[len('metadata.'):])
+        for row, (_, group) in zip(body, groups):
+            present = column.present(group)
+            row.append(sum(column.values[i] for i in present) / len(present) if len(present) != 0 else None)
+
+    if not columns:
+        # Note: Drop the numeric columns no selected snapshot has a value for
+        keep = [i for i in range(len(header)) if i < 2 or any(row[i] is not None for row in body)]
+        header = [header[i] for i in keep]
+        body = [[row[i] for i in keep] for row in body]
+    return format_table(header, body)
@@ -1,31 +1,39 @@
+from __future__ import annotations
 import os
 import sys
+from typing import Iterable, Optional, TYPE_CHECKING
 
-from point_in_time.utils.main import (
-    is_pit_path_ignored,
-    get_pit_path
-)
-from point_in_time.utils.git import (
-    git_is_command,
-    git_is_inside_working_tree,
-)
+import click
+
+from point_in_time.utils.context import RepoContext
 from point_in_time.utils.logging import get_logger
+from point_in_time.daemon import daemon_request
 
 from point_in_time.errors import PITRepoLoadError
-from point_in_time.repo import PITRepo
+from point_in_time.constants.main import PIT_NO_DAEMON_ENV
 from point_in_time.constants.strings import WARN_PIT_NOT_IGNORED
 from point_in_time.constants.return_codes import *
 
+if TYPE_CHECKING:
+    from point_in_time.repo import PITRepo
+
 logger = get_logger(__name__, cli=True)
 
-def cli_load_pit_repo() -> PITRepo:
+def cli_load_pit_repo(context: Optional[RepoContext] = None) -> PITRepo:
     """
     Utility for loading pit repos or detecting failure and exiting with the proper error code
 
+    Args:
+        context (Optional[RepoContext], optional): The repository, defaults to that of the current working directory.
+
     Returns:
         PITRepo: The loaded Pit repo
     """
-    pit_path = get_pit_path()
+    from point_in_time.repo import PITRepo
+
+    if context is None:
+        context = RepoContext.current()
+    pit_path = context.pit_path
 
     if not os.path.isdir(pit_path):
         logger.error("Could not find .pit repo next to .git, are you in a Pit repository?")
@@ -39,34 +47,94 @@ def cli_load_pit_repo() -> PITRepo:
 
     return repo
 
-def cli_check_git_repo() -> int:
+def cli_check_git_repo(context: Optional[RepoContext] = None) -> int:
     """
     Preform standard checks on git repo.
 
+    Args:
+        context (Optional[RepoContext], optional): The repository, defaults to that of the current working directory.
+
     Returns:
         int: Return code, zero if passed
     """
-    if not git_is_command():
+    if context is None:
+        context = RepoContext.current()
+
+    if not context.git_available:
         logger.error("Unable to find git cli, which Pit depends on, please make sure git is installed and accessible to Pit's python interpreter." )
         return PIT_CODE_GIT_NOT_FOUND
-    if not git_is_inside_working_tree():
+    if not context.is_inside_working_tree:
         logger.error("Not a git repository (or any of the parent directories), pit is only accessible within .git repositories")
         return PIT_CODE_GIT_NO_REPO
     return 0
 
 
-def cli_check_standard() -> int:
+def cli_check_standard(context: Optional[RepoContext] = None) -> int:
     """
     Preform standard CLI checks.
 
+    Args:
+        context (Optional[RepoContext], optional): The repository, defaults to that of the current working directory.
+
     Returns:
         int: Return code, zero if passed
     """
-    git_checks = cli_check_git_repo()
+    if context is None:
+        context = RepoContext.current()
+
+    git_checks = cli_check_git_repo(context)
     if git_checks != 0:
         return git_checks
 
-    if not is_pit_path_ignored():
+    if not context.is_pit_path_ignored:
         logger.warn(WARN_PIT_NOT_IGNORED)
 
-    return 0
\ No newline at end of file
+    return 0
+
+def cli_echo(lines: Iterable[str], pager: bool = False):
+    """
+    Writes output line by line as it is produced.
+
+    Args:
+        lines (Iterable[str]): The lines, without trailing newlines.
+        pager (bool, optional): Write through the user's pager (see `click.echo_via_pager`) when stdout is a terminal. Lines are streamed to the pager, so the first page shows before all lines are produced.
+    """
+    if pager and sys.stdout.isatty():
+        click.echo_via_pager(line + '\n' for line in lines)
+        return
+
+    for line in lines:
+        print(line)
+
+def cli_daemon_forward(command: str, pager: bool = False, **args):
+    """
+    Runs a command through the repo's daemon when one is running. If the daemon served the command its output is written and the process exits with the command's return code, otherwise this returns and the caller should run the command itself.
+
+    Setting the `PIT_NO_DAEMON` environment variable disables forwarding.
+
+    Args:
+        command (str): The command to run.
+        pager (bool, optional): Write the output through a pager, see `cli_echo(...)`.
+        **args: Arguments of the command.
+    """
+    if os.environ.get(PIT_NO_DAEMON_ENV):
+        return
+
+    context = RepoContext.current()
+    if not context.is_inside_working_tree:
+        return
+
+    response = daemon_request(context.pit_path, command, **args)
+    if response is None:
+        return
+
+    for warning in response['warnings']:
+        logger.warning(warning)
+    if pager and sys.stdout.isatty():
+        click.echo_via_pager(response['output'])
+    else:
+        sys.stdout.write(response['output'])
+        sys.stdout.flush()
+    for error in response['errors']:
+        logger.error(error)
+    sys.exit(response['code'])
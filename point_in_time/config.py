@@ -0,0 +1,62 @@
+"""
+The optional `.pit/config.json`, settings which are not given on the command line. A missing file uses the defaults, e.g. opting into the large file mode:
+
+```json
+{
+    "large_file_threshold": 52428800
+}
+```
+"""
+import os
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+from pydantic_core import ValidationError
+
+from point_in_time.errors import PITConfigLoadError
+
+__all__ = ['PITConfig', 'load_config']
+
+class PITConfig(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    large_file_threshold: Optional[int] = None
+    """
+    Files of at least this many bytes are stored in the chunk store (`.pit/objects`) and snapshot as a small pointer, see `point_in_time.chunk_store`. `None` disables the large file mode. Only applies to the `index` engine.
+    """
+
+    hash_workers: Optional[int] = Field(default=None, ge=1)
+    """
+    The most git processes hashing the files of an `index` engine snapshot at once, see `point_in_time.blob_hasher`. `None` uses one per CPU, `1` hashes every file with a single `git add`.
+    """
+
+    max_file_bytes: Optional[int] = Field(default=None, ge=0)
+    """
+    Snapshots including a file of more than this many bytes fail before anything is written, see `point_in_time.size_report`. `None` disables the budget.
+    """
+
+    max_snapshot_bytes: Optional[int] = Field(default=None, ge=0)
+    """
+    Snapshots whose included files total more than this many bytes fail before anything is written. `None` disables the budget.
+    """
+
+def load_config(path: str) -> PITConfig:
+    """
+    Args:
+        path (str): Path to the config file.
+
+    Raises:
+        PITConfigLoadError: If the config file is not valid.
+
+    Returns:
+        PITConfig: The loaded config, the defaults if the file does not exist.
+    """
+    if not os.path.isfile(path):
+        return PITConfig()
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return PITConfig.model_validate_json(data)
+    except ValidationError as err:
+        raise PITConfigLoadError("Malformed pit config: %s" % str(err))
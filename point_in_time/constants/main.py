@@ -1,3 +1,34 @@
 PIT_DIR_NAME='.pit'
 PIT_LOG_NAME='log.json'
-PIT_INCLUDE_NAME='include.txt'
\ No newline at end of file
+PIT_LOG_DIR_NAME='log'
+PIT_INCLUDE_NAME='include.txt'
+
+PIT_LOG_SEGMENT_MAX_BYTES=4*1024*1024
+PIT_LOG_REVERSE_BLOCK_BYTES=64*1024
+PIT_LOG_DETAILS_BATCH=64
+
+PIT_DETAILS_CACHE_NAME='details.cache'
+PIT_DETAILS_CACHE_MAX_BYTES=8*1024*1024
+
+PIT_INCLUDE_CACHE_NAME='include.cache'
+
+PIT_QUERY_INDEX_NAME='query.sqlite'
+PIT_METADATA_CACHE_NAME='metadata.cache'
+PIT_WORKTREE_CACHE_NAME='worktree.cache'
+
+PIT_DAEMON_SOCKET_NAME='daemon.sock'
+PIT_DAEMON_LOG_NAME='daemon.log'
+PIT_DAEMON_TIMEOUT=60
+PIT_DAEMON_START_TIMEOUT=10
+PIT_NO_DAEMON_ENV='PIT_NO_DAEMON'
+
+PIT_SNAPSHOT_ENGINES=('stash', 'index')
+
+PIT_ASYNC_MAX_GIT_PROCESSES=8
+
+PIT_CONFIG_NAME='config.json'
+
+PIT_OBJECTS_DIR_NAME='objects'
+PIT_STAT_CACHE_NAME='stat.cache'
+PIT_CHUNK_MIN_BYTES=16*1024
+PIT_CHUNK_MAX_BYTES=256*1024
@@ -12,5 +12,15 @@ PIT_CODE_SNAPSHOT_ABORTED=30
 PIT_CODE_STASH_PUSH_FAILED=31
 PIT_CODE_STASH_POP_FAILED=32
 PIT_CODE_COMMIT_PARSE_FAILED=33
+PIT_CODE_SNAPSHOT_FAILED=34
+PIT_CODE_SIZE_BUDGET_EXCEEDED=35
 
-PIT_CODE_ID_NOT_FOUND=40
\ No newline at end of file
+PIT_CODE_ID_NOT_FOUND=40
+
+PIT_CODE_DAEMON_START_FAILED=50
+PIT_CODE_DAEMON_NOT_RUNNING=51
+PIT_CODE_DAEMON_RUNNING=52
+
+PIT_CODE_MATERIALIZE_FAILED=60
+
+PIT_CODE_QUERY_INVALID=70
@@ -0,0 +1,152 @@
+"""
+Client side of the pit daemon, a per-repo background process serving the read only commands over a Unix domain socket.
+
+This module is imported by every CLI invocation so it only depends on the standard library.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import tempfile
+import subprocess
+from typing import Any, Dict, Optional
+
+from point_in_time.constants.main import (
+    PIT_DAEMON_SOCKET_NAME,
+    PIT_DAEMON_LOG_NAME,
+    PIT_DAEMON_TIMEOUT,
+    PIT_DAEMON_START_TIMEOUT
+)
+from point_in_time.errors import PITDaemonError
+from point_in_time.utils.logging import get_logger
+
+__all__ = [
+    'daemon_socket_path',
+    'daemon_request',
+    'spawn_daemon',
+    'DAEMON_PROTOCOL_VERSION'
+]
+
+logger = get_logger(__name__)
+
+DAEMON_PROTOCOL_VERSION = 2
+
+# Note: `sun_path` is 108 bytes on Linux and 104 on macOS, including the NUL terminator
+SOCKET_PATH_MAX_BYTES = 100
+
+def daemon_socket_path(pit_path: str) -> str:
+    """
+    The socket is placed in the `.pit/` directory when the path fits within the Unix socket path limit, otherwise in the temporary directory under a name derived from the repo path.
+
+    Args:
+        pit_path (str): Path to the `.pit/` directory.
+
+    Returns:
+        str: Path of the daemon's socket.
+    """
+    pit_path = os.path.abspath(pit_path)
+    path = os.path.join(pit_path, PIT_DAEMON_SOCKET_NAME)
+    if len(os.fsencode(path)) <= SOCKET_PATH_MAX_BYTES:
+        return path
+
+    digest = hashlib.sha1(os.fsencode(pit_path)).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f'pit-{os.getuid()}-{digest}.sock')
+
+def daemon_request(
+    pit_path: str,
+    command: str,
+    timeout: float = PIT_DAEMON_TIMEOUT,
+    **args: Any
+) -> Optional[Dict[str, Any]]:
+    """
+    Sends a single request to the daemon of a repo.
+
+    ```python
+    >>> daemon_request(pit_path, 'log', limit=10)
+    {'code': 0, 'output': '...', 'warnings': [], 'errors': []}
+    ```
+
+    Args:
+        pit_path (str): Path to the `.pit/` directory.
+        command (str): The command to run.
+        timeout (float, optional): Seconds to wait on the daemon.
+        **args: Arguments of the command.
+
+    Returns:
+        Optional[Dict[str, Any]]: The response, `None` if no daemon is running or it could not serve the request. Callers should then run the command themselves.
+    """
+    socket_path = daemon_socket_path(pit_path)
+    if not os.path.exists(socket_path):
+        return None
+
+    request = {
+        'version': DAEMON_PROTOCOL_VERSION,
+        'command': command,
+        'args': args
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(socket_path)
+            s.sendall(json.dumps(request).encode() + b'\n')
+
+            chunks = []
+            while True:
+                chunk = s.recv(65536)
+                if len(chunk) == 0:
+                    break
+                chunks.append(chunk)
+        response = json.loads(b''.join(chunks))
+    except (OSError, ValueError) as err:
+        logger.debug("Pit daemon request failed, falling back: %s" % err)
+        return None
+
+    if response.get('fallback', False):
+        logger.debug("Pit daemon declined request: %s" % response.get('reason'))
+        return None
+    return response
+
+def spawn_daemon(
+    pit_path: str,
+    timeout: float = PIT_DAEMON_START_TIMEOUT
+) -> Dict[str, Any]:
+    """
+    Starts the daemon for a repo as a detached background process and waits until it accepts requests. Output of the daemon is appended to `.pit/daemon.log`.
+
+    Args:
+        pit_path (str): Path to the `.pit/` directory.
+        timeout (float, optional): Seconds to wait for the daemon to start.
+
+    Raises:
+        PITDaemonError: If the daemon exits or does not respond in time.
+
+    Returns:
+        Dict[str, Any]: The daemon's response to a `ping`.
+    """
+    pit_path = os.path.abspath(pit_path)
+    with open(os.path.join(pit_path, PIT_DAEMON_LOG_NAME), 'ab') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'point_in_time.daemon.server', pit_path],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True
+        )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise PITDaemonError("Pit daemon exited with code %d, see %s" % (
+                proc.returncode,
+                os.path.join(pit_path, PIT_DAEMON_LOG_NAME)
+            ))
+
+        response = daemon_request(pit_path, 'ping', timeout=1)
+        if response is not None and response.get('pid') == proc.pid:
+            return response
+        time.sleep(0.02)
+
+    proc.terminate()
+    raise PITDaemonError("Pit daemon did not start within %d seconds" % timeout)
@@ -0,0 +1,183 @@
+"""
+Server side of the pit daemon. Run with `python -m point_in_time.daemon.server <pit path>`, normally through `pit daemon start`.
+
+Requests and responses are single JSON documents, the request terminated by a newline and the response by the server closing the connection. Requests are served one at a time by a single `PITRepo`, so its parsed log, compiled include file and git process stay warm between commands.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+from typing import Any, Callable, Dict, Iterator, List
+
+from point_in_time.repo import PITRepo
+from point_in_time.errors import PITBaseException, PITDaemonError, PITIdNotFoundError
+from point_in_time.constants.return_codes import PIT_CODE_ID_NOT_FOUND
+from point_in_time.constants.strings import WARN_PIT_NOT_IGNORED
+from point_in_time.cli.render import render_status, render_show, render_log
+from point_in_time.utils.git import git_check_ignore
+from point_in_time.utils.logging import get_logger
+
+from . import daemon_socket_path, daemon_request, DAEMON_PROTOCOL_VERSION
+
+__all__ = ['PITDaemon']
+
+logger = get_logger(__name__)
+
+REQUEST_MAX_BYTES = 1024 * 1024
+REQUEST_TIMEOUT = 5
+
+class PITDaemon:
+    """
+    Serves requests for a single pit repository.
+    """
+    def __init__(self, pit_path: str):
+        self.pit_path = os.path.abspath(pit_path)
+        self.toplevel = os.path.dirname(self.pit_path)
+        self.socket_path = daemon_socket_path(self.pit_path)
+
+        self._repo = None
+        self._running = False
+
+        self._commands: Dict[str, Callable[[Dict[str, Any]], Iterator[str]]] = {
+            'status': lambda args: render_status(self._get_repo()),
+            'show': lambda args: render_show(self._get_repo(), args['id'], args.get('verbose', False)),
+            'log': lambda args: render_log(self._get_repo(), args['limit'], args.get('offset', 0)),
+        }
+
+    def _get_repo(self) -> PITRepo:
+        if self._repo is None:
+            self._repo = PITRepo(self.pit_path, persistent_git=True)
+        return self._repo
+
+    def _get_warnings(self) -> List[str]:
+        # Note: Checked for every request, like `cli_check_standard`, as ignore files may change while the daemon runs
+        if not git_check_ignore(self.pit_path, cwd=self.toplevel):
+            return [WARN_PIT_NOT_IGNORED]
+        return []
+
+    def _reset_repo(self):
+        if self._repo is not None:
+            self._repo.close()
+            self._repo = None
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Args:
+            request (Dict[str, Any]): The decoded request.
+
+        Returns:
+            Dict[str, Any]: The response. Responses with `fallback` set ask the client to run the command itself.
+        """
+        if request.get('version') != DAEMON_PROTOCOL_VERSION:
+            return {'fallback': True, 'reason': 'Protocol version mismatch'}
+
+        command = request.get('command')
+        if command == 'ping':
+            return {'code': 0, 'pid': os.getpid(), 'toplevel': self.toplevel}
+        if command == 'shutdown':
+            self._running = False
+            return {'code': 0, 'pid': os.getpid()}
+
+        handler = self._commands.get(command)
+        if handler is None:
+            return {'fallback': True, 'reason': "Unknown command '%s'" % command}
+
+        response = {'code': 0, 'output': '', 'warnings': self._get_warnings(), 'errors': []}
+        try:
+            response['output'] = ''.join(
+                line + '\n'
+                for line in handler(request.get('args', {}))
+            )
+        except PITIdNotFoundError as err:
+            response['code'] = PIT_CODE_ID_NOT_FOUND
+            response['errors'].append(err.msg)
+        except Exception as err:
+            # Note: The CLI's own error handling applies when it runs the command itself
+            logger.exception("Failed to serve '%s'" % command)
+            self._reset_repo()
+            return {'fallback': True, 'reason': str(err)}
+
+        return response
+
+    def _serve_connection(self, conn: socket.socket):
+        conn.settimeout(REQUEST_TIMEOUT)
+
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = conn.recv(65536)
+            if len(chunk) == 0:
+                return
+            data += chunk
+            if len(data) > REQUEST_MAX_BYTES:
+                return
+
+        try:
+            request = json.loads(data)
+        except ValueError:
+            response = {'fallback': True, 'reason': 'Malformed request'}
+        else:
+            response = self.handle(request)
+
+        conn.sendall(json.dumps(response).encode())
+
+    def _bind(self) -> socket.socket:
+        if os.path.exists(self.socket_path):
+            if daemon_request(self.pit_path, 'ping', timeout=1) is not None:
+                raise PITDaemonError("A pit daemon is already running for %s" % self.toplevel)
+            # Left behind by a daemon which did not exit cleanly
+            os.remove(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen()
+        return server
+
+    def serve_forever(self):
+        """
+        Serves requests until a `shutdown` request or SIGTERM is received.
+
+        Raises:
+            PITDaemonError: If a daemon is already running for the repository.
+        """
+        os.chdir(self.toplevel)
+        server = self._bind()
+        logger.info("Pit daemon %d serving %s on %s" % (os.getpid(), self.toplevel, self.socket_path))
+
+        def on_sigterm(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, on_sigterm)
+
+        self._running = True
+        try:
+            while self._running:
+                conn, _ = server.accept()
+                with conn:
+                    try:
+                        self._serve_connection(conn)
+                    except OSError as err:
+                        logger.warning("Dropped connection: %s" % err)
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self._reset_repo()
+            logger.info("Pit daemon %d stopped" % os.getpid())
+
+def main(argv: List[str]) -> int:
+    if len(argv) != 2:
+        print("Usage: python -m point_in_time.daemon.server <pit path>", file=sys.stderr)
+        return 2
+
+    logger.setLevel(logging.INFO)
+    try:
+        PITDaemon(argv[1]).serve_forever()
+    except PITBaseException as err:
+        logger.error(err.msg)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
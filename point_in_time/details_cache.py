@@ -0,0 +1,197 @@
+import os
+import zlib
+import struct
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from point_in_time.constants.main import PIT_DETAILS_CACHE_MAX_BYTES
+from point_in_time.utils.git import GitCommitDetails
+from point_in_time.utils.fs import FileLock, atomic_write
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['CommitDetailsCache']
+
+logger = get_logger(__name__)
+
+RECORD_HEADER = struct.Struct('>I')
+"""
+Each record is a big endian length followed by that many bytes of zlib compressed payload.
+"""
+
+def encode_details(details: GitCommitDetails) -> bytes:
+    payload = b'\0'.join([
+        details.hash.encode(),
+        details.date.isoformat().encode(),
+    ] + [os.fsencode(f) for f in details.files_changed])
+
+    payload = zlib.compress(payload)
+    return RECORD_HEADER.pack(len(payload)) + payload
+
+def decode_details(payload: bytes) -> GitCommitDetails:
+    parts = zlib.decompress(payload).split(b'\0')
+
+    return GitCommitDetails(
+        hash=parts[0].decode(),
+        date=datetime.fromisoformat(parts[1].decode()),
+        files_changed=[os.fsdecode(f) for f in parts[2:]]
+    )
+
+def file_identity(st: os.stat_result) -> Tuple[int, int]:
+    return (st.st_dev, st.st_ino)
+
+class CommitDetailsCache:
+    """
+    Persistent cache of `GitCommitDetails` keyed by commit hash.
+
+    Snapshot commits are immutable so entries never need invalidation. New entries are appended to a single file, once it grows past `max_bytes` the oldest entries are evicted by rewriting the file with the newest entries up to half of the limit.
+
+    Writers (in any process) hold a lock on `lock_path` while appending and evicting. Readers take no lock, as records are only ever appended and evictions replace the file atomically.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = PIT_DETAILS_CACHE_MAX_BYTES
+    ):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.max_bytes = max_bytes
+        self._entries: Optional[Dict[str, bytes]] = None
+        self._end = 0
+        """
+        The offset after the last complete record of the file, anything after it (e.g. a torn write) is truncated before appending.
+        """
+        self._identity: Optional[Tuple[int, int]] = None
+        """
+        The device and inode of the file loaded, which change when another process evicts entries.
+        """
+
+    def _load(self) -> Dict[str, bytes]:
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        self._end = 0
+        if not os.path.isfile(self.path):
+            return self._entries
+
+        with open(self.path, 'rb') as f:
+            self._identity = file_identity(os.fstat(f.fileno()))
+            self._scan(f.read(), 0)
+
+        return self._entries
+
+    def _scan(self, data: bytes, offset: int):
+        """
+        Adds the complete records of `data`, read from `offset` of the file, to the loaded entries and moves `_end` past the last of them.
+        """
+        pos = 0
+        while pos + RECORD_HEADER.size <= len(data):
+            size, = RECORD_HEADER.unpack_from(data, pos)
+            record = data[pos:pos + RECORD_HEADER.size + size]
+            if len(record) != RECORD_HEADER.size + size:
+                break # Torn write at the end of the file
+
+            try:
+                hash = zlib.decompress(record[RECORD_HEADER.size:]).split(b'\0', 1)[0].decode()
+            except (zlib.error, UnicodeDecodeError, IndexError):
+                logger.warning("Discarding corrupt commit details cache: %s" % self.path)
+                self._entries.clear()
+                self._end = 0
+                return
+
+            # Note: Dictionaries keep insertion order so re-inserting keeps the newest last
+            self._entries.pop(hash, None)
+            self._entries[hash] = record
+            pos += len(record)
+
+        self._end = offset + pos
+
+    def get(self, hash: str) -> Optional[GitCommitDetails]:
+        """
+        Args:
+            hash (str): The commit hash to lookup.
+
+        Returns:
+            Optional[GitCommitDetails]: The cached details or `None` if not cached.
+        """
+        entries = self._load()
+        record = entries.get(hash)
+        if record is None:
+            return None
+
+        try:
+            return decode_details(record[RECORD_HEADER.size:])
+        except (zlib.error, UnicodeDecodeError, IndexError, ValueError):
+            logger.warning("Discarding corrupt commit details cache entry: %s" % hash)
+            del entries[hash]
+            return None
+
+    def put(self, details: GitCommitDetails):
+        self.put_many([details])
+
+    def put_many(self, details: Iterable[GitCommitDetails]):
+        """
+        Add details to the cache, evicting old entries if the cache grows beyond `max_bytes`.
+
+        Args:
+            details (Iterable[GitCommitDetails]): The details to add.
+        """
+        entries = self._load()
+        details = [d for d in details if d.hash not in entries]
+        if len(details) == 0:
+            return
+
+        with FileLock(self.lock_path):
+            with open(self.path, 'ab+') as f:
+                st = os.fstat(f.fileno())
+                if file_identity(st) != self._identity or st.st_size < self._end:
+                    # Note: Replaced by another process's eviction since loading, so read again from the start
+                    entries.clear()
+                    self._end = 0
+                    self._identity = file_identity(st)
+
+                # Pick up records appended by other processes since loading, then drop anything after the last complete record
+                f.seek(self._end)
+                self._scan(f.read(), self._end)
+                if st.st_size > self._end:
+                    f.truncate(self._end)
+
+                data = []
+                for d in details:
+                    if d.hash in entries:
+                        continue
+                    record = encode_details(d)
+                    entries[d.hash] = record
+                    data.append(record)
+
+                f.write(b''.join(data))
+                size = f.tell()
+                self._end = size
+
+            if size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Must be called with the lock held.
+        """
+        entries = self._load()
+
+        kept = []
+        size = 0
+        for hash in reversed(list(entries.keys())):
+            record = entries[hash]
+            if size + len(record) > self.max_bytes // 2:
+                break
+            kept.append(hash)
+            size += len(record)
+        kept.reverse()
+
+        self._entries = {h: entries[h] for h in kept}
+
+        data = b''.join(self._entries.values())
+        atomic_write(self.path, data)
+        self._end = len(data)
+        self._identity = file_identity(os.stat(self.path))
+
+        logger.debug("Evicted %d entries from commit details cache" % (len(entries) - len(kept)))
@@ -32,10 +32,46 @@ class PITStashPopFailedError(PITBaseException):
     """When stash pop fails"""
     pass
 
+class PITSnapshotFailedError(PITBaseException):
+    """When building a snapshot commit fails"""
+    pass
+
+class PITSnapshotCancelledError(PITSnapshotFailedError):
+    """When a snapshot being prepared is discarded"""
+    pass
+
+class PITSizeBudgetError(PITBaseException):
+    """When the files of a snapshot exceed the configured size budgets"""
+    pass
+
 class PITCommitParseFailed(PITBaseException):
     """When pit fails to parse a commit from the stash drop"""
     pass
 
 class PITLogCollision(PITBaseException):
     """If there is name collision with entries in the pit log"""
-    pass
\ No newline at end of file
+    pass
+
+class PITIdNotFoundError(PITBaseException):
+    """When a pit id does not exist in the log"""
+    pass
+
+class PITDaemonError(PITBaseException):
+    """When starting or communicating with the pit daemon fails"""
+    pass
+
+class PITConfigLoadError(PITRepoLoadError):
+    """When loading the config file fails"""
+    pass
+
+class PITMaterializeError(PITBaseException):
+    """When writing a file out of the chunk store fails"""
+    pass
+
+class PITObjectNotFoundError(PITMaterializeError):
+    """When an object is missing from, or corrupt in, the chunk store"""
+    pass
+
+class PITQueryError(PITBaseException):
+    """When a query of the snapshot index is invalid"""
+    pass
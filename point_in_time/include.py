@@ -0,0 +1,102 @@
+import os
+import re
+import pickle
+from typing import List, Optional, Tuple
+
+from point_in_time.errors import PITIncludeLoadError
+from point_in_time.utils.fs import atomic_write
+from point_in_time.utils.logging import get_logger
+from point_in_time.utils.main import pathspec_to_git_pathspecs
+from point_in_time.utils.matcher import PathMatcher
+
+__all__ = ['IncludeSpec', 'load_include_spec']
+
+logger = get_logger(__name__)
+
+INCLUDE_CACHE_VERSION = 1
+
+class IncludeSpec:
+    """
+    The parsed and compiled contents of the include file.
+    """
+    def __init__(
+        self,
+        include_lines: List[str],
+        force_lines: Optional[List[str]]
+    ):
+        self.include_lines = include_lines
+        self.force_lines = force_lines
+        """
+        Lines of the force section, `None` if there is no force section.
+        """
+
+        self.include = PathMatcher(include_lines)
+        self.include_pathspecs, self.include_exact = pathspec_to_git_pathspecs(include_lines)
+
+        self.force: Optional[PathMatcher] = None
+        self.force_pathspecs: Optional[List[str]] = None
+        if force_lines is not None:
+            self.force = PathMatcher(force_lines)
+            self.force_pathspecs, _ = pathspec_to_git_pathspecs(force_lines)
+
+    @classmethod
+    def parse(cls, lines: str) -> 'IncludeSpec':
+        """
+        Args:
+            lines (str): Contents of the include file.
+
+        Raises:
+            PITIncludeLoadError: If the include file has multiple force sections.
+        """
+        force_comments = list(re.finditer(r"^#\s*[fF]orce\s*$", lines, re.MULTILINE))
+        if len(force_comments) > 1:
+            raise PITIncludeLoadError("Found multiple 'force' comments in include file. Only one 'force' section can be included.")
+        elif len(force_comments) == 0:
+            return cls(lines.split('\n'), None)
+
+        include_lines = lines[:force_comments[0].start()]
+        force_lines = lines[force_comments[0].end():]
+        return cls(include_lines.split('\n'), force_lines.split('\n'))
+
+def include_cache_key(include_path: str) -> Tuple[int, int, int]:
+    st = os.stat(include_path)
+    return (INCLUDE_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+
+def load_include_spec(
+    include_path: str,
+    cache_path: Optional[str] = None,
+    key: Optional[Tuple[int, int, int]] = None
+) -> IncludeSpec:
+    """
+    Loads the include file, using the on disk cache when the file's mtime and size are unchanged.
+
+    Args:
+        include_path (str): Path to the include file.
+        cache_path (Optional[str], optional): Path of the on disk cache, if not provided no cache is used.
+        key (Optional[Tuple[int, int, int]], optional): The cache key, if already known from `include_cache_key`.
+
+    Raises:
+        PITIncludeLoadError: If the include file has multiple force sections.
+
+    Returns:
+        IncludeSpec: The compiled include file.
+    """
+    if key is None:
+        key = include_cache_key(include_path)
+
+    if cache_path is not None and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, spec = pickle.load(f)
+            if cached_key == key:
+                return spec
+        except Exception as err:
+            logger.debug("Ignoring unreadable include cache: %s" % err)
+
+    with open(include_path, 'r') as f:
+        spec = IncludeSpec.parse(f.read())
+
+    if cache_path is not None:
+        atomic_write(cache_path, pickle.dumps((key, spec)))
+
+    return spec
@@ -0,0 +1,190 @@
+import os
+import struct
+import hashlib
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from point_in_time.utils.fs import atomic_write
+from point_in_time.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    from point_in_time.log_store import LogPosition
+
+__all__ = ['PITLogIndex']
+
+logger = get_logger(__name__)
+
+INDEX_MAGIC = b'PITIDX\x00\x01'
+HEADER = struct.Struct('>8sIIIQ4x')
+"""
+Magic, capacity (a power of two), count, and the position up to which the log is indexed as segment and offset.
+"""
+SLOT = struct.Struct('>QIQ')
+"""
+A 64 bit hash of the key and the record's position as segment and offset. Segments are numbered from 1, so a zero segment marks an empty slot.
+"""
+INITIAL_CAPACITY = 1024
+MAX_LOAD = 0.5
+PROBE_SLOTS = 16
+"""
+Slots read at a time while probing, most lookups need only the first read.
+"""
+
+def key_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+class PITLogIndex:
+    """
+    A persistent hash table from record keys (pit ids) to positions in a `PITLogStore`, stored as open addressing with linear probing so lookups read a few slots from disk and memory use does not grow with the log.
+
+    The index is derived data. It records the position up to which the log has been indexed, and `update(...)` indexes only the records appended since. Positions are always verified against the record they point to, so a stale or damaged index can cause a miss, which the store recovers from by scanning, but never a wrong result.
+
+    In place updates write slots before the header, and growing the table replaces the file atomically, so readers never need a lock.
+    """
+    def __init__(self, path: str, key: str = 'pit_id'):
+        """
+        Args:
+            path (str): Path to the index file.
+            key (str, optional): The record field which is indexed.
+        """
+        self.path = path
+        self.key = key
+
+    def _read_header(self, f) -> Optional[Tuple[int, int, 'LogPosition']]:
+        data = f.read(HEADER.size)
+        if len(data) != HEADER.size:
+            return None
+        magic, capacity, count, segment, offset = HEADER.unpack(data)
+        if magic != INDEX_MAGIC or capacity == 0 or capacity & (capacity - 1) != 0:
+            return None
+        return capacity, count, (segment, offset)
+
+    def indexed_position(self) -> Optional['LogPosition']:
+        """
+        Returns:
+            Optional[LogPosition]: The position up to which the log is indexed, `None` if there is no valid index.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                header = self._read_header(f)
+        except FileNotFoundError:
+            return None
+        return None if header is None else header[2]
+
+    def _probe(self, f, capacity: int, h: int) -> Iterable[Tuple[int, int, 'LogPosition']]:
+        """
+        Yields the occupied slots of the probe sequence of a hash as `(slot, hash, position)`, stopping at the first empty slot.
+        """
+        slot = h & (capacity - 1)
+        for _ in range(0, capacity, PROBE_SLOTS):
+            n = min(PROBE_SLOTS, capacity - slot)
+            f.seek(HEADER.size + slot * SLOT.size)
+            data = f.read(n * SLOT.size)
+            for i in range(n):
+                slot_hash, segment, offset = SLOT.unpack_from(data, i * SLOT.size)
+                if segment == 0:
+                    return
+                yield slot + i, slot_hash, (segment, offset)
+            slot = (slot + n) & (capacity - 1)
+
+    def lookup(self, value: str) -> List['LogPosition']:
+        """
+        Args:
+            value (str): The key to find.
+
+        Returns:
+            List[LogPosition]: Positions of records which may have the key, to be verified by the caller. Usually a single position, more only if 64 bit hashes collide.
+        """
+        h = key_hash(value)
+        try:
+            with open(self.path, 'rb') as f:
+                header = self._read_header(f)
+                if header is None:
+                    return []
+                capacity, _, _ = header
+                return [p for _, slot_hash, p in self._probe(f, capacity, h) if slot_hash == h]
+        except FileNotFoundError:
+            return []
+
+    def update(self, records: Iterable[Tuple['LogPosition', dict]], position: 'LogPosition'):
+        """
+        Indexes records appended since `indexed_position()`, the caller must hold the store lock.
+
+        Args:
+            records (Iterable[Tuple[LogPosition, dict]]): The records after `indexed_position()`, with their positions.
+            position (LogPosition): The end of the log once `records` are indexed.
+        """
+        entries = [(key_hash(r[self.key]), p) for p, r in records if isinstance(r.get(self.key), str)]
+
+        header = None
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as f:
+                header = self._read_header(f)
+        if header is None:
+            capacity = INITIAL_CAPACITY
+            while len(entries) > capacity * MAX_LOAD:
+                capacity *= 2
+            self._write_table(capacity, [], entries, position)
+            return
+
+        capacity, count, _ = header
+        if (count + len(entries)) > capacity * MAX_LOAD:
+            with open(self.path, 'rb') as f:
+                f.seek(HEADER.size)
+                data = f.read(capacity * SLOT.size)
+            existing = [
+                (h, (segment, offset))
+                for h, segment, offset in SLOT.iter_unpack(data)
+                if segment != 0
+            ]
+            while (len(existing) + len(entries)) > capacity * MAX_LOAD:
+                capacity *= 2
+            self._write_table(capacity, existing, entries, position)
+            return
+
+        with open(self.path, 'r+b') as f:
+            for h, p in entries:
+                if self._insert(f, capacity, h, p):
+                    count += 1
+            # Note: Written last, so readers which see the new position also see the slots
+            f.seek(0)
+            f.write(HEADER.pack(INDEX_MAGIC, capacity, count, *position))
+
+    def _insert(self, f, capacity: int, h: int, position: 'LogPosition') -> bool:
+        slot = h & (capacity - 1)
+        for s, slot_hash, p in self._probe(f, capacity, h):
+            if slot_hash == h and p == position:
+                # Indexed by an update which was interrupted before writing the header
+                return False
+            slot = (s + 1) & (capacity - 1)
+        f.seek(HEADER.size + slot * SLOT.size)
+        f.write(SLOT.pack(h, *position))
+        return True
+
+    def _write_table(
+        self,
+        capacity: int,
+        existing: List[Tuple[int, 'LogPosition']],
+        entries: List[Tuple[int, 'LogPosition']],
+        position: 'LogPosition'
+    ):
+        slots = [None] * capacity
+        count = 0
+        for h, p in existing + entries:
+            slot = h & (capacity - 1)
+            duplicate = False
+            while slots[slot] is not None:
+                if slots[slot] == (h, p):
+                    duplicate = True
+                    break
+                slot = (slot + 1) & (capacity - 1)
+            if not duplicate:
+                slots[slot] = (h, p)
+                count += 1
+
+        empty = SLOT.pack(0, 0, 0)
+        data = [HEADER.pack(INDEX_MAGIC, capacity, count, *position)]
+        for s in slots:
+            data.append(empty if s is None else SLOT.pack(s[0], *s[1]))
+
+        atomic_write(self.path, b''.join(data))
+        logger.debug("Wrote pit log index with %d entries, capacity %d" % (count, capacity))
@@ -0,0 +1,733 @@
+import os
+import json
+import time
+import zlib
+import uuid
+from json import JSONDecodeError
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from point_in_time.constants.main import (
+    PIT_LOG_SEGMENT_MAX_BYTES,
+    PIT_LOG_REVERSE_BLOCK_BYTES
+)
+from point_in_time.errors import PITLogLoadError, PITLogCollision
+from point_in_time.log_index import PITLogIndex
+from point_in_time.utils.fs import FileLock, atomic_write
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['PITLogStore', 'LogPosition']
+
+logger = get_logger(__name__)
+
+LogPosition = Tuple[int, int]
+"""
+Location of a record inside of the log store as `(segment_number, byte_offset)`.
+"""
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+
+INDEX_NAME = 'index'
+PENDING_DIR_NAME = 'pending'
+PENDING_SUFFIX = '.rec'
+COMMITTING_SUFFIX = '.committing'
+COLLISION_SUFFIX = '.collision'
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """
+    Encodes a log record as a single checksummed line.
+
+    Each line has the form `<crc32 as 8 hex chars> <compact json>\\n`, the checksum covers the json payload only.
+
+    Args:
+        record (Dict[str, Any]): The JSON serializable record.
+
+    Returns:
+        bytes: The encoded line including the trailing newline.
+    """
+    payload = json.dumps(record, separators=(',', ':')).encode()
+    return b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+
+def decode_record(line: bytes) -> Dict[str, Any]:
+    """
+    Decodes a line produced by `encode_record`.
+
+    Args:
+        line (bytes): The line, with or without the trailing newline.
+
+    Raises:
+        ValueError: If the line is malformed or the checksum does not match.
+
+    Returns:
+        Dict[str, Any]: The decoded record.
+    """
+    line = line.rstrip(b'\n')
+    if len(line) < 10 or line[8:9] != b' ':
+        raise ValueError("Malformed record")
+
+    checksum, payload = int(line[:8], 16), line[9:]
+    if zlib.crc32(payload) != checksum:
+        raise ValueError("Record checksum mismatch")
+
+    try:
+        return json.loads(payload)
+    except JSONDecodeError as err:
+        raise ValueError(err.msg)
+
+class PITLogStore:
+    """
+    Append-only log storage made of newline delimited segment files.
+
+    Records are appended to the highest numbered ("active") segment. Once that segment reaches `segment_max_bytes` a new segment is started, so an append never reads or rewrites existing history.
+
+    A crash during an append can leave a partial line at the end of the active segment. Readers skip such a torn tail and the next append truncates it before writing.
+
+    Appends from concurrent processes are serialized by an advisory lock on `<path>.lock`. See `group_append` for appending under contention.
+
+    Records are found by key through a persistent index (see `PITLogIndex`) which appends keep up to date. Readers only take the lock to index records the index is missing, e.g. after upgrading from a version without it. Further fields, which need not be unique, can be indexed the same way (see `find`).
+    """
+    def __init__(
+        self,
+        path: str,
+        segment_max_bytes: int = PIT_LOG_SEGMENT_MAX_BYTES,
+        key: str = 'pit_id',
+        indexes: Sequence[str] = ()
+    ):
+        """
+        Args:
+            path (str): Path to the store directory.
+            segment_max_bytes (int, optional): Size at which a new segment is started.
+            key (str, optional): The record field which is unique across the store, and indexed.
+            indexes (Sequence[str], optional): Further record fields to index, see `find`.
+        """
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.lock_path = path + '.lock'
+        self.pending_path = os.path.join(path, PENDING_DIR_NAME)
+        self.index = PITLogIndex(os.path.join(path, INDEX_NAME), key=key)
+        self.field_indexes = {
+            field: PITLogIndex(os.path.join(path, f'{INDEX_NAME}.{field}'), key=field)
+            for field in indexes
+        }
+
+    def lock(self) -> FileLock:
+        """
+        Returns:
+            FileLock: The lock which must be held to modify the store.
+        """
+        return FileLock(self.lock_path)
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    def create(self):
+        os.mkdir(self.path)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(
+            self.path,
+            f'{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}'
+        )
+
+    def segments(self) -> List[int]:
+        """
+        Returns:
+            List[int]: The segment numbers currently in the store, in order.
+        """
+        if not self.exists():
+            raise PITLogLoadError("Malformed pit directory: Log does not exist")
+
+        segments = []
+        for name in os.listdir(self.path):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def state(self) -> Tuple:
+        """
+        A cheap fingerprint of the store's contents, for callers caching what they have read. Only the active segment is ever modified, so its size and mtime change whenever records are appended.
+
+        Returns:
+            Tuple: A value which compares equal for as long as the store is unchanged.
+        """
+        segments = self.segments()
+        if len(segments) == 0:
+            return ()
+
+        st = os.stat(self.segment_path(segments[-1]))
+        return (tuple(segments), st.st_size, st.st_mtime_ns)
+
+    def append(self, record: Dict[str, Any]) -> LogPosition:
+        """
+        Appends a single record to the active segment, rolling over to a new segment if the active one is full.
+
+        Args:
+            record (Dict[str, Any]): The JSON serializable record.
+
+        Returns:
+            LogPosition: Where the record was written.
+        """
+        return self.append_many([record])[0]
+
+    def append_many(self, records: List[Dict[str, Any]]) -> List[LogPosition]:
+        """
+        Appends multiple records with a single write and fsync.
+
+        Args:
+            records (List[Dict[str, Any]]): The JSON serializable records.
+
+        Returns:
+            List[LogPosition]: Where each of the records was written.
+        """
+        with self.lock():
+            return self._append_locked(records)
+
+    def _append_locked(self, records: List[Dict[str, Any]]) -> List[LogPosition]:
+        segments = self.segments()
+        segment = segments[-1] if len(segments) != 0 else 1
+
+        f = open(self.segment_path(segment), 'ab+')
+        try:
+            size = self._truncate_torn_tail(f)
+            start = (segment, size) if len(segments) != 0 else (0, 0)
+
+            if size >= self.segment_max_bytes:
+                # Roll over to a new segment
+                f.close()
+                segment += 1
+                f = open(self.segment_path(segment), 'ab+')
+                size = 0
+
+            data = []
+            positions = []
+            for record in records:
+                line = encode_record(record)
+                positions.append((segment, size))
+                data.append(line)
+                size += len(line)
+
+            f.write(b''.join(data))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        for index in self._indexes():
+            if index.indexed_position() == start:
+                index.update(zip(positions, records), (segment, size))
+            else:
+                self._update_index_locked(index)
+
+        return positions
+
+    @staticmethod
+    def _truncate_torn_tail(f) -> int:
+        """
+        Removes a partial record left at the end of a segment by an interrupted append.
+
+        Returns:
+            int: The size of the segment after truncation.
+        """
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return size
+
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return size
+
+        # Walk backwards to the last complete record
+        block = 4096
+        end = size
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            chunk = f.read(end - start)
+            pos = chunk.rfind(b'\n')
+            if pos != -1:
+                end = start + pos + 1
+                break
+            end = start
+
+        logger.warning("Truncating torn record at end of pit log segment '%s'" % f.name)
+        f.truncate(end)
+        return end
+
+    def group_append(self, record: Dict[str, Any]):
+        """
+        Appends a record unless one with the same key already exists, such that many processes can append concurrently.
+
+        The record is first written to the `pending/` directory, then the store lock is taken. Whichever process gets the lock appends every pending record with a single write and fsync, so writers which queued behind the lock usually find their record already committed once they get it. Throughput grows with the number of concurrent writers rather than each paying for its own fsync.
+
+        Records left pending by a process which exited before committing are appended by the next writer, as are those of a writer which exited while committing.
+
+        Args:
+            record (Dict[str, Any]): The JSON serializable record.
+
+        Raises:
+            PITLogCollision: If a record with the same key (see `key`) already exists.
+        """
+        os.makedirs(self.pending_path, exist_ok=True)
+
+        name = '%020d-%d-%s' % (time.time_ns(), os.getpid(), uuid.uuid4().hex[:8])
+        pending_path = os.path.join(self.pending_path, name + PENDING_SUFFIX)
+        committing_path = os.path.join(self.pending_path, name + COMMITTING_SUFFIX)
+        collision_path = os.path.join(self.pending_path, name + COLLISION_SUFFIX)
+        atomic_write(pending_path, encode_record(record))
+
+        with self.lock():
+            if os.path.exists(pending_path) or os.path.exists(committing_path):
+                self._flush_pending()
+
+        if os.path.exists(collision_path):
+            os.remove(collision_path)
+            raise PITLogCollision("Pit name collision during log append.")
+
+    def _flush_pending(self):
+        """
+        Commits all pending records, must be called with the lock held. Records whose key collides are renamed with the `.collision` suffix for their writer to find.
+
+        Pending records are renamed with the `.committing` suffix before being appended and removed after the fsync. Finding `.committing` records means a previous writer exited part way through, those already in the store are not treated as collisions.
+        """
+        names = sorted(os.listdir(self.pending_path))
+        interrupted = [
+            n[:-len(COMMITTING_SUFFIX)] for n in names
+            if n.endswith(COMMITTING_SUFFIX)
+        ]
+        pending = [
+            n[:-len(PENDING_SUFFIX)] for n in names
+            if n.endswith(PENDING_SUFFIX)
+        ]
+        if len(interrupted) + len(pending) == 0:
+            return
+
+        for name in pending:
+            os.replace(
+                os.path.join(self.pending_path, name + PENDING_SUFFIX),
+                os.path.join(self.pending_path, name + COMMITTING_SUFFIX)
+            )
+
+        key = self.index.key
+        self._update_index_locked()
+        batch = set()
+        records = []
+        committed = []
+        collided = []
+        for name in sorted(interrupted + pending):
+            path = os.path.join(self.pending_path, name + COMMITTING_SUFFIX)
+            try:
+                with open(path, 'rb') as f:
+                    record = decode_record(f.read())
+            except (OSError, ValueError) as err:
+                logger.warning("Discarding unreadable pending pit log record '%s': %s" % (name, err))
+                os.remove(path)
+                continue
+
+            value = record.get(key)
+            stored = next(iter(self._lookup(value)), None) if value not in batch else None
+            if value not in batch and stored is None:
+                batch.add(value)
+                records.append(record)
+                committed.append(name)
+            elif name in interrupted and stored == record:
+                # Appended by the interrupted writer before it could clean up
+                committed.append(name)
+            else:
+                collided.append(name)
+
+        if len(records) != 0:
+            self._append_locked(records)
+
+        for name in collided:
+            os.replace(
+                os.path.join(self.pending_path, name + COMMITTING_SUFFIX),
+                os.path.join(self.pending_path, name + COLLISION_SUFFIX)
+            )
+        for name in committed:
+            os.remove(os.path.join(self.pending_path, name + COMMITTING_SUFFIX))
+
+        logger.debug("Committed %d pending pit log records, %d collisions" % (len(records), len(collided)))
+
+    def read_at(self, position: LogPosition) -> Dict[str, Any]:
+        """
+        Reads the record at a position, as returned by `append` or `iter_records`.
+
+        Raises:
+            OSError: If the segment does not exist.
+            ValueError: If there is no valid record at the position.
+        """
+        segment, offset = position
+        with open(self.segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        if not line.endswith(b'\n'):
+            raise ValueError("Incomplete record")
+        return decode_record(line)
+
+    def _indexes(self) -> List[PITLogIndex]:
+        return [self.index] + list(self.field_indexes.values())
+
+    def _lookup(self, value: Any, index: Optional[PITLogIndex] = None) -> List[Dict[str, Any]]:
+        """
+        Finds records through an index only, defaults to the index of `key`.
+        """
+        if index is None:
+            index = self.index
+        if not isinstance(value, str):
+            return []
+
+        found = []
+        for position in index.lookup(value):
+            try:
+                record = self.read_at(position)
+            except (OSError, ValueError):
+                continue # Stale index, e.g. damaged by a crash
+            if record.get(index.key) == value:
+                found.append(record)
+        return found
+
+    def get(self, value: str) -> Optional[Dict[str, Any]]:
+        """
+        Finds the record with a key (see `key`) without reading the rest of the log, records appended since the index was last updated are indexed first.
+
+        Args:
+            value (str): The key, e.g. a pit id.
+
+        Returns:
+            Optional[Dict[str, Any]]: The record, `None` if there is none with the key.
+        """
+        found = self._lookup(value)
+        if len(found) != 0:
+            return found[0]
+
+        unindexed = self._catch_up(self.index)
+        if unindexed is not None:
+            return next((r for _, r in unindexed if r.get(self.index.key) == value), None)
+        return next(iter(self._lookup(value)), None)
+
+    def find(self, field: str, value: str) -> List[Dict[str, Any]]:
+        """
+        Finds the records with a value of a field, through its index (see `indexes`) without reading the rest of the log. Records appended since the index was last updated are indexed first.
+
+        Args:
+            field (str): One of `indexes`.
+            value (str): The value, e.g. a tree hash.
+
+        Returns:
+            List[Dict[str, Any]]: The records with the value.
+        """
+        index = self.field_indexes[field]
+        unindexed = self._catch_up(index)
+        found = self._lookup(value, index)
+        if unindexed is not None:
+            found += [r for _, r in unindexed if r.get(field) == value]
+        return found
+
+    def _catch_up(self, index: PITLogIndex) -> Optional[List[Tuple[LogPosition, Dict[str, Any]]]]:
+        """
+        Indexes the records appended since an index was last updated.
+
+        Returns:
+            Optional[List[Tuple[LogPosition, Dict[str, Any]]]]: The records which could not be indexed, for the caller to scan, `None` if the index is up to date.
+        """
+        records, _ = self._records_since(self._indexed_position(index))
+        if len(records) == 0:
+            return None
+
+        try:
+            with self.lock():
+                self._update_index_locked()
+        except OSError as err:
+            # Note: e.g. a read only filesystem, fall back to scanning the records the index is missing
+            logger.debug("Unable to update pit log index: %s" % err)
+            return records
+        return None
+
+    def _indexed_position(self, index: Optional[PITLogIndex] = None) -> Optional[LogPosition]:
+        """
+        The position up to which an index is valid, `None` if the log must be indexed from the start. Defaults to the index of `key`.
+        """
+        if index is None:
+            index = self.index
+        position = index.indexed_position()
+        if position is None or not self.is_valid_position(position):
+            return None
+        return position
+
+    def is_valid_position(self, position: LogPosition) -> bool:
+        """
+        Checks a position recorded by a reader, e.g. the end of what a derived index has read, is still within the log. Segments are only appended to, so a position past the end of its segment or in a segment which no longer exists means the log was replaced.
+        """
+        if position == (0, 0):
+            return True # The start of the log, before the first segment
+
+        segment, offset = position
+        try:
+            return offset <= os.path.getsize(self.segment_path(segment))
+        except FileNotFoundError:
+            return False
+
+    def iter_records_since(
+        self,
+        position: Optional[LogPosition]
+    ) -> Iterator[Tuple[LogPosition, Dict[str, Any], LogPosition]]:
+        """
+        Iterates the records after a position, oldest first.
+
+        Args:
+            position (Optional[LogPosition]): A position returned by this method, `None` to start from the beginning of the log.
+
+        Yields:
+            Tuple[LogPosition, Dict[str, Any], LogPosition]: The position of each record, the record, and the position after it.
+        """
+        segments = self.segments()
+        if position is None:
+            position = (segments[0], 0) if len(segments) != 0 else (0, 0)
+
+        for segment in segments:
+            if segment < position[0]:
+                continue
+            start = position[1] if segment == position[0] else 0
+            for (_, offset), record, size in self.iter_segment(
+                segment,
+                is_active=(segment == segments[-1]),
+                start=start,
+                with_size=True
+            ):
+                yield (segment, offset), record, (segment, offset + size)
+
+    def _records_since(
+        self,
+        position: Optional[LogPosition]
+    ) -> Tuple[List[Tuple[LogPosition, Dict[str, Any]]], LogPosition]:
+        """
+        Returns:
+            Tuple[List[Tuple[LogPosition, Dict[str, Any]]], LogPosition]: The records after a position with their positions, and the position after the last complete record.
+        """
+        if position is None:
+            segments = self.segments()
+            position = (segments[0], 0) if len(segments) != 0 else (0, 0)
+
+        records = []
+        end = position
+        for p, record, end in self.iter_records_since(position):
+            records.append((p, record))
+        return records, end
+
+    def _update_index_locked(self, index: Optional[PITLogIndex] = None):
+        """
+        Indexes records appended since an index was last updated, must be called with the lock held. Defaults to all indexes.
+        """
+        if index is None:
+            for index in self._indexes():
+                self._update_index_locked(index)
+            return
+
+        position = self._indexed_position(index)
+        if position is None and index.indexed_position() is not None:
+            logger.warning("Rebuilding pit log index, it does not match the log")
+            os.remove(index.path)
+
+        records, end = self._records_since(position)
+        if len(records) != 0 or index.indexed_position() != end:
+            index.update(records, end)
+
+    def iter_segment(
+        self,
+        segment: int,
+        is_active: bool = False,
+        start: int = 0,
+        with_size: bool = False
+    ) -> Iterator[Tuple]:
+        """
+        Iterates the records in a single segment.
+
+        Args:
+            segment (int): The segment number.
+            is_active (bool, optional): If the segment is the active one, in which case an incomplete final record is skipped instead of raising.
+            start (int, optional): Offset of the first record to read.
+            with_size (bool, optional): Also yield the encoded size of each record, as a third item.
+
+        Raises:
+            PITLogLoadError: If a record fails checksum validation.
+
+        Yields:
+            Tuple: The position and record, and size if `with_size` is set.
+        """
+        offset = start
+        with open(self.segment_path(segment), 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b'\n') and is_active:
+                    # Note: Also seen while another process is appending
+                    logger.debug("Skipping incomplete record at end of pit log segment %d" % segment)
+                    return
+
+                try:
+                    record = decode_record(line)
+                except ValueError as err:
+                    raise PITLogLoadError("Malformed pit log: segment %d offset %d: %s" % (segment, offset, str(err)))
+
+                if with_size:
+                    yield (segment, offset), record, len(line)
+                else:
+                    yield (segment, offset), record
+                offset += len(line)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for _, record in self.iter_records():
+            yield record
+
+    def iter_records(self) -> Iterator[Tuple[LogPosition, Dict[str, Any]]]:
+        """
+        Iterates all records in the store, oldest first.
+        """
+        segments = self.segments()
+        for i, segment in enumerate(segments):
+            yield from self.iter_segment(
+                segment,
+                is_active=(i == len(segments) - 1)
+            )
+
+    def iter_records_reverse(self) -> Iterator[Tuple[LogPosition, Dict[str, Any]]]:
+        """
+        Iterates all records in the store, newest first. Segments are read backwards in blocks, so the newest records are produced without reading the rest of the log.
+        """
+        segments = self.segments()
+        for i, segment in enumerate(reversed(segments)):
+            yield from self.iter_segment_reverse(segment, is_active=(i == 0))
+
+    def iter_segment_reverse(
+        self,
+        segment: int,
+        is_active: bool = False,
+        block_size: int = PIT_LOG_REVERSE_BLOCK_BYTES
+    ) -> Iterator[Tuple[LogPosition, Dict[str, Any]]]:
+        """
+        Iterates the records in a single segment, newest first. See `iter_segment(...)`.
+
+        Args:
+            segment (int): The segment number.
+            is_active (bool, optional): If the segment is the active one, in which case an incomplete final record is skipped instead of raising.
+            block_size (int, optional): Size of reads from the segment.
+
+        Raises:
+            PITLogLoadError: If a record fails checksum validation.
+        """
+        with open(self.segment_path(segment), 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            is_tail = True
+            buffer = b''
+            while pos > 0:
+                n = min(block_size, pos)
+                pos -= n
+                f.seek(pos)
+                buffer = f.read(n) + buffer
+
+                # Note: Unless at the start of the segment, the first line may continue in the block before
+                start = 0 if pos == 0 else buffer.find(b'\n') + 1
+                if start == 0 and pos != 0:
+                    continue
+                lines = buffer[start:].split(b'\n')
+                buffer = buffer[:start]
+
+                # Empty, unless the final record of the segment is incomplete
+                tail = lines.pop()
+                if is_tail and len(tail) != 0:
+                    if not is_active:
+                        raise PITLogLoadError("Malformed pit log: segment %d: Incomplete record" % segment)
+                    logger.debug("Skipping incomplete record at end of pit log segment %d" % segment)
+                is_tail = False
+
+                offsets = []
+                offset = pos + start
+                for line in lines:
+                    offsets.append(offset)
+                    offset += len(line) + 1
+
+                for offset, line in zip(reversed(offsets), reversed(lines)):
+                    try:
+                        record = decode_record(line)
+                    except ValueError as err:
+                        raise PITLogLoadError("Malformed pit log: segment %d offset %d: %s" % (segment, offset, str(err)))
+                    yield (segment, offset), record
+
+    def __contains__(self, value: str) -> bool:
+        return self.get(value) is not None
+
+    def active_segment_contains(self, key: str, value: Any) -> bool:
+        """
+        Checks only the records of the active segment, which is at most `segment_max_bytes`, so the cost does not grow with the history.
+
+        Args:
+            key (str): The record field to compare.
+            value (Any): The value to look for.
+        """
+        segments = self.segments()
+        if len(segments) == 0:
+            return False
+
+        for _, record in self.iter_segment(segments[-1], is_active=True):
+            if record.get(key) == value:
+                return True
+        return False
+
+    def migrate_legacy(self, legacy_path: str, backup_suffix: Optional[str] = '.migrated'):
+        """
+        One time migration from the legacy single file `log.json` format.
+
+        Segments are written to a temporary directory which is renamed into place, so an interrupted migration will simply be redone. The store lock is held throughout, if another process completed the migration first this does nothing.
+
+        Args:
+            legacy_path (str): Path to the legacy `log.json` file.
+            backup_suffix (Optional[str], optional): Suffix the legacy file is renamed with after migration, if `None` the legacy file is removed.
+
+        Raises:
+            PITLogLoadError: If the legacy log can not be parsed.
+        """
+        with self.lock():
+            if self.exists():
+                return
+            self._migrate_legacy_locked(legacy_path, backup_suffix)
+
+    def _migrate_legacy_locked(self, legacy_path: str, backup_suffix: Optional[str]):
+        try:
+            with open(legacy_path, 'r') as f:
+                legacy = json.load(f)
+        except JSONDecodeError as err:
+            raise PITLogLoadError("Malformed pit log: %s" % err.msg)
+        if not isinstance(legacy, dict):
+            raise PITLogLoadError("Malformed pit log: Expected mapping of pit ids to entries")
+
+        tmp = PITLogStore(
+            self.path + '.tmp',
+            self.segment_max_bytes,
+            key=self.index.key,
+            indexes=list(self.field_indexes.keys())
+        )
+        if tmp.exists():
+            for name in os.listdir(tmp.path):
+                os.remove(os.path.join(tmp.path, name))
+            os.rmdir(tmp.path)
+        tmp.create()
+
+        batch = []
+        batch_size = 0
+        for record in legacy.values():
+            batch.append(record)
+            batch_size += len(encode_record(record))
+            if batch_size >= self.segment_max_bytes:
+                tmp._append_locked(batch)
+                batch = []
+                batch_size = 0
+        if len(batch) != 0:
+            tmp._append_locked(batch)
+
+        os.rename(tmp.path, self.path)
+        logger.info("Migrated %d pit log entries from '%s'" % (len(legacy), legacy_path))
+
+        if backup_suffix is None:
+            os.remove(legacy_path)
+        else:
+            os.rename(legacy_path, legacy_path + backup_suffix)
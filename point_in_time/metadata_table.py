@@ -0,0 +1,504 @@
+"""
+Columnar projection of the log for comparing many snapshots at once, used by `pit compare`:
+
+```text
+$ pit compare 'metadata.lr<1e-2' --sort metadata.loss --asc -c metadata.lr -c metadata.loss
+$ pit compare --group-by metadata.opt.name -c metadata.loss
+```
+
+Each field of the log records (`pit_id`, `git_hash` and every flattened metadata key, see `iter_metadata`) is a typed column backed by an `array.array`. Numbers are doubles with NaN for missing values, booleans are bytes with -1 for missing, and strings are dictionary-encoded as codes into the list of distinct values, -1 for missing. Filters and sorts run over the arrays, and string comparisons run once per distinct value rather than per snapshot. No `PITLogEntry` is built.
+
+The table is cached in `.pit/metadata.cache` along with the log position it was built up to, later loads only add the snapshots appended since (see `PITRepo.get_metadata_table`).
+"""
+from __future__ import annotations
+import sys
+import json
+import math
+import struct
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from point_in_time.errors import PITQueryError
+from point_in_time.query_filter import COMPARE, FIELDS, QueryFilter, iter_metadata, resolve_field
+from point_in_time.utils.fs import atomic_write
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['Column', 'MetadataTable']
+
+logger = get_logger(__name__)
+
+KIND_NUMBER = 'number'
+KIND_BOOL = 'bool'
+KIND_STRING = 'string'
+TYPECODES = {
+    KIND_NUMBER: 'd',
+    KIND_BOOL: 'b',
+    KIND_STRING: 'i',
+}
+MISSING_CODE = -1
+
+CACHE_MAGIC = b'PITMETA\x02'
+CACHE_HEADER = struct.Struct('>8sI')
+"""
+Magic and the size of the JSON header which follows, describing the columns whose buffers follow it in order.
+"""
+
+def format_text(value: Any) -> str:
+    """
+    Returns:
+        str: A metadata value as stored in a string column.
+    """
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+class Column:
+    """
+    A typed column of a `MetadataTable`.
+
+    `values` supports the buffer protocol, so it converts without copying, e.g. `numpy.frombuffer(column.values)`. For string columns it holds codes into `dictionary`, as accepted by `pandas.Categorical.from_codes(...)`.
+    """
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        values: Optional[array] = None,
+        dictionary: Optional[List[str]] = None,
+        numbers: Optional[Set[int]] = None
+    ):
+        self.name = name
+        self.kind = kind
+        self.values = values if values is not None else array(TYPECODES[kind])
+        self.dictionary = dictionary if dictionary is not None else []
+        self.numbers = numbers if numbers is not None else set()
+        """
+        Codes of a string column whose values were numbers or booleans, which filters still compare as such.
+        """
+        self._codes = {v: i for i, v in enumerate(self.dictionary)}
+
+    @staticmethod
+    def kind_of(value: Any) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: The kind of column which holds a value, `None` for missing values.
+        """
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return KIND_BOOL
+        if isinstance(value, (int, float)):
+            return KIND_NUMBER
+        return KIND_STRING
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _missing(self):
+        return math.nan if self.kind == KIND_NUMBER else MISSING_CODE
+
+    def pad(self, length: int):
+        """
+        Extends the column with missing values up to `length` rows.
+        """
+        if len(self.values) < length:
+            self.values.extend(array(self.values.typecode, [self._missing()]) * (length - len(self.values)))
+
+    def append(self, value: Any):
+        if self.kind == KIND_NUMBER:
+            self.values.append(float(value))
+        elif self.kind == KIND_BOOL:
+            self.values.append(int(value))
+        else:
+            self.values.append(self._encode_value(value))
+
+    def _encode(self, text: str) -> int:
+        code = self._codes.get(text)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(text)
+            self._codes[text] = code
+        return code
+
+    def _encode_value(self, value: Any) -> int:
+        code = self._encode(format_text(value))
+        if Column.kind_of(value) != KIND_STRING:
+            self.numbers.add(code)
+        return code
+
+    def _split(self, code: int) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Returns:
+            Tuple[Optional[float], Optional[str]]: A value of a string column as a number and as text, the same as `flatten_metadata(...)` splits it.
+        """
+        text = self.dictionary[code]
+        if code not in self.numbers:
+            return None, text
+        if text in ('true', 'false'):
+            return int(text == 'true'), text
+        return float(text), None
+
+    def as_string(self) -> Column:
+        """
+        Returns:
+            Column: The column converted to a string column, when a field holds values of different kinds.
+        """
+        column = Column(self.name, KIND_STRING)
+        for i in range(len(self)):
+            value = self.get(i)
+            column.values.append(MISSING_CODE if value is None else column._encode_value(value))
+        return column
+
+    def get(self, row: int) -> Any:
+        """
+        Returns:
+            Any: The value of a row, `None` if missing.
+        """
+        v = self.values[row]
+        if self.kind == KIND_NUMBER:
+            if v != v:
+                return None
+            return int(v) if v.is_integer() and abs(v) < 2**53 else v
+        if v == MISSING_CODE:
+            return None
+        if self.kind == KIND_BOOL:
+            return bool(v)
+        return self.dictionary[v]
+
+    def to_list(self, rows: Optional[Iterable[int]] = None) -> List[Any]:
+        if rows is None:
+            rows = range(len(self))
+        return [self.get(i) for i in rows]
+
+    def take(self, rows: Sequence[int]) -> Column:
+        """
+        Returns:
+            Column: A column of the given rows, string columns share the dictionary.
+        """
+        v = self.values
+        return Column(
+            self.name,
+            self.kind,
+            values=array(v.typecode, [v[i] for i in rows]),
+            dictionary=self.dictionary,
+            numbers=self.numbers
+        )
+
+    def present(self, rows: Iterable[int]) -> List[int]:
+        """
+        Returns:
+            List[int]: The rows which are not missing.
+        """
+        v = self.values
+        if self.kind == KIND_NUMBER:
+            return [i for i in rows if v[i] == v[i]]
+        return [i for i in rows if v[i] != MISSING_CODE]
+
+    def filter(self, op: str, value: str, rows: Iterable[int]) -> List[int]:
+        """
+        Args:
+            op (str): One of the operators of `QueryFilter`.
+            value (str): The value as written in the filter.
+            rows (Iterable[int]): The rows to filter.
+
+        Returns:
+            List[int]: The rows whose value matches, the same as `QueryFilter.matches_metadata(...)`. Missing values never match.
+        """
+        f = QueryFilter(self.name, op, value)
+        v = self.values
+        if self.kind == KIND_NUMBER:
+            # Note: Numbers have no text, so at most one term applies
+            terms = [(term_op, operand) for part, term_op, operand in f.metadata_terms() if part == 'num']
+            if len(terms) == 0:
+                return []
+            term_op, number = terms[0]
+            if term_op == '!=':
+                return [i for i in rows if v[i] == v[i] and v[i] != number]
+            compare = COMPARE[term_op]
+            return [i for i in rows if compare(v[i], number)]
+
+        # Note: Evaluated once per distinct value, the extra slot at the end is indexed by missing values
+        if self.kind == KIND_BOOL:
+            matches = [f.matches_metadata(0, 'false'), f.matches_metadata(1, 'true')]
+        else:
+            matches = [f.matches_metadata(*self._split(code)) for code in range(len(self.dictionary))]
+        table = bytearray(matches) + b'\0'
+        return [i for i in rows if table[v[i]]]
+
+    def sort(self, rows: Sequence[int], ascending: bool = True) -> List[int]:
+        """
+        Returns:
+            List[int]: The rows ordered by value, missing values last. The sort is stable.
+        """
+        v = self.values
+        present = self.present(rows)
+        missing = []
+        if len(present) != len(rows):
+            is_present = set(present)
+            missing = [i for i in rows if i not in is_present]
+
+        if self.kind == KIND_STRING:
+            rank = array('i', bytes(4 * len(self.dictionary)))
+            for r, code in enumerate(sorted(range(len(self.dictionary)), key=self.dictionary.__getitem__)):
+                rank[code] = r
+            key = lambda i: rank[v[i]]
+        else:
+            key = v.__getitem__
+
+        present.sort(key=key, reverse=not ascending)
+        return present + missing
+
+class MetadataTable:
+    """
+    The columns of every snapshot in the log, one row per snapshot in log order.
+
+    ```python
+    >>> table = repo.get_metadata_table()
+    >>> rows = table.select([QueryFilter.parse('metadata.lr<1e-2')], sort='metadata.loss', ascending=True)
+    >>> loss = table.take(rows, ['metadata.loss'])['metadata.loss']
+    >>> numpy.frombuffer(loss.values)
+    ```
+    """
+    def __init__(self):
+        self.columns: Dict[str, Column] = {}
+        self.num_rows = 0
+        self.position: Optional[tuple] = None
+
+    def append(self, record: Dict[str, Any]):
+        """
+        Adds a log record as the last row.
+        """
+        row = self.num_rows
+        fields = [('pit_id', record.get('pit_id')), ('git_hash', record.get('git_hash'))]
+        fields += iter_metadata(record.get('metadata') or {})
+
+        for name, value in fields:
+            kind = Column.kind_of(value)
+            if kind is None:
+                continue
+
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = Column(name, kind)
+            elif column.kind != kind and column.kind != KIND_STRING:
+                column = self.columns[name] = column.as_string()
+
+            # Note: Columns are padded lazily, only when written to or read
+            column.pad(row)
+            if len(column) == row: # Unless the key was already set, e.g. by `{'a': {'b': 1}, 'a.b': 2}`
+                column.append(value)
+        self.num_rows += 1
+
+    def update(self, store) -> int:
+        """
+        Adds the records appended to a `PITLogStore` since the table was last updated, rebuilding the table if it no longer matches the log.
+
+        Returns:
+            int: The number of rows added.
+        """
+        if self.position is not None and not store.is_valid_position(self.position):
+            logger.warning("Rebuilding pit metadata table, it does not match the log")
+            self.__init__()
+
+        added = 0
+        for _, record, end in store.iter_records_since(self.position):
+            self.append(record)
+            self.position = end
+            added += 1
+        return added
+
+    def column(self, name: str) -> Optional[Column]:
+        """
+        Args:
+            name (str): A field, aliases such as `host` are resolved.
+
+        Raises:
+            PITQueryError: If `name` is not a field of snapshots.
+
+        Returns:
+            Optional[Column]: The column, `None` if no snapshot has a value for the field.
+        """
+        name = resolve_field(name)
+        if name in FIELDS and name not in ('pit_id', 'git_hash'):
+            raise PITQueryError("Field '%s' is not recorded in the log, see `pit query`" % name)
+
+        column = self.columns.get(name)
+        if column is not None:
+            column.pad(self.num_rows)
+        return column
+
+    def filter(self, filters: Sequence[QueryFilter], rows: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        Args:
+            filters (Sequence[QueryFilter]): Conditions the rows must meet.
+            rows (Optional[Sequence[int]], optional): The rows to filter, defaults to all rows.
+
+        Raises:
+            PITQueryError: If a filter can not be applied.
+
+        Returns:
+            List[int]: The matching rows, in the order given.
+        """
+        selected = list(range(self.num_rows)) if rows is None else list(rows)
+        for f in filters:
+            if f.field == 'file':
+                raise PITQueryError("Field 'file' is not recorded in the log, see `pit query`")
+            column = self.column(f.field)
+            if column is None:
+                return []
+            selected = column.filter(f.op, f.value, selected)
+        return selected
+
+    def sort(self, rows: Sequence[int], by: str, ascending: bool = True) -> List[int]:
+        """
+        Returns:
+            List[int]: The rows ordered by a field, missing values last.
+        """
+        column = self.column(by)
+        if column is None:
+            return list(rows)
+        return column.sort(rows, ascending=ascending)
+
+    def group(self, rows: Sequence[int], by: str) -> Dict[Any, List[int]]:
+        """
+        Returns:
+            Dict[Any, List[int]]: The rows by their value of a field, `None` for missing values, in order of first appearance.
+        """
+        column = self.column(by)
+        if column is None:
+            return {None: list(rows)} if len(rows) != 0 else {}
+
+        groups: Dict[Any, List[int]] = {}
+        if column.kind == KIND_NUMBER:
+            for i in rows:
+                groups.setdefault(column.get(i), []).append(i)
+            return groups
+
+        # Note: Grouped by code, values are only decoded once per group
+        v = column.values
+        by_code: Dict[int, List[int]] = {}
+        for i in rows:
+            by_code.setdefault(v[i], []).append(i)
+        for code, group in by_code.items():
+            groups[column.get(group[0])] = group
+        return groups
+
+    def select(
+        self,
+        filters: Sequence[QueryFilter] = (),
+        sort: Optional[str] = None,
+        ascending: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[int]:
+        """
+        Filters, sorts and pages rows, the same as `PITQueryIndex.query(...)`.
+
+        Raises:
+            PITQueryError: If a filter or the sort field is invalid.
+
+        Returns:
+            List[int]: The selected rows, newest first unless sorted otherwise.
+        """
+        rows = self.filter(filters, rows=range(self.num_rows - 1, -1, -1))
+        if sort is not None:
+            rows = self.sort(rows, sort, ascending=ascending)
+        elif ascending:
+            rows.reverse()
+        return rows[offset:None if limit is None else offset + limit]
+
+    def take(self, rows: Sequence[int], names: Optional[Iterable[str]] = None) -> Dict[str, Column]:
+        """
+        Args:
+            rows (Sequence[int]): The rows, e.g. from `select(...)`.
+            names (Optional[Iterable[str]], optional): The fields, defaults to all.
+
+        Raises:
+            PITQueryError: If a name is not a field of snapshots.
+
+        Returns:
+            Dict[str, Column]: The columns of the rows, fields without any values are missing.
+        """
+        if names is None:
+            names = list(self.columns.keys())
+
+        columns = {}
+        for name in names:
+            column = self.column(name)
+            if column is not None:
+                columns[column.name] = column.take(rows)
+        return columns
+
+    def save(self, path: str):
+        """
+        Writes the table to a cache file, see `load(...)`.
+        """
+        header = {
+            'byteorder': sys.byteorder,
+            'position': self.position,
+            'num_rows': self.num_rows,
+            'columns': [],
+        }
+        buffers = []
+        for column in self.columns.values():
+            header['columns'].append({
+                'name': column.name,
+                'kind': column.kind,
+                'itemsize': column.values.itemsize,
+                'length': len(column),
+                'dictionary': column.dictionary if column.kind == KIND_STRING else None,
+                'numbers': sorted(column.numbers),
+            })
+            buffers.append(column.values.tobytes())
+
+        data = json.dumps(header).encode()
+        atomic_write(path, CACHE_HEADER.pack(CACHE_MAGIC, len(data)) + data + b''.join(buffers))
+
+    @classmethod
+    def load(cls, path: str) -> MetadataTable:
+        """
+        Reads a table written by `save(...)`.
+
+        Returns:
+            MetadataTable: The table, empty if the file does not exist or is invalid.
+        """
+        table = cls()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return table
+
+        try:
+            magic, size = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC:
+                raise ValueError("Bad magic")
+            header = json.loads(data[CACHE_HEADER.size:CACHE_HEADER.size + size])
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError("Byte order mismatch")
+
+            pos = CACHE_HEADER.size + size
+            columns = {}
+            for c in header['columns']:
+                values = array(TYPECODES[c['kind']])
+                if values.itemsize != c['itemsize']:
+                    raise ValueError("Item size mismatch")
+                end = pos + c['length'] * values.itemsize
+                if end > len(data):
+                    raise ValueError("Truncated")
+                values.frombytes(data[pos:end])
+                pos = end
+                columns[c['name']] = Column(
+                    c['name'],
+                    c['kind'],
+                    values=values,
+                    dictionary=c['dictionary'],
+                    numbers=set(c['numbers'])
+                )
+        except (struct.error, ValueError, KeyError, TypeError) as err:
+            logger.warning("Discarding invalid pit metadata cache: %s" % err)
+            return table
+
+        table.columns = columns
+        table.num_rows = header['num_rows']
+        table.position = None if header['position'] is None else tuple(header['position'])
+        return table
@@ -0,0 +1,173 @@
+"""
+Filter expressions over snapshots, shared by `pit query` (see `point_in_time.query_index`) and `pit compare` (see `point_in_time.metadata_table`).
+"""
+from __future__ import annotations
+import re
+import json
+import operator
+from dataclasses import dataclass
+from datetime import datetime
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from point_in_time.errors import PITQueryError
+
+__all__ = ['QueryFilter', 'resolve_field', 'flatten_metadata']
+
+FIELDS = ('pit_id', 'git_hash', 'date', 'origin')
+"""
+Fields of snapshots other than their metadata and changed files.
+"""
+ALIASES = {
+    'hash': 'git_hash',
+    'host': 'metadata.hostname',
+    'user': 'metadata.username',
+}
+OPERATORS = ('=', '!=', '<', '<=', '>', '>=', '~')
+COMPARE: Dict[str, Callable[[Any, Any], bool]] = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '~': fnmatchcase,
+}
+FILTER_RE = re.compile(r'^\s*(?P<field>[A-Za-z_][\w.\-]*)\s*(?P<op>!=|<=|>=|=|<|>|~)\s*(?P<value>.*?)\s*$')
+
+def resolve_field(field: str, allow_file: bool = False) -> str:
+    """
+    Args:
+        field (str): A field name as written by the user, e.g. `host`.
+        allow_file (bool, optional): Accept the `file` field, which can be filtered on but not sorted by.
+
+    Raises:
+        PITQueryError: If `field` is not a field of snapshots.
+
+    Returns:
+        str: The field with aliases resolved, e.g. `metadata.hostname`.
+    """
+    field = ALIASES.get(field, field)
+    if field in FIELDS or (allow_file and field == 'file'):
+        return field
+    if field.startswith('metadata.') and len(field) > len('metadata.'):
+        return field
+    raise PITQueryError("Unknown query field '%s'" % field)
+
+@dataclass
+class QueryFilter:
+    """
+    A condition on snapshots, written `<field><op><value>`, e.g. `metadata.lr>1e-3`.
+
+    Fields are `pit_id`, `hash`, `date` (compared to ISO 8601 dates, local time unless an offset is given), `origin` (`user@host`), `file` (a changed file), `host` and `user` (short for `metadata.hostname` and `metadata.username`) or `metadata.<key>`.
+
+    Operators are `=`, `!=`, `<`, `<=`, `>`, `>=` and `~`, which matches a glob pattern such as `file~src/*.py`. Values which parse as numbers are compared numerically.
+
+    Metadata values are compared by kind, see `metadata_terms()`. A filter which does not apply to a value's kind does not match it, e.g. `metadata.lr~0.1*` matches no numbers and `metadata.lr=abc` matches no numbers, rather than being an error.
+    """
+    field: str
+    op: str
+    value: str
+
+    @classmethod
+    def parse(cls, expression: str) -> QueryFilter:
+        """
+        Raises:
+            PITQueryError: If the expression is invalid.
+        """
+        match = FILTER_RE.match(expression)
+        if match is None:
+            raise PITQueryError("Invalid query filter '%s', expected <field><op><value>" % expression)
+
+        return cls(
+            field=resolve_field(match['field'], allow_file=True),
+            op=match['op'],
+            value=match['value']
+        )
+
+    def metadata_terms(self) -> List[Tuple[str, str, Any]]:
+        """
+        How the filter applies to a metadata value split into a number and text, as by `flatten_metadata(...)`. A value matches when any of the terms does, parts which are `None` never match. Shared by `pit query` and `pit compare` so both select the same snapshots.
+
+        ```python
+        >>> QueryFilter.parse('metadata.version=1.0').metadata_terms()
+        [('num', '=', 1.0), ('text', '=', '1.0')]
+        ```
+
+        Returns:
+            List[Tuple[str, str, Any]]: The part compared (`num` or `text`), the operator and the operand of each term.
+        """
+        number = parse_number(self.value) if self.op != '~' else None
+        if number is None:
+            return [('text', self.op, self.value)]
+        if self.op == '=':
+            # Note: Also matches strings spelled the same, e.g. a version recorded as '1.0'
+            return [('num', '=', number), ('text', '=', self.value)]
+        return [('num', self.op, number)]
+
+    def matches_metadata(self, num: Optional[float], text: Optional[str]) -> bool:
+        """
+        Returns:
+            bool: Whether a metadata value, split as by `flatten_metadata(...)`, matches the filter.
+        """
+        for part, op, operand in self.metadata_terms():
+            value = num if part == 'num' else text
+            if value is not None and COMPARE[op](value, operand):
+                return True
+        return False
+
+def parse_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_date(value: str) -> float:
+    """
+    Raises:
+        PITQueryError: If `value` is not an ISO 8601 date.
+    """
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise PITQueryError("Invalid date '%s', expected ISO 8601 e.g. 2024-03-01 or 2024-03-01T12:00" % value)
+
+def iter_metadata(metadata: Any, prefix: str = 'metadata') -> Iterator[Tuple[str, Any]]:
+    """
+    Flattens nested metadata to dotted keys, `{'opt': {'lr': 0.1}}` is `metadata.opt.lr`.
+
+    Yields:
+        Tuple[str, Any]: The key and value of each leaf, values other than dictionaries are leaves.
+    """
+    if isinstance(metadata, dict):
+        for key, value in metadata.items():
+            yield from iter_metadata(value, f'{prefix}.{key}')
+    else:
+        yield prefix, metadata
+
+def flatten_metadata(
+    metadata: Any,
+    prefix: str = 'metadata'
+) -> Iterator[Tuple[str, Optional[float], Optional[str]]]:
+    """
+    Flattens nested metadata to dotted keys, with values split into numbers and text.
+
+    ```python
+    >>> list(flatten_metadata({'opt': {'lr': 0.1}, 'tag': 'sweep'}))
+    [('metadata.opt.lr', 0.1, None), ('metadata.tag', None, 'sweep')]
+    ```
+
+    Yields:
+        Tuple[str, Optional[float], Optional[str]]: The key, and its value as a number (booleans as 0 or 1) and as text (booleans as `true` or `false`, other values which are not strings as JSON).
+    """
+    for key, value in iter_metadata(metadata, prefix):
+        if isinstance(value, bool):
+            yield key, int(value), 'true' if value else 'false'
+        elif isinstance(value, (int, float)):
+            yield key, value, None
+        elif isinstance(value, str):
+            yield key, None, value
+        elif value is None:
+            yield key, None, None
+        else:
+            yield key, None, json.dumps(value)
@@ -0,0 +1,313 @@
+"""
+SQLite index of the log for querying snapshots by their metadata, used by `pit query`:
+
+```text
+$ pit query 'metadata.lr>1e-3' 'host=gpu-01' 'date>=2024-03-01' --sort metadata.loss --asc
+```
+
+The index lives in `.pit/query.sqlite` and is only created once queried. It records the log position it has indexed up to, so each query first indexes just the snapshots appended since (see `PITQueryIndex.sync`). Each snapshot's metadata is flattened to dotted keys (`{'opt': {'lr': 0.1}}` is `metadata.opt.lr`) and stored with indexes on key and value, so filters and sorts are indexed lookups rather than scans of the log.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import itertools
+from typing import Any, List, Optional, Sequence, Tuple
+
+from pydantic_core import ValidationError
+
+from point_in_time.constants.main import PIT_QUERY_INDEX_NAME
+from point_in_time.errors import PITLogLoadError
+from point_in_time.query_filter import (
+    FIELDS,
+    QueryFilter,
+    flatten_metadata,
+    parse_date,
+    resolve_field
+)
+from point_in_time.repo import PITRepo, PITLogEntry, SnapshotDetails
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['PITQueryIndex', 'QueryFilter', 'flatten_metadata']
+
+logger = get_logger(__name__)
+
+SCHEMA_VERSION = 1
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq INTEGER PRIMARY KEY,
+    pit_id TEXT NOT NULL UNIQUE,
+    git_hash TEXT NOT NULL,
+    date REAL,
+    origin TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_git_hash ON snapshots (git_hash);
+CREATE INDEX IF NOT EXISTS snapshots_date ON snapshots (date);
+CREATE INDEX IF NOT EXISTS snapshots_origin ON snapshots (origin);
+
+CREATE TABLE IF NOT EXISTS files (
+    seq INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path, seq);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    seq INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    num REAL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS metadata_num ON metadata (key, num, seq);
+CREATE INDEX IF NOT EXISTS metadata_text ON metadata (key, text, seq);
+CREATE INDEX IF NOT EXISTS metadata_seq ON metadata (seq, key);
+
+CREATE TABLE IF NOT EXISTS state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+'''
+"""
+`seq` orders snapshots as in the log. Metadata values are stored in `num` when numeric (booleans as 0 or 1) and in `text` otherwise, booleans also as `true` or `false` in `text`.
+"""
+
+SYNC_BATCH_SIZE = 1000
+"""
+Snapshots indexed per transaction, an interrupted sync keeps the batches it completed.
+"""
+
+SQL_OPERATORS = {
+    '=': '=',
+    '!=': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+    '~': 'GLOB',
+}
+
+class PITQueryIndex:
+    """
+    The query index of a repository, see the module documentation.
+
+    ```python
+    >>> index = PITQueryIndex(repo)
+    >>> index.sync()
+    >>> index.query([QueryFilter.parse('metadata.lr>1e-3')], sort='date')
+    ['amber-heron-1a2b3c4', ...]
+    ```
+
+    The index is derived from the log and can be deleted at any time, it is rebuilt when next queried.
+    """
+    def __init__(self, repo: PITRepo):
+        """
+        Args:
+            repo (PITRepo): The repository to index.
+        """
+        self._repo = repo
+        self.path = os.path.join(repo._path, PIT_QUERY_INDEX_NAME)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Note: Transactions are managed explicitly, see `sync`
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Note: Read again under the write lock, another process may have created the schema meanwhile
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version != SCHEMA_VERSION:
+                    if version != 0:
+                        logger.info("Rebuilding pit query index for schema version %d" % SCHEMA_VERSION)
+                        for table in ('snapshots', 'files', 'metadata', 'state'):
+                            conn.execute(f'DROP TABLE IF EXISTS {table}')
+                    for statement in SCHEMA.split(';'):
+                        if statement.strip():
+                            conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return conn
+
+    def sync(self) -> int:
+        """
+        Indexes the snapshots appended to the log since the last sync. Safe to call from many processes at once, batches are indexed in transactions which continue from the position the previous one committed.
+
+        Raises:
+            PITLogLoadError: If the log is malformed.
+
+        Returns:
+            int: The number of snapshots indexed.
+        """
+        store = self._repo._open_log()
+        conn = self._connect()
+        try:
+            indexed = 0
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    n = self._sync_batch(conn, store)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                indexed += n
+                if n < SYNC_BATCH_SIZE:
+                    break
+        finally:
+            conn.close()
+
+        if indexed != 0:
+            logger.debug("Indexed %d snapshots for queries" % indexed)
+        return indexed
+
+    def _sync_batch(self, conn: sqlite3.Connection, store) -> int:
+        row = conn.execute('SELECT segment, offset FROM state').fetchone()
+        position = None
+        if row is not None:
+            position = (row[0], row[1])
+            if not store.is_valid_position(position):
+                logger.warning("Rebuilding pit query index, it does not match the log")
+                for table in ('snapshots', 'files', 'metadata'):
+                    conn.execute(f'DELETE FROM {table}')
+                position = None
+
+        records = store.iter_records_since(position)
+        try:
+            batch = list(itertools.islice(records, SYNC_BATCH_SIZE))
+        finally:
+            records.close()
+        if len(batch) == 0:
+            return 0
+
+        entries = []
+        for _, record, _ in batch:
+            try:
+                entries.append(PITLogEntry.model_validate(record))
+            except ValidationError as err:
+                raise PITLogLoadError("Malformed pit log: %s" % str(err))
+
+        for e, details in zip(entries, self._resolve_details(entries)):
+            origin = None
+            if 'username' in e.metadata and 'hostname' in e.metadata:
+                origin = f'{e.metadata["username"]}@{e.metadata["hostname"]}'
+
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO snapshots (pit_id, git_hash, date, origin) VALUES (?, ?, ?, ?)',
+                (e.pit_id, e.git_hash, None if details is None else details.date.timestamp(), origin)
+            )
+            if cursor.rowcount == 0:
+                continue # Already indexed, the log does not allow duplicate ids
+            seq = cursor.lastrowid
+
+            if details is not None:
+                conn.executemany(
+                    'INSERT INTO files (seq, path) VALUES (?, ?)',
+                    ((seq, path) for path in details.files_changed)
+                )
+            conn.executemany(
+                'INSERT INTO metadata (seq, key, num, text) VALUES (?, ?, ?, ?)',
+                ((seq, key, num, text) for key, num, text in flatten_metadata(e.metadata))
+            )
+
+        segment, offset = batch[-1][2]
+        conn.execute(
+            'INSERT OR REPLACE INTO state (id, segment, offset) VALUES (0, ?, ?)',
+            (segment, offset)
+        )
+        return len(batch)
+
+    def _resolve_details(self, entries: List[PITLogEntry]) -> List[Optional[SnapshotDetails]]:
+        try:
+            return list(self._repo.iter_details(entries))
+        except ValueError:
+            pass
+
+        # Note: Some commit can not be resolved, e.g. pruned by `git gc`, those snapshots are indexed without a date or files
+        details = []
+        for e in entries:
+            try:
+                details.append(self._repo.get_details(e))
+            except ValueError as err:
+                logger.warning("Indexing snapshot %s without commit details: %s" % (e.pit_id, err))
+                details.append(None)
+        return details
+
+    def query(
+        self,
+        filters: Sequence[QueryFilter] = (),
+        sort: Optional[str] = None,
+        ascending: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> List[str]:
+        """
+        Finds snapshots matching all filters. Call `sync()` first to include recent snapshots.
+
+        Args:
+            filters (Sequence[QueryFilter], optional): Conditions the snapshots must meet.
+            sort (Optional[str], optional): Field to sort by (see `QueryFilter`, except `file`), defaults to the order of the log.
+            ascending (bool, optional): Sort in ascending order, by default the newest or largest are first.
+            limit (Optional[int], optional): Return at most this many snapshots.
+            offset (int, optional): Number of matching snapshots to skip.
+
+        Raises:
+            PITQueryError: If a filter or the sort field is invalid.
+
+        Returns:
+            List[str]: The pit ids of the matching snapshots.
+        """
+        conditions = []
+        params: List[Any] = []
+        for f in filters:
+            condition, values = self._condition(f)
+            conditions.append(condition)
+            params += values
+
+        direction = 'ASC' if ascending else 'DESC'
+        join = ''
+        join_params: List[Any] = []
+        if sort is None:
+            order = f's.seq {direction}'
+        else:
+            sort = resolve_field(sort)
+            if sort in FIELDS:
+                order = f's.{sort} {direction}, s.seq {direction}'
+            else:
+                join = 'LEFT JOIN metadata m ON m.seq = s.seq AND m.key = ?'
+                join_params.append(sort)
+                order = f'm.num {direction}, m.text {direction}, s.seq {direction}'
+
+        sql = f'SELECT s.pit_id FROM snapshots s {join}'
+        if len(conditions) != 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order} LIMIT ? OFFSET ?'
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                sql,
+                join_params + params + [-1 if limit is None else limit, offset]
+            ).fetchall()
+        finally:
+            conn.close()
+        return [r[0] for r in rows]
+
+    @staticmethod
+    def _condition(f: QueryFilter) -> Tuple[str, List[Any]]:
+        op = SQL_OPERATORS[f.op]
+
+        if f.field in FIELDS:
+            value = parse_date(f.value) if f.field == 'date' and f.op != '~' else f.value
+            return f's.{f.field} {op} ?', [value]
+
+        if f.field == 'file':
+            return f's.seq IN (SELECT seq FROM files WHERE path {op} ?)', [f.value]
+
+        terms = f.metadata_terms()
+        matches = ' OR '.join(f'{part} {SQL_OPERATORS[term_op]} ?' for part, term_op, _ in terms)
+        return f's.seq IN (SELECT seq FROM metadata WHERE key = ? AND ({matches}))', [f.field] + [operand for _, _, operand in terms]
@@ -1,15 +1,15 @@
 from __future__ import annotations
 import os
 import re
-import json
+import itertools
+import threading
 import subprocess
 from datetime import datetime
 from dataclasses import dataclass
-from json import JSONDecodeError
-from tempfile import NamedTemporaryFile
-from typing import Dict, List, Set, Tuple, Union, Optional, Any
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import Dict, List, Set, Tuple, Union, Optional, Any, Iterable, Iterator
 
-from pydantic import BaseModel, TypeAdapter
+from pydantic import BaseModel
 from pydantic_core import ValidationError
 from colorama import (
     just_fix_windows_console,
@@ -19,36 +19,72 @@ from unique_names_generator import get_random_name
 
 from point_in_time.constants.main import (
     PIT_LOG_NAME,
-    PIT_INCLUDE_NAME
+    PIT_LOG_DIR_NAME,
+    PIT_INCLUDE_NAME,
+    PIT_DETAILS_CACHE_NAME,
+    PIT_INCLUDE_CACHE_NAME,
+    PIT_CONFIG_NAME,
+    PIT_OBJECTS_DIR_NAME,
+    PIT_METADATA_CACHE_NAME,
+    PIT_WORKTREE_CACHE_NAME,
+    PIT_SNAPSHOT_ENGINES
 )
 from point_in_time.errors import (
     PITInternalError,
     PITRepoExistsError,
     PITLogLoadError,
-    PITIncludeLoadError,
     PITStashFailedError,
     PITStashPopFailedError,
+    PITSnapshotFailedError,
+    PITSnapshotCancelledError,
     PITCommitParseFailed,
-    PITLogCollision
+    PITLogCollision,
+    PITMaterializeError,
+    PITIdNotFoundError
 )
 from point_in_time.utils.main import (
-    status_filter_pathspec,
-    code_to_status_string
+    GitStatus,
+    code_to_status_string,
+    flatten_status_paths
 )
 from point_in_time.utils.logging import get_logger
-from point_in_time.utils.fs import WithBackUp
+from point_in_time.utils.timing import PhaseTimer
+from point_in_time.log_store import PITLogStore
+from point_in_time.details_cache import CommitDetailsCache
+from point_in_time.include import IncludeSpec, include_cache_key, load_include_spec
+from point_in_time.config import PITConfig, load_config
+from point_in_time.metadata_table import MetadataTable
+from point_in_time.worktree_cache import WorktreeCache, WorktreeScan
+from point_in_time.chunk_store import ChunkStore, POINTER_MAX_BYTES, is_large_file, parse_pointer
+from point_in_time.blob_hasher import HashedBlobs, hash_blobs
+from point_in_time.size_report import SizeReport, scan_sizes
 from point_in_time.utils.git import (
     GitCommitDetails,
-    git_commit_details
+    GitCommitDetailsBatch,
+    git_commit_details,
+    git_commit_details_batch,
+    git_rev_parse_verify,
+    git_write_tree,
+    git_commit_tree,
+    git_commit_parents,
+    git_ls_files_others,
+    git_ls_files_ignored_directories,
+    git_ls_tree,
+    git_cat_file_batch
 )
 
-__all__ = ['PITRepo']
+__all__ = ['PITRepo', 'PreparedSnapshot', 'SpeculativeSnapshot']
 just_fix_windows_console()
 
 logger = get_logger(__name__)
 
 RE_STASH_POP_COMMIT_HASH = r"\([0-9a-z]+\)$"
 
+SNAPSHOT_ENGINES = PIT_SNAPSHOT_ENGINES
+"""
+Engines accepted by `PITRepo.snapshot(...)`.
+"""
+
 class PITRepo:
     @classmethod
     def create_repo(cls, path: str) -> PITRepo:
@@ -73,13 +109,10 @@ class PITRepo:
         os.mkdir(path)
 
         # Initialize files
-        log_data = {}
-        log_path = os.path.join(
+        PITLogStore(os.path.join(
             path,
-            PIT_LOG_NAME
-        )
-        with open(log_path, 'w') as f:
-            json.dump(log_data, f)
+            PIT_LOG_DIR_NAME
+        )).create()
 
         include_path = os.path.join(
             path,
@@ -92,91 +125,414 @@ class PITRepo:
 
         return cls(path)
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, persistent_git: bool = False):
+        """
+        Args:
+            path (str): Path to the `.pit/` directory.
+            persistent_git (bool, optional): Keep a single git process for resolving commit details open between calls, for long running processes such as the daemon. Release it with `close()`.
+        """
         self._path = path
-        self._log_path = os.path.join(
+        # Note: Every git call runs in the toplevel explicitly, so the process working directory is never relied upon or changed
+        self._toplevel = os.path.dirname(os.path.abspath(path))
+        self._legacy_log_path = os.path.join(
             self._path,
             PIT_LOG_NAME
         )
+        self._log_store = PITLogStore(
+            os.path.join(self._path, PIT_LOG_DIR_NAME),
+            indexes=('tree_hash',)
+        )
         self._include_path = os.path.join(
             self._path,
             PIT_INCLUDE_NAME
         )
+        self._details_cache = CommitDetailsCache(os.path.join(
+            self._path,
+            PIT_DETAILS_CACHE_NAME
+        ))
+        self._include_cache_path = os.path.join(
+            self._path,
+            PIT_INCLUDE_CACHE_NAME
+        )
+        self._config_path = os.path.join(
+            self._path,
+            PIT_CONFIG_NAME
+        )
+        self._chunk_store = ChunkStore(os.path.join(
+            self._path,
+            PIT_OBJECTS_DIR_NAME
+        ))
+        self._metadata_cache_path = os.path.join(
+            self._path,
+            PIT_METADATA_CACHE_NAME
+        )
+        self._metadata_table: Optional[MetadataTable] = None
+        self._worktree_cache_path = os.path.join(
+            self._path,
+            PIT_WORKTREE_CACHE_NAME
+        )
+        self._include_spec: Optional[IncludeSpec] = None
+        self._include_spec_key: Optional[Tuple[int, int, int]] = None
+        self._log_cache: Optional[Tuple[Tuple, Dict[str, PITLogEntry]]] = None
+        self._persistent_git = persistent_git
+        self._git_details: Optional[GitCommitDetailsBatch] = None
+
+    def close(self):
+        """
+        Releases the persistent git process, if any.
+        """
+        if self._git_details is not None:
+            self._git_details.close()
+            self._git_details = None
+
+    def _git_details_batch(self) -> GitCommitDetailsBatch:
+        if self._git_details is None:
+            self._git_details = GitCommitDetailsBatch(cwd=self._toplevel)
+        return self._git_details
+
+    def _open_log(self) -> PITLogStore:
+        if not self._log_store.exists():
+            if os.path.isfile(self._legacy_log_path):
+                # One time migration from the single file log format
+                self._log_store.migrate_legacy(self._legacy_log_path)
+            elif not self._log_store.exists(): # Unless migrated by another process meanwhile
+                raise PITLogLoadError("Malformed pit directory: Log does not exist")
+
+        return self._log_store
 
     def _load_log(self) -> Dict[str, PITLogEntry]:
-        if not os.path.isfile(self._log_path):
-            raise PITLogLoadError("Malformed pit directory: Log file does not exist")
+        store = self._open_log()
+
+        # Note: The parsed log is reused for as long as nothing is appended
+        state = store.state()
+        if self._log_cache is not None and self._log_cache[0] == state:
+            return dict(self._log_cache[1])
+
+        log = {}
+        for record in store:
+            try:
+                e = PITLogEntry.model_validate(record)
+            except ValidationError as err:
+                raise PITLogLoadError("Malformed pit log: %s" % str(err))
+            log[e.pit_id] = e
+
+        self._log_cache = (state, log)
+        return dict(log)
+
+    def iter_log(
+        self,
+        reverse: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Iterator[PITLogEntry]:
+        """
+        Streams log entries, reading and validating only those produced. Newest first by default, in which case the log is read backwards from its end.
+
+        ```python
+        >>> page = list(repo.iter_log(offset=50, limit=50)) # The second page of `pit log`
+        ```
+
+        Args:
+            reverse (bool, optional): Yield the newest entries first.
+            offset (int, optional): Number of entries to skip.
+            limit (Optional[int], optional): Yield at most this many entries.
+
+        Raises:
+            PITLogLoadError: If an entry produced is malformed.
 
+        Yields:
+            PITLogEntry: The log entries.
+        """
+        store = self._open_log()
+        records = store.iter_records_reverse() if reverse else store.iter_records()
+        stop = None if limit is None else offset + limit
         try:
-            with open(self._log_path, 'r') as f:
-                log_data = json.load(f)
-        except JSONDecodeError as err:
-            raise PITLogLoadError("Malformed pit log: %s" % err.msg)
+            for _, record in itertools.islice(records, offset, stop):
+                try:
+                    yield PITLogEntry.model_validate(record)
+                except ValidationError as err:
+                    raise PITLogLoadError("Malformed pit log: %s" % str(err))
+        finally:
+            # Note: Releases the open segment as soon as the consumer stops
+            records.close()
+
+    def get_metadata_table(self) -> MetadataTable:
+        """
+        The columnar projection of the log's metadata, see `point_in_time.metadata_table`. Loaded from its cache file and brought up to date with the log, the cache is rewritten when snapshots were added.
+
+        Returns:
+            MetadataTable: The table, owned by this repository and updated in place by later calls.
+        """
+        store = self._open_log()
+        if self._metadata_table is None:
+            self._metadata_table = MetadataTable.load(self._metadata_cache_path)
+
+        if self._metadata_table.update(store) != 0:
+            try:
+                self._metadata_table.save(self._metadata_cache_path)
+            except OSError as err:
+                logger.debug("Unable to write pit metadata cache: %s" % err)
+        return self._metadata_table
+
+    def get_entry(self, pit_id: str) -> Optional[PITLogEntry]:
+        """
+        Finds a single log entry through the log index, without reading or validating the rest of the log.
+
+        Raises:
+            PITLogLoadError: If the entry is malformed.
+
+        Returns:
+            Optional[PITLogEntry]: The entry, `None` if the id does not exist in the log.
+        """
+        record = self._open_log().get(pit_id)
+        if record is None:
+            return None
 
         try:
-            return log_file.validate_python(log_data)
+            return PITLogEntry.model_validate(record)
         except ValidationError as err:
             raise PITLogLoadError("Malformed pit log: %s" % str(err))
 
     def append_log(self, e: PITLogEntry):
-        log = self._load_log()
-
-        if e.pit_id in log:
-            raise PITLogCollision("Pit name collision during log append.")
-
-        log[e.pit_id] = e
+        """
+        Appends an entry to the log, safe to call from many processes at once (see `PITLogStore.group_append`).
 
-        with WithBackUp(self._log_path):
-            with open(self._log_path, 'wb') as f:
-                f.write(log_file.dump_json(
-                    log,
-                    indent=2
-                ))
+        Raises:
+            PITLogCollision: If an entry with the same pit id already exists.
+        """
+        log = self._open_log()
+        # Note: Unset optional fields are left out, so the log reads the same for versions without them
+        log.group_append(e.model_dump(mode='json', exclude_none=True))
 
     def get_details(self, e: PITLogEntry) -> SnapshotDetails:
-        git_details = git_commit_details(e.git_hash)
+        git_details = self._details_cache.get(e.git_hash)
+        if git_details is None:
+            if self._persistent_git:
+                git_details = self._git_details_batch().details(e.git_hash)
+            else:
+                git_details = git_commit_details(e.git_hash, cwd=self._toplevel)
+            self._details_cache.put(git_details)
 
         return SnapshotDetails(
             _log_entry=e,
             _git_details=git_details
         )
 
-    def get_snapshot_paths(self) -> Dict[str, Set[Union[str, Tuple[str]]]]:
-        with open(self._include_path, 'r') as f:
-            lines = f.read()
+    def iter_details(self, entries: Iterable[PITLogEntry]) -> Iterator[SnapshotDetails]:
+        """
+        Resolve details for many log entries. Entries missing from the details cache are resolved using a single git process, details are yielded as they are parsed so consumers can start output immediately.
+
+        Args:
+            entries (Iterable[PITLogEntry]): The log entries to collect details on.
 
-        force_comments = list(re.finditer(r"^#\s*[fF]orce\s*$", lines))
-        if len(force_comments) > 1:
-            raise PITIncludeLoadError("Found multiple 'force' comments in include file. Only one 'force' section can be included.")
-        elif len(force_comments) == 0:
-            included = status_filter_pathspec(lines.split('\n'))
+        Yields:
+            SnapshotDetails: The details, in the same order as `entries`.
+        """
+        entries = list(entries)
+        cached = {}
+        for e in entries:
+            d = self._details_cache.get(e.git_hash)
+            if d is not None:
+                cached[e.git_hash] = d
 
-            # No force block so remove those paths
-            del included['!!']
+        misses = [e.git_hash for e in entries if e.git_hash not in cached]
+        resolved = []
+        if self._persistent_git and len(misses) != 0:
+            git_details = self._git_details_batch().iter_details(misses)
         else:
-            include_lines = lines[:force_comments[0].span[0]]
-            force_lines = lines[-force_comments[0].span[1]:]
+            git_details = git_commit_details_batch(misses, cwd=self._toplevel)
+        try:
+            for e in entries:
+                d = cached.get(e.git_hash)
+                if d is None:
+                    d = next(git_details)
+                    resolved.append(d)
+
+                yield SnapshotDetails(
+                    _log_entry=e,
+                    _git_details=d
+                )
+        finally:
+            git_details.close()
+            if self._persistent_git and len(resolved) != len(misses):
+                # Unread output would be mistaken for later requests, start a fresh process instead
+                self.close()
+            self._details_cache.put_many(resolved)
+
+    def _load_include(self) -> IncludeSpec:
+        """
+        Loads the compiled include file. The result is kept in memory and in an on disk cache, both are reused until the include file's mtime or size changes.
+
+        Raises:
+            PITIncludeLoadError: If the include file has multiple force sections.
+
+        Returns:
+            IncludeSpec: The compiled include file.
+        """
+        key = include_cache_key(self._include_path)
+        if self._include_spec is not None and self._include_spec_key == key:
+            return self._include_spec
+
+        self._include_spec = load_include_spec(
+            self._include_path,
+            cache_path=self._include_cache_path,
+            key=key
+        )
+        self._include_spec_key = key
+        return self._include_spec
+
+    def _load_config(self) -> PITConfig:
+        """
+        Raises:
+            PITConfigLoadError: If the config file is not valid.
+        """
+        return load_config(self._config_path)
+
+    def get_status(self, scoped: bool = False) -> GitStatus:
+        """
+        Capture the git status of the worktree. The result can be passed to the other status methods so a command only scans the worktree once.
+
+        Ignored paths are only collected when the include file has a force section, and only under the paths that section can match.
+
+        Args:
+            scoped (bool, optional): Limit the scan to paths which can match the include file (see `pathspec_to_git_pathspecs`). A scoped status is enough for `get_snapshot_paths`, but not for `get_snapshot_paths_status` which also lists paths which are not included.
+
+        Returns:
+            GitStatus: The captured status.
+        """
+        include = self._load_include()
 
-            included = status_filter_pathspec(include_lines.split('\n'))
+        pathspecs = None
+        if scoped:
+            pathspecs = include.include_pathspecs
+        git_status = GitStatus.collect(
+            pathspecs=pathspecs,
+            ignored='no',
+            cwd=self._toplevel
+        )
+
+        if include.force is not None:
+            # Note: Individual files are listed so force patterns can select files inside of ignored directories
+            git_status.merge_ignored(GitStatus.collect(
+                pathspecs=include.force_pathspecs,
+                ignored='traditional',
+                untracked='all',
+                cwd=self._toplevel
+            ))
+
+        return git_status
+
+    def get_snapshot_paths(
+        self,
+        git_status: Optional[GitStatus] = None,
+        scoped_status: Optional[GitStatus] = None
+    ) -> Dict[str, Set[Union[str, Tuple[str]]]]:
+        """
+        Evaluate the include file, and its force section, against the git status.
 
-            # Replace ignored files with those matched by the force block
-            del included['!!']
-            included['!!'] = status_filter_pathspec(force_lines.split('\n'))['!!']
+        Untracked directories which a full scan collapses (`dir/`) but the include file only partly matches are expanded to their included files, so the result is the same for a scoped and a full status.
+
+        Args:
+            git_status (Optional[GitStatus], optional): A previously captured status, if not provided a scoped status is collected.
+            scoped_status (Optional[GitStatus], optional): A scoped status to expand the directories of an unscoped `git_status` with, collected if needed and not provided.
+
+        Raises:
+            PITIncludeLoadError: If the include file has multiple force sections.
+
+        Returns:
+            Dict[str, Set[Union[str, Tuple[str]]]]: The paths to include in a snapshot keyed by git short form status code. Ignored paths (`!!`) are only present when matched by the force section.
+        """
+        if git_status is None:
+            git_status = self.get_status(scoped=True)
+
+        include = self._load_include()
+        included = self._filter_included(git_status, include)
+
+        directories = self._partly_included_directories(git_status, included, include)
+        if len(directories) != 0:
+            if scoped_status is None:
+                scoped_status = GitStatus.collect(
+                    pathspecs=include.include_pathspecs,
+                    ignored='no',
+                    cwd=self._toplevel
+                )
+            self._expand_directories(included, directories, scoped_status, include)
+
+        # Ignored files are only included through the force section
+        included.pop('!!', None)
+
+        if include.force is not None:
+            forced = git_status.filter_pathspec(include.force).get('!!', [])
+            if len(forced) != 0:
+                included['!!'] = forced
 
         return included
 
+    @staticmethod
+    def _filter_included(
+        git_status: GitStatus,
+        include: IncludeSpec
+    ) -> Dict[str, List[Union[str, Tuple[str]]]]:
+        if include.include_exact and git_status.pathspecs == include.include_pathspecs:
+            # Git already selected exactly the included paths
+            return git_status.all_paths()
+        return git_status.filter_pathspec(include.include)
+
+    @staticmethod
+    def _partly_included_directories(
+        git_status: GitStatus,
+        included: Dict[str, List[Union[str, Tuple[str]]]],
+        include: IncludeSpec
+    ) -> List[str]:
+        """
+        A full scan collapses untracked directories (`dir/`), but when scanning with the include pathspecs git lists the files of those only partly matched. Such directories must be expanded so both scans include the same files.
+
+        Returns:
+            List[str]: The collapsed untracked directories of an unscoped status which are not included as a whole, empty if the include file has no pathspecs to expand them with.
+        """
+        if git_status.pathspecs is not None or include.include_pathspecs is None:
+            return []
+
+        matched = set(included.get('??', []))
+        return [
+            p for p in git_status.files_by_code.get('??', [])
+            if isinstance(p, str) and p.endswith('/') and p not in matched
+        ]
+
+    @staticmethod
+    def _expand_directories(
+        included: Dict[str, List[Union[str, Tuple[str]]]],
+        directories: List[str],
+        scoped_status: GitStatus,
+        include: IncludeSpec
+    ):
+        """
+        Adds the included untracked paths of a scoped status which are inside of `directories`, see `_partly_included_directories`.
+        """
+        expanded = [
+            p for p in PITRepo._filter_included(scoped_status, include).get('??', [])
+            if any(p.startswith(d) for d in directories)
+        ]
+        if len(expanded) != 0:
+            included['??'] = sorted(set(included.get('??', [])) | set(expanded))
+
     def get_snapshot_paths_status(
         self,
         snapshot_paths: Optional[Dict[str, Set[Union[str, Tuple[str]]]]] = None,
         cli: bool = False,
+        git_status: Optional[GitStatus] = None
     ) -> List[str]:
+        if git_status is None or git_status.pathspecs is not None:
+            # The paths not included can only be found from a full scan
+            git_status = self.get_status()
+
         if snapshot_paths is None:
-            included = self.get_snapshot_paths()
+            included = self.get_snapshot_paths(git_status)
         else:
             included = snapshot_paths
 
-        # Match all paths to get a diff of paths not included
-        all_paths = status_filter_pathspec(['*'])
+        # Diff against all paths to find those not included
+        all_paths = git_status.all_paths()
         not_included = {}
         for code, paths in all_paths.items():
             not_included[code] = set(all_paths[code]) - set(included.get(code, []))
@@ -211,6 +567,7 @@ class PITRepo:
 
             status.append(f'Changes not included in snapshots:{c}')
             for code, paths in not_included.items():
+                status_string = code_to_status_string(code)
                 for path in sorted(paths):
                     status.append(f"\t{status_string} {path}")
 
@@ -223,22 +580,566 @@ class PITRepo:
     def snapshot(
         self,
         paths: List[str],
-        metadata: Optional[dict] = None
-    ):
+        metadata: Optional[dict] = None,
+        force_paths: Optional[List[str]] = None,
+        engine: str = 'stash',
+        dedup: Optional[bool] = None,
+        timer: Optional[PhaseTimer] = None,
+        check_budget: bool = True
+    ) -> PITLogEntry:
+        """
+        Create a snapshot commit of the specified paths and record it in the log.
+
+        Two engines are available:
+        - `stash`: Uses `git stash push --include-untracked` followed by `git stash pop`. This rewrites the included files in the worktree and uses the stash stack.
+        - `index`: Builds the tree from the worktree into a private index (`GIT_INDEX_FILE`) and creates the commit with `git commit-tree`. The worktree, the repository index and the stash stack are never touched. The files of large snapshots are hashed by parallel git processes (see `point_in_time.blob_hasher`). When `large_file_threshold` is configured, large files are stored in the chunk store and committed as pointers (see `point_in_time.chunk_store`).
+
+        With `dedup`, when a snapshot of the same contents on the same `HEAD` already exists, e.g. a sweep snapshotting an unchanged worktree many times, no commit is made and an alias entry sharing the existing commit is recorded with the new metadata. Snapshots are found by the hash of their tree, which is recorded in the log and indexed (see `find_snapshot(...)`).
+
+        Finding the existing snapshot needs the tree first. The `index` engine builds it anyway, so dedup is on by default and nearly free. The `stash` engine has no tree until it has stashed, so opting in costs a scan of the worktree and hashing every included file into a private index before the stash, even when no existing snapshot is found. Without it stash snapshots record no tree hash, and `is_dirty_since(...)` always treats them as changed.
+
+        The same as `commit_snapshot(prepare_snapshot(...))`, which callers may split to prepare the snapshot ahead of time, e.g. while waiting for confirmation (see `SpeculativeSnapshot`).
+
+        Args:
+            paths (List[str]): The paths to include, relative to the repository root.
+            metadata (Optional[dict], optional): Metadata to record with the log entry.
+            force_paths (Optional[List[str]], optional): Ignored paths to force into the snapshot.
+            engine (str, optional): One of `SNAPSHOT_ENGINES`.
+            dedup (Optional[bool], optional): Record an alias of an existing snapshot with the same contents rather than a new commit, see above. Defaults to `True` for the `index` engine and `False` for `stash`.
+            timer (Optional[PhaseTimer], optional): Records the time spent in each phase of the snapshot, e.g. `hash` and `commit`. The timings are also logged at debug level.
+            check_budget (bool, optional): Enforce the size budgets of the config, see `check_size_budget(...)`.
+
+        Raises:
+            PITSizeBudgetError: If the included files exceed the size budgets.
+
+        Returns:
+            PITLogEntry: The new log entry.
+        """
+        if timer is None:
+            timer = PhaseTimer()
+        prepared = self.prepare_snapshot(
+            paths,
+            force_paths,
+            engine=engine,
+            dedup=dedup,
+            timer=timer,
+            check_budget=check_budget
+        )
+        return self.commit_snapshot(prepared, metadata, timer=timer)
+
+    def prepare_snapshot(
+        self,
+        paths: List[str],
+        force_paths: Optional[List[str]] = None,
+        engine: str = 'stash',
+        dedup: Optional[bool] = None,
+        timer: Optional[PhaseTimer] = None,
+        speculative: bool = False,
+        cancel: Optional[threading.Event] = None,
+        check_budget: bool = True
+    ) -> PreparedSnapshot:
+        """
+        Builds the tree of a snapshot, everything but the commit and the log entry, see `snapshot(...)`. Nothing is recorded, a prepared snapshot which is never committed only leaves unreferenced git objects.
+
+        Args:
+            paths (List[str]): The paths to include, relative to the repository root.
+            force_paths (Optional[List[str]], optional): Ignored paths to force into the snapshot.
+            engine (str, optional): One of `SNAPSHOT_ENGINES`.
+            dedup (Optional[bool], optional): See `snapshot(...)`.
+            timer (Optional[PhaseTimer], optional): See `snapshot(...)`.
+            speculative (bool, optional): The worktree may change before the snapshot is committed, record what is needed for `commit_snapshot(...)` to check it did not.
+            cancel (Optional[threading.Event], optional): Stops the preparation between git commands once set.
+            check_budget (bool, optional): See `snapshot(...)`.
+
+        Raises:
+            PITSizeBudgetError: If the included files exceed the size budgets.
+            PITSnapshotCancelledError: If `cancel` was set.
+
+        Returns:
+            PreparedSnapshot: The snapshot to pass to `commit_snapshot(...)`.
+        """
+        if force_paths is None:
+            force_paths = []
+        if timer is None:
+            timer = PhaseTimer()
+        if engine not in SNAPSHOT_ENGINES:
+            raise PITInternalError("Unknown snapshot engine: %s" % engine)
+        if check_budget:
+            with timer.phase('budget'):
+                self.check_size_budget(paths, force_paths)
+
+        prepared = PreparedSnapshot(
+            paths=paths,
+            force_paths=force_paths,
+            engine=engine,
+            dedup=engine == 'index' if dedup is None else dedup,
+            parent=git_rev_parse_verify('HEAD', cwd=self._toplevel),
+            check_budget=check_budget,
+            speculative=speculative
+        )
+        if self.prepares_tree(engine, dedup):
+            with timer.phase('scan'):
+                prepared.scan = self._scan_worktree(force_paths)
+            # Note: The stash engine only needs the tree to look for an existing snapshot, so large files stay in git as they will in the stash
+            prepared.tree = self._snapshot_tree(
+                prepared.parent,
+                paths,
+                force_paths,
+                large_files=(engine == 'index'),
+                timer=timer,
+                cancel=cancel
+            )
+            if speculative:
+                check_cancelled(cancel)
+                with timer.phase('scan'):
+                    prepared.worktree = self._worktree_record(prepared.scan, prepared.tree, prepared.parent)
+        return prepared
+
+    @staticmethod
+    def prepares_tree(engine: str, dedup: Optional[bool] = None) -> bool:
+        """
+        Returns:
+            bool: Whether `prepare_snapshot(...)` builds the tree of a snapshot. The `stash` engine without dedup has nothing to prepare, its snapshot is made by stashing when committed.
+        """
+        if dedup is None:
+            dedup = engine == 'index'
+        return engine == 'index' or dedup
+
+    def commit_snapshot(
+        self,
+        prepared: PreparedSnapshot,
+        metadata: Optional[dict] = None,
+        timer: Optional[PhaseTimer] = None
+    ) -> PITLogEntry:
+        """
+        Commits a snapshot from `prepare_snapshot(...)` and records it in the log. A speculative snapshot whose included files, include file or `HEAD` changed since it was prepared is prepared again first.
+
+        Args:
+            prepared (PreparedSnapshot): The prepared snapshot.
+            metadata (Optional[dict], optional): Metadata to record with the log entry.
+            timer (Optional[PhaseTimer], optional): See `snapshot(...)`.
+
+        Returns:
+            PITLogEntry: The new log entry.
+        """
         if metadata is None:
             metadata = {}
+        if timer is None:
+            timer = PhaseTimer()
+
+        if prepared.speculative and prepared.tree is not None:
+            with timer.phase('verify'):
+                current = self._is_prepared_current(prepared)
+            if not current:
+                logger.info("Files changed while the snapshot was prepared, preparing it again.")
+                prepared = self.prepare_snapshot(
+                    prepared.paths,
+                    prepared.force_paths,
+                    engine=prepared.engine,
+                    dedup=prepared.dedup,
+                    timer=timer,
+                    check_budget=prepared.check_budget
+                )
+
+        parent = prepared.parent
+        tree = prepared.tree
+        if prepared.dedup:
+            with timer.phase('dedup'):
+                original = self.find_snapshot(tree, parent)
+            if original is not None:
+                s = self._new_alias(original, metadata)
+                with timer.phase('log'):
+                    self.append_log(s)
+                    self._save_worktree(prepared)
+                logger.debug("Snapshot timings: %s" % timer.format())
+                return s
+
+        with timer.phase('commit'):
+            if prepared.engine == 'stash':
+                if self._load_config().large_file_threshold is not None:
+                    logger.warning("The large file mode only applies to the 'index' engine, large files are stored in git.")
+                commit = self._snapshot_stash(prepared.paths + prepared.force_paths)
+            else:
+                commit = self._commit_tree(tree, parent)
+
+        s = self._new_entry(commit, metadata, tree_hash=tree)
+
+        with timer.phase('log'):
+            self.append_log(s)
+            self._details_cache.put(git_commit_details(commit, cwd=self._toplevel))
+            self._save_worktree(prepared)
+
+        logger.debug("Snapshot timings: %s" % timer.format())
+        return s
+
+    def get_size_report(self, paths: List[str], force_paths: Optional[List[str]] = None) -> SizeReport:
+        """
+        Stats the files a snapshot of the paths would include, without writing anything, see `point_in_time.size_report`.
+
+        ```python
+        >>> report = repo.get_size_report(paths, force_paths)
+        >>> report.files[0]
+        ('checkpoints/model.pt', 4294967296)
+        ```
+
+        Args:
+            paths (List[str]): The paths to include, relative to the repository root.
+            force_paths (Optional[List[str]], optional): Ignored paths to force into the snapshot.
+
+        Returns:
+            SizeReport: The sizes of the included files, largest first, with the budgets of the config.
+        """
+        config = self._load_config()
+        return scan_sizes(
+            self._toplevel,
+            paths,
+            force_paths if force_paths is not None else [],
+            max_file_bytes=config.max_file_bytes,
+            max_snapshot_bytes=config.max_snapshot_bytes
+        )
+
+    def check_size_budget(self, paths: List[str], force_paths: Optional[List[str]] = None) -> Optional[SizeReport]:
+        """
+        Enforces the `max_file_bytes` and `max_snapshot_bytes` budgets of the config on the files a snapshot would include. Nothing is scanned when neither is configured.
+
+        Args:
+            paths (List[str]): The paths to include, relative to the repository root.
+            force_paths (Optional[List[str]], optional): Ignored paths to force into the snapshot.
+
+        Raises:
+            PITSizeBudgetError: If the included files exceed a budget.
+
+        Returns:
+            Optional[SizeReport]: The report checked, `None` if there are no budgets.
+        """
+        config = self._load_config()
+        if config.max_file_bytes is None and config.max_snapshot_bytes is None:
+            return None
+
+        report = self.get_size_report(paths, force_paths)
+        report.check()
+        return report
+
+    def _is_prepared_current(self, prepared: PreparedSnapshot) -> bool:
+        """
+        Returns:
+            bool: Whether a speculative snapshot would still be prepared with the same tree, from the worktree cache it recorded.
+        """
+        if prepared.worktree is None:
+            return False
+        head = git_rev_parse_verify('HEAD', cwd=self._toplevel)
+        if not prepared.worktree.matches(prepared.tree, head, self._worktree_key()):
+            return False
+        try:
+            return prepared.worktree.is_unchanged(self._toplevel, self._load_include())
+        except (OSError, subprocess.CalledProcessError) as err:
+            logger.debug("Unable to check prepared snapshot: %s" % err)
+            return False
+
+    def is_dirty_since(self, pit_id: str) -> bool:
+        """
+        Checks whether a snapshot taken now would differ from an earlier one, e.g. to skip snapshots of an unchanged worktree (`pit snapshot --if-changed`).
+
+        When the snapshot is the one the worktree cache was last recorded for (see `point_in_time.worktree_cache`) this only takes stat calls. Otherwise the tree of the worktree is built and compared, and the cache is recorded for the snapshot if they match. Snapshots without a recorded tree hash, e.g. those taken before it was recorded, always count as changed.
+
+        Args:
+            pit_id (str): The snapshot to compare with.
+
+        Raises:
+            PITIdNotFoundError: If the id does not exist in the log.
+
+        Returns:
+            bool: `True` if the included paths, untracked files among them, or `HEAD` changed since the snapshot.
+        """
+        e = self.get_entry(pit_id)
+        if e is None:
+            raise PITIdNotFoundError("Specified Pit id does not exist in log.")
+
+        tree = e.tree_hash
+        if e.alias_of is not None:
+            original = self.get_entry(e.alias_of)
+            tree = None if original is None else original.tree_hash
+        if tree is None:
+            return True
+
+        head = git_rev_parse_verify('HEAD', cwd=self._toplevel)
+        parents = git_commit_parents(e.git_hash, cwd=self._toplevel)
+        if parents is None or parents[:1] != ([head] if head is not None else []):
+            return True
+
+        include = self._load_include()
+        cache = WorktreeCache.load(self._worktree_cache_path)
+        if cache is not None and cache.matches(tree, head, self._worktree_key()):
+            unchanged = cache.is_unchanged(self._toplevel, include)
+            if unchanged and cache.modified:
+                try:
+                    cache.save(self._worktree_cache_path)
+                except OSError as err:
+                    logger.debug("Unable to write pit worktree cache: %s" % err)
+            return not unchanged
+
+        paths = self.get_snapshot_paths()
+        force_paths = flatten_status_paths(paths, codes=['!!'])
+        scan = self._scan_worktree(force_paths)
+        current = self._snapshot_tree(
+            head,
+            flatten_status_paths(paths, codes=[c for c in paths.keys() if c != '!!']),
+            force_paths
+        )
+        if current != tree:
+            return True
+
+        self._record_worktree(scan, tree, head)
+        return False
+
+    def _worktree_key(self) -> list:
+        return [list(include_cache_key(self._include_path)), self._load_config().large_file_threshold]
+
+    def _scan_worktree(self, force_paths: List[str]) -> Optional[WorktreeScan]:
+        """
+        Scans the worktree for the worktree cache, before a snapshot's tree is built.
+
+        Returns:
+            Optional[WorktreeScan]: The scan, `None` if the worktree could not be read.
+        """
+        try:
+            return WorktreeScan.capture(
+                self._toplevel,
+                git_ls_files_ignored_directories(cwd=self._toplevel),
+                extra_files=[p for p in force_paths if not p.endswith('/')],
+                include=self._load_include()
+            )
+        except (OSError, subprocess.CalledProcessError) as err:
+            logger.debug("Unable to scan worktree: %s" % err)
+            return None
+
+    def _worktree_record(self, scan: Optional[WorktreeScan], tree: str, head: Optional[str]) -> Optional[WorktreeCache]:
+        """
+        Returns:
+            Optional[WorktreeCache]: The worktree cache for a snapshot, `None` if it could not be recorded.
+        """
+        if scan is None:
+            return None
+        try:
+            return WorktreeCache.record(
+                scan,
+                tree,
+                head,
+                self._worktree_key(),
+                git_ls_tree(tree, cwd=self._toplevel),
+                self._load_include()
+            )
+        except (OSError, subprocess.CalledProcessError) as err:
+            logger.debug("Unable to record pit worktree cache: %s" % err)
+            return None
+
+    def _record_worktree(self, scan: Optional[WorktreeScan], tree: str, head: Optional[str]):
+        """
+        Records the worktree cache for a snapshot, see `is_dirty_since(...)`. Failures only lose the fast path, so are not raised.
+        """
+        cache = self._worktree_record(scan, tree, head)
+        if cache is None:
+            return
+        try:
+            cache.save(self._worktree_cache_path)
+        except OSError as err:
+            logger.debug("Unable to write pit worktree cache: %s" % err)
+
+    def _save_worktree(self, prepared: PreparedSnapshot):
+        if prepared.tree is None:
+            return
+        if prepared.worktree is None:
+            self._record_worktree(prepared.scan, prepared.tree, prepared.parent)
+            return
+        # Note: Already recorded to check the speculative snapshot, and brought up to date by that check
+        try:
+            prepared.worktree.save(self._worktree_cache_path)
+        except OSError as err:
+            logger.debug("Unable to write pit worktree cache: %s" % err)
+
+    def _split_large_paths(
+        self,
+        paths: List[str],
+        threshold: int,
+        ignored: bool = False
+    ) -> Tuple[List[str], List[str]]:
+        small = []
+        large = []
+        directories = []
+        for p in paths:
+            if p.endswith('/'):
+                directories.append(p)
+            elif is_large_file(os.path.join(self._toplevel, p), threshold):
+                large.append(p)
+            else:
+                small.append(p)
+
+        if len(directories) == 0:
+            return small, large
+
+        # Untracked directories are collapsed by `git status`, those containing large files are expanded to their files
+        files_by_directory: Dict[str, List[str]] = {d: [] for d in directories}
+        for f in git_ls_files_others(directories, ignored=ignored, cwd=self._toplevel):
+            for d in directories:
+                if f.startswith(d):
+                    files_by_directory[d].append(f)
+                    break
+
+        for d, files in files_by_directory.items():
+            large_files = [f for f in files if is_large_file(os.path.join(self._toplevel, f), threshold)]
+            if len(large_files) == 0:
+                small.append(d)
+                continue
+            large += large_files
+            large_set = set(large_files)
+            small += [f for f in files if f not in large_set]
+
+        return small, large
+
+    def _prepare_large_files(
+        self,
+        paths: List[str],
+        force_paths: List[str],
+        pointer_tree: str
+    ) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Stores the files of a snapshot at or above `large_file_threshold` in the chunk store, and writes their pointers under `pointer_tree` for `index_snapshot_steps(...)`.
+
+        Args:
+            paths (List[str]): The paths to include, relative to the repository root.
+            force_paths (List[str]): Ignored paths to force into the snapshot.
+            pointer_tree (str): Directory to write pointers to, at the same paths as the files.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: `paths` and `force_paths` without the large files, and the paths of the large files.
+        """
+        threshold = self._load_config().large_file_threshold
+        if threshold is None:
+            return paths, force_paths, []
+
+        paths, large = self._split_large_paths(paths, threshold)
+        force_paths, large_forced = self._split_large_paths(force_paths, threshold, ignored=True)
+        large += large_forced
+
+        pointers = self._chunk_store.store_files([os.path.join(self._toplevel, p) for p in large])
+        for p in large:
+            source = os.path.join(self._toplevel, p)
+            dest = os.path.join(pointer_tree, p)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as f:
+                f.write(pointers[source])
+            if os.stat(source).st_mode & 0o100:
+                os.chmod(dest, 0o755)
+
+        return paths, force_paths, large
+
+    def materialize(
+        self,
+        e: PITLogEntry,
+        paths: Optional[List[str]] = None,
+        output_dir: Optional[str] = None,
+        overwrite: bool = False
+    ) -> List[str]:
+        """
+        Writes the large files of a snapshot back out of the chunk store.
+
+        Args:
+            e (PITLogEntry): The snapshot.
+            paths (Optional[List[str]], optional): Only materialize files under these paths, relative to the repository root. Defaults to all large files.
+            output_dir (Optional[str], optional): Directory to write the files to at their paths in the snapshot, defaults to the repository root.
+            overwrite (bool, optional): Replace existing files, otherwise nothing is written if any exist.
+
+        Raises:
+            PITMaterializeError: If a file exists and `overwrite` is not set.
+            PITObjectNotFoundError: If an object of a file is missing or corrupt.
+
+        Returns:
+            List[str]: The paths of the files written, relative to `output_dir`.
+        """
+        if output_dir is None:
+            output_dir = self._toplevel
+
+        # Note: Pointers are tiny, so larger blobs are never read
+        candidates = [
+            t for t in git_ls_tree(e.git_hash, pathspecs=paths, cwd=self._toplevel)
+            if t.size <= POINTER_MAX_BYTES
+        ]
+        contents = git_cat_file_batch(sorted(set(t.hash for t in candidates)), cwd=self._toplevel)
+        pointers = [t for t in candidates if parse_pointer(contents[t.hash]) is not None]
+
+        if not overwrite:
+            existing = [t.path for t in pointers if os.path.lexists(os.path.join(output_dir, t.path))]
+            if len(existing) != 0:
+                raise PITMaterializeError("Files already exist, use overwrite to replace them: %s" % ', '.join(existing))
+
+        for t in pointers:
+            self._chunk_store.materialize(
+                contents[t.hash],
+                os.path.join(output_dir, t.path),
+                executable=t.mode == '100755'
+            )
+        return [t.path for t in pointers]
+
+    def find_snapshot(self, tree: str, parent: Optional[str]) -> Optional[PITLogEntry]:
+        """
+        Finds a snapshot with the same contents, through the log's index of tree hashes. Snapshots only match when taken on the same `HEAD` and their commit still exists (it may have been pruned by `git gc`).
+
+        Args:
+            tree (str): The tree of the included paths, as built by the `index` engine.
+            parent (Optional[str]): The commit at `HEAD`, `None` on an unborn branch.
+
+        Raises:
+            PITLogLoadError: If a matching entry is malformed.
+
+        Returns:
+            Optional[PITLogEntry]: The snapshot, `None` if there is none.
+        """
+        for record in self._open_log().find('tree_hash', tree):
+            try:
+                e = PITLogEntry.model_validate(record)
+            except ValidationError as err:
+                raise PITLogLoadError("Malformed pit log: %s" % str(err))
+
+            parents = git_commit_parents(e.git_hash, cwd=self._toplevel)
+            if parents is not None and parents[:1] == ([parent] if parent is not None else []):
+                return e
+        return None
+
+    @staticmethod
+    def _new_entry(commit: str, metadata: dict, tree_hash: Optional[str] = None) -> PITLogEntry:
+        return PITLogEntry(
+            pit_id=get_random_name(separator='-', style='lowercase')+f'-{commit[:7]}',
+            git_hash=commit,
+            metadata=metadata,
+            tree_hash=tree_hash
+        )
+
+    @staticmethod
+    def _new_alias(original: PITLogEntry, metadata: dict) -> PITLogEntry:
+        logger.info("Snapshot contents match %s, recording an alias" % original.pit_id)
+        return PITLogEntry(
+            pit_id=get_random_name(separator='-', style='lowercase')+f'-{original.git_hash[:7]}',
+            git_hash=original.git_hash,
+            metadata=metadata,
+            alias_of=original.pit_id
+        )
+
+    def _snapshot_stash(self, paths: List[str]) -> str:
         with NamedTemporaryFile() as f:
-            f.write('\n'.join(paths).encode())
+            f.write(b'\0'.join(os.fsencode(p) for p in paths))
             f.seek(0)
 
             result = subprocess.run(
                 [
                     'git',
+                    '--literal-pathspecs',
                     'stash',
                     'push',
                     '--include-untracked',
-                    f'--pathspec-from-file={f.name}'
+                    f'--pathspec-from-file={f.name}',
+                    '--pathspec-file-nul'
                 ],
+                cwd=self._toplevel,
                 capture_output=True
             )
             if result.returncode != 0:
@@ -246,6 +1147,7 @@ class PITRepo:
 
             result = subprocess.run(
                 ['git', 'stash', 'pop'],
+                cwd=self._toplevel,
                 capture_output=True
             )
             if result.returncode != 0:
@@ -258,18 +1160,271 @@ class PITRepo:
                 raise PITCommitParseFailed("Multiple matches found for commit during 'git stash drop'")
 
             # Note: [1:-1] removes the leading / trailing '(' and ')' to leave just the hash
-            commit = commit[0][1:-1]
+            return commit[0][1:-1]
+
+    def _snapshot_tree(
+        self,
+        parent: Optional[str],
+        paths: List[str],
+        force_paths: List[str],
+        large_files: bool = True,
+        timer: Optional[PhaseTimer] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> str:
+        """
+        Builds the tree of an `index` engine snapshot in a private index.
+
+        Raises:
+            PITSnapshotCancelledError: If `cancel` was set, checked before each step.
+
+        Returns:
+            str: The hash of the tree.
+        """
+        if timer is None:
+            timer = PhaseTimer()
+
+        with TemporaryDirectory() as tmp:
+            env = os.environ.copy()
+            env['GIT_INDEX_FILE'] = os.path.join(tmp, 'index')
+            pointer_tree = os.path.join(tmp, 'pointers')
+            pointer_paths = []
+            if large_files:
+                check_cancelled(cancel)
+                with timer.phase('large files'):
+                    paths, force_paths, pointer_paths = self._prepare_large_files(paths, force_paths, pointer_tree)
+
+            check_cancelled(cancel)
+            with timer.phase('hash'):
+                hashed = self._hash_blobs(parent, paths, force_paths)
+
+            def run(args: List[str], input: Optional[bytes] = None):
+                check_cancelled(cancel)
+                result = subprocess.run(
+                    args,
+                    input=input,
+                    env=env,
+                    cwd=self._toplevel,
+                    capture_output=True
+                )
+                if result.returncode != 0:
+                    raise PITSnapshotFailedError(result.stderr.decode())
+
+            with timer.phase('index'):
+                for args, input in index_snapshot_steps(
+                    parent,
+                    hashed.paths,
+                    hashed.force_paths,
+                    pointer_tree,
+                    pointer_paths,
+                    hashed.index_info
+                ):
+                    run(['git'] + args, input=input)
 
+            with timer.phase('tree'):
+                try:
+                    return git_write_tree(env=env, cwd=self._toplevel)
+                except subprocess.CalledProcessError as err:
+                    raise PITSnapshotFailedError(err.stderr.decode())
 
-            s = PITLogEntry(
-                pit_id=get_random_name(separator='-', style='lowercase')+f'-{commit[:7]}',
-                git_hash=commit,
-                metadata=metadata
+    def _hash_blobs(
+        self,
+        parent: Optional[str],
+        paths: List[str],
+        force_paths: List[str],
+        workers: Optional[int] = None
+    ) -> HashedBlobs:
+        """
+        Writes the blobs of a snapshot's files in parallel, see `point_in_time.blob_hasher`. Up to `workers` git processes run at once, defaulting to `hash_workers` of the config.
+        """
+        if workers is None:
+            workers = self._load_config().hash_workers
+        if workers is None:
+            workers = os.cpu_count() or 1
+        return hash_blobs(self._toplevel, paths, force_paths, workers, parent=parent)
+
+    def _commit_tree(self, tree: str, parent: Optional[str]) -> str:
+        try:
+            return git_commit_tree(
+                tree,
+                parents=[parent] if parent is not None else [],
+                message='Pit snapshot',
+                cwd=self._toplevel
             )
+        except subprocess.CalledProcessError as err:
+            raise PITSnapshotFailedError(err.stderr.decode())
 
-            self.append_log(s)
+def check_cancelled(cancel: Optional[threading.Event]):
+    """
+    Raises:
+        PITSnapshotCancelledError: If `cancel` is set.
+    """
+    if cancel is not None and cancel.is_set():
+        raise PITSnapshotCancelledError("Snapshot preparation cancelled")
+
+def index_snapshot_steps(
+    parent: Optional[str],
+    paths: List[str],
+    force_paths: List[str],
+    pointer_tree: Optional[str] = None,
+    pointer_paths: Optional[List[str]] = None,
+    index_info: bytes = b''
+) -> List[Tuple[List[str], Optional[bytes]]]:
+    """
+    The git commands, and their input, which build the tree of an `index` engine snapshot in a private index. Shared with `AsyncPITRepo`.
+
+    Files already written as blobs (see `point_in_time.blob_hasher`) are added by their hashes from `index_info`. Pointers of large files (see `PITRepo._prepare_large_files`) are added from `pointer_tree` as the worktree, so they are committed at the paths of the files they replace.
+
+    Returns:
+        List[Tuple[List[str], Optional[bytes]]]: The git arguments (excluding `git`) and input of each command, in order.
+    """
+    # Start from HEAD so the snapshot contains the full tree
+    if parent is not None:
+        steps = [(['read-tree', parent], None)]
+    else:
+        steps = [(['read-tree', '--empty'], None)]
+
+    for add_paths, force in ((paths, False), (force_paths, True)):
+        if len(add_paths) == 0:
+            continue
+
+        args = [
+            '--literal-pathspecs',
+            'add', '--all',
+            '--pathspec-from-file=-',
+            '--pathspec-file-nul'
+        ]
+        if force:
+            args.append('--force')
+        steps.append((args, b'\0'.join(os.fsencode(p) for p in add_paths)))
+
+    if len(index_info) != 0:
+        steps.append((['update-index', '--add', '--replace', '-z', '--index-info'], index_info))
+
+    if pointer_tree is not None and pointer_paths:
+        steps.append((
+            [
+                f'--work-tree={pointer_tree}',
+                '--literal-pathspecs',
+                'add', '--force',
+                '--pathspec-from-file=-',
+                '--pathspec-file-nul'
+            ],
+            b'\0'.join(os.fsencode(p) for p in pointer_paths)
+        ))
+
+    return steps
+
+@dataclass
+class PreparedSnapshot:
+    """
+    A snapshot whose tree is built but not committed, see `PITRepo.prepare_snapshot(...)`.
+    """
+    paths: List[str]
+    force_paths: List[str]
+    engine: str
+    dedup: bool
+    parent: Optional[str]
+    """
+    The `HEAD` commit the snapshot was prepared on.
+    """
+    check_budget: bool = True
+    speculative: bool = False
+    tree: Optional[str] = None
+    """
+    The tree of the snapshot, `None` for `stash` engine snapshots without `dedup`, which have nothing to prepare.
+    """
+    scan: Optional[WorktreeScan] = None
+    worktree: Optional[WorktreeCache] = None
+    """
+    The worktree as of `tree`, recorded for speculative snapshots to check it did not change before they are committed.
+    """
+
+class SpeculativeSnapshot:
+    """
+    Prepares a snapshot in a background thread, e.g. while `pit snapshot` waits for confirmation, so that little is left to do once confirmed.
+
+    ```python
+    >>> speculative = SpeculativeSnapshot(repo, paths, force_paths, engine='index')
+    >>> if input('Create snapshot [Y/n]: ') in ('', 'y'):
+    ...     s = speculative.commit(metadata)
+    ... else:
+    ...     speculative.discard()
+    ```
+
+    Files changed while the snapshot is prepared are noticed when it is committed, and the snapshot prepared again, see `PITRepo.commit_snapshot(...)`. Only snapshots which `PITRepo.prepares_tree(...)` gain anything, `stash` snapshots without dedup are all done once committed.
 
-            return s
+    The preparation runs on its own `PITRepo` and `PhaseTimer`, as their caches are not safe to share between threads.
+    """
+    def __init__(
+        self,
+        repo: PITRepo,
+        paths: List[str],
+        force_paths: Optional[List[str]] = None,
+        engine: str = 'stash',
+        dedup: Optional[bool] = None,
+        timer: Optional[PhaseTimer] = None,
+        check_budget: bool = True
+    ):
+        """
+        Args:
+            repo (PITRepo): The repository to snapshot.
+            paths (List[str]): The paths to include, relative to the repository root.
+            force_paths (Optional[List[str]], optional): Ignored paths to force into the snapshot.
+            engine (str, optional): One of `SNAPSHOT_ENGINES`.
+            dedup (Optional[bool], optional): See `PITRepo.snapshot(...)`.
+            timer (Optional[PhaseTimer], optional): See `PITRepo.snapshot(...)`. The phases of the preparation are added once it finishes, and time spent waiting for it is recorded as `wait`.
+            check_budget (bool, optional): See `PITRepo.snapshot(...)`.
+        """
+        self._repo = repo
+        self._args = (paths, force_paths, engine, dedup, check_budget)
+        self.timer = PhaseTimer() if timer is None else timer
+        self._background_repo = PITRepo(repo._path)
+        self._background_timer = PhaseTimer()
+        self._cancel = threading.Event()
+        self._prepared: Optional[PreparedSnapshot] = None
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._prepare, name='pit-snapshot-prepare', daemon=True)
+        self._thread.start()
+
+    def _prepare(self):
+        paths, force_paths, engine, dedup, check_budget = self._args
+        try:
+            self._prepared = self._background_repo.prepare_snapshot(
+                paths,
+                force_paths,
+                engine=engine,
+                dedup=dedup,
+                timer=self._background_timer,
+                speculative=True,
+                cancel=self._cancel,
+                check_budget=check_budget
+            )
+        except BaseException as err:
+            self._error = err
+
+    def commit(self, metadata: Optional[dict] = None) -> PITLogEntry:
+        """
+        Waits for the preparation to finish and commits the snapshot.
+
+        Raises:
+            PITSnapshotFailedError: If preparing the snapshot failed, or any other error `PITRepo.snapshot(...)` raises.
+
+        Returns:
+            PITLogEntry: The new log entry.
+        """
+        with self.timer.phase('wait'):
+            self._thread.join()
+        self.timer.merge(self._background_timer)
+        if self._error is not None:
+            raise self._error
+        return self._repo.commit_snapshot(self._prepared, metadata, timer=self.timer)
+
+    def discard(self):
+        """
+        Stops the preparation, waiting for the git command in progress to finish. Nothing is recorded, git objects already written are left for `git gc`.
+        """
+        self._cancel.set()
+        self._thread.join()
 
 @dataclass
 class SnapshotDetails:
@@ -309,7 +1464,9 @@ class SnapshotDetails:
             details.append(f'Origin: {self.metadata["username"]}@{self.metadata["hostname"]}')
 
         details.append(f'Commit: {self.git_hash}')
-        details.append(f'Date: {self.date.strftime('%d/%m/%Y, %H:%M:%S')}')
+        if self._log_entry.alias_of is not None:
+            details.append(f'Alias of: {self._log_entry.alias_of}')
+        details.append(f'Date: {self.date.strftime("%d/%m/%Y, %H:%M:%S")}')
 
         if verbose:
             details.append('')
@@ -324,5 +1481,11 @@ class PITLogEntry(BaseModel):
     pit_id: str
     git_hash: str
     metadata: Dict[str, Any]
-
-log_file = TypeAdapter(Dict[str, PITLogEntry])
+    tree_hash: Optional[str] = None
+    """
+    The tree of the included paths, as built by the `index` engine, for finding snapshots with the same contents. Not recorded for aliases.
+    """
+    alias_of: Optional[str] = None
+    """
+    The pit id of the snapshot this entry shares its commit with, when taken of the same contents.
+    """
@@ -0,0 +1,182 @@
+"""
+Sizes of the files a snapshot would include, found by stat calls alone before any git object is written. Used to enforce the size budgets of `.pit/config.json`:
+
+```json
+{
+    "max_file_bytes": 104857600,
+    "max_snapshot_bytes": 1073741824
+}
+```
+
+and to rank the largest included files in `pit status` and `pit snapshot`, so a bad include file or force section pulling in e.g. checkpoints is caught before it stalls the snapshot and bloats `.git`.
+"""
+import os
+import stat
+import itertools
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from colorama import Fore
+
+from point_in_time.errors import PITSizeBudgetError
+from point_in_time.utils.git import git_ls_files_others
+
+__all__ = ['SizeReport', 'scan_sizes', 'format_bytes']
+
+STAT_BATCH_SIZE = 512
+"""
+Paths stat'ed per task of the thread pool.
+"""
+STAT_WORKERS = 16
+"""
+Threads stat'ing at once, stat calls mostly wait on the file system (e.g. a network mount) so there can be more of them than CPUs.
+"""
+SIZE_REPORT_LIMIT = 5
+"""
+Files listed in the size report of `pit status` and `pit snapshot`.
+"""
+
+@dataclass
+class SizeReport:
+    files: List[Tuple[str, int]] = field(default_factory=list)
+    """
+    The path and size of each included regular file, largest first.
+    """
+    max_file_bytes: Optional[int] = None
+    max_snapshot_bytes: Optional[int] = None
+
+    @property
+    def total(self) -> int:
+        return sum(size for _, size in self.files)
+
+    def oversized_files(self) -> List[Tuple[str, int]]:
+        """
+        Returns:
+            List[Tuple[str, int]]: The files over `max_file_bytes`, largest first.
+        """
+        if self.max_file_bytes is None:
+            return []
+        return list(itertools.takewhile(lambda f: f[1] > self.max_file_bytes, self.files))
+
+    def violations(self) -> List[str]:
+        """
+        Returns:
+            List[str]: A description of each exceeded budget, empty if within budget.
+        """
+        violations = [
+            f"'{path}' is {format_bytes(size)}, over the per file budget of {format_bytes(self.max_file_bytes)}"
+            for path, size in self.oversized_files()
+        ]
+        if self.max_snapshot_bytes is not None and self.total > self.max_snapshot_bytes:
+            violations.append(
+                f"The snapshot is {format_bytes(self.total)}, over the budget of {format_bytes(self.max_snapshot_bytes)}"
+            )
+        return violations
+
+    def check(self):
+        """
+        Raises:
+            PITSizeBudgetError: If a budget is exceeded, see `violations()`.
+        """
+        violations = self.violations()
+        if len(violations) != 0:
+            raise PITSizeBudgetError(
+                "Snapshot exceeds the size budget of the pit config:\n\t" + '\n\t'.join(violations)
+            )
+
+    def format(self, limit: int = SIZE_REPORT_LIMIT, cli: bool = False) -> List[str]:
+        """
+        Args:
+            limit (int, optional): The number of files to list, largest first. Files over the per file budget are always listed.
+            cli (bool, optional): Highlight files and totals over budget.
+
+        Returns:
+            List[str]: The lines of the report.
+        """
+        red = Fore.RED if cli else ''
+        reset = Fore.RESET if cli else ''
+
+        total = f'Snapshot size: {format_bytes(self.total)} in {len(self.files)} files'
+        if self.max_snapshot_bytes is not None:
+            total += f' (budget {format_bytes(self.max_snapshot_bytes)})'
+            if self.total > self.max_snapshot_bytes:
+                total = red + total + reset
+        lines = [total]
+
+        listed = self.files[:max(limit, len(self.oversized_files()))]
+        if len(listed) != 0:
+            lines.append('Largest included files:')
+            width = max(len(format_bytes(size)) for _, size in listed)
+            for path, size in listed:
+                line = f'\t{format_bytes(size).rjust(width)}  {path}'
+                if self.max_file_bytes is not None and size > self.max_file_bytes:
+                    line = f'{red}{line}  (over the per file budget of {format_bytes(self.max_file_bytes)}){reset}'
+                lines.append(line)
+        return lines
+
+def format_bytes(size: int) -> str:
+    """
+    ```python
+    >>> format_bytes(1536)
+    '1.5 KiB'
+    ```
+    """
+    if size < 1024:
+        return f'{size} B'
+    value = float(size)
+    for unit in ('KiB', 'MiB', 'GiB', 'TiB'):
+        value /= 1024
+        if value < 1024 or unit == 'TiB':
+            break
+    return f'{value:.1f} {unit}'
+
+def _stat_sizes(toplevel: str, paths: List[str]) -> List[Tuple[str, int]]:
+    sizes = []
+    for p in paths:
+        try:
+            st = os.lstat(os.path.join(toplevel, p))
+        except FileNotFoundError:
+            continue # Deleted
+        if stat.S_ISREG(st.st_mode):
+            sizes.append((p, st.st_size))
+    return sizes
+
+def scan_sizes(
+    toplevel: str,
+    paths: List[str],
+    force_paths: List[str],
+    max_file_bytes: Optional[int] = None,
+    max_snapshot_bytes: Optional[int] = None
+) -> SizeReport:
+    """
+    Stats the files of a snapshot from a pool of threads. Untracked directories collapsed by `git status` (`dir/`) are expanded to the files `git add` would add from them.
+
+    Args:
+        toplevel (str): The root of the worktree.
+        paths (List[str]): The paths to include, relative to the repository root.
+        force_paths (List[str]): Ignored paths to force into the snapshot.
+        max_file_bytes (Optional[int], optional): See `PITConfig.max_file_bytes`.
+        max_snapshot_bytes (Optional[int], optional): See `PITConfig.max_snapshot_bytes`.
+
+    Returns:
+        SizeReport: The sizes of the included files.
+    """
+    files = []
+    for add_paths, ignored in ((paths, False), (force_paths, True)):
+        directories = [p for p in add_paths if p.endswith('/')]
+        files += [p for p in add_paths if not p.endswith('/')]
+        if len(directories) != 0:
+            # Note: Nested repositories are listed as directories, `git add` does not add their files
+            files += [p for p in git_ls_files_others(directories, ignored=ignored, cwd=toplevel) if not p.endswith('/')]
+
+    files = list(dict.fromkeys(files))
+    batches = [files[i:i + STAT_BATCH_SIZE] for i in range(0, len(files), STAT_BATCH_SIZE)]
+    if len(batches) <= 1:
+        sizes = _stat_sizes(toplevel, files)
+    else:
+        with ThreadPoolExecutor(max_workers=min(STAT_WORKERS, len(batches))) as executor:
+            sizes = list(itertools.chain.from_iterable(executor.map(lambda b: _stat_sizes(toplevel, b), batches)))
+
+    sizes.sort(key=lambda f: (-f[1], f[0]))
+    return SizeReport(sizes, max_file_bytes=max_file_bytes, max_snapshot_bytes=max_snapshot_bytes)
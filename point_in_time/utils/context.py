@@ -0,0 +1,176 @@
+from __future__ import annotations
+import os
+import re
+import shutil
+from typing import Dict, Optional, Tuple
+
+from point_in_time.constants.main import PIT_DIR_NAME
+
+from .git import git_check_ignore, git_discover_toplevel
+
+__all__ = ['RepoContext']
+
+GIT_DISCOVERY_ENV = (
+    'GIT_DIR',
+    'GIT_WORK_TREE',
+    'GIT_CEILING_DIRECTORIES',
+    'GIT_DISCOVERY_ACROSS_FILESYSTEM'
+)
+"""
+Environment variables which change how git finds the repository, when any are set discovery is left to git.
+"""
+
+RE_CONFIG_WORKTREE = re.compile(r"^\s*(worktree\s*=|bare\s*=\s*true)", re.MULTILINE | re.IGNORECASE)
+
+def _is_git_dir(path: str) -> bool:
+    return (
+        os.path.isfile(os.path.join(path, 'HEAD')) and
+        os.path.isdir(os.path.join(path, 'objects'))
+    ) or os.path.isfile(os.path.join(path, 'commondir')) # Linked worktree
+
+def _read_gitfile(path: str) -> Optional[str]:
+    """
+    Resolves a `.git` file, as used by linked worktrees and submodules, to the git directory it points to.
+    """
+    try:
+        with open(path, 'r') as f:
+            content = f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    if not content.startswith('gitdir:'):
+        return None
+    git_dir = content[len('gitdir:'):].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(path), git_dir))
+
+def _config_overrides_worktree(git_dir: str) -> bool:
+    try:
+        with open(os.path.join(git_dir, 'config'), 'r') as f:
+            return RE_CONFIG_WORKTREE.search(f.read()) is not None
+    except (OSError, UnicodeDecodeError):
+        return False
+
+class RepoContext:
+    """
+    Where the git repository and pit directory are for a working directory, and facts about them which do not change over a pit invocation.
+
+    Discovery walks the filesystem the same way git does, following `.git` files for linked worktrees and submodules, so no git process is needed. Git is only asked when the environment or repository config alters discovery (`GIT_DIR`, `core.worktree`, ...). Each further fact costs at most one git call, made when first needed and then remembered.
+
+    ```python
+    >>> context = RepoContext.current()
+    >>> context.pit_path
+    '/path/to/repo/.pit'
+    ```
+    """
+    _contexts: Dict[Tuple, RepoContext] = {}
+
+    @classmethod
+    def current(cls, path: Optional[str] = None) -> RepoContext:
+        """
+        The context for a directory, shared across the process.
+
+        Args:
+            path (Optional[str], optional): A directory inside of the repository, defaults to the current working directory.
+
+        Raises:
+            NotADirectoryError: If the path is not a directory.
+
+        Returns:
+            RepoContext: The context.
+        """
+        cwd = os.getcwd() if path is None else os.path.realpath(path)
+        key = (cwd,) + tuple(os.environ.get(e) for e in GIT_DISCOVERY_ENV)
+
+        context = cls._contexts.get(key)
+        if context is None:
+            context = cls(cwd)
+            # Note: Not remembered when outside of a repository, one may yet be created
+            if context.is_inside_working_tree:
+                cls._contexts[key] = context
+        return context
+
+    def __init__(self, cwd: str):
+        """
+        Args:
+            cwd (str): The directory to discover the repository from.
+
+        Raises:
+            NotADirectoryError: If `cwd` is not a directory.
+        """
+        if not os.path.isdir(cwd):
+            raise NotADirectoryError("Not a directory: %s" % cwd)
+        self.cwd = cwd
+
+        self._git_available: Optional[bool] = None
+        self._pit_path_ignored: Optional[bool] = None
+
+        self.toplevel: Optional[str] = self._discover()
+        """
+        The toplevel directory of the working tree, `None` if not inside of one.
+        """
+
+    def _discover(self) -> Optional[str]:
+        if any(e in os.environ for e in GIT_DISCOVERY_ENV):
+            return git_discover_toplevel(self.cwd)
+
+        directory = self.cwd
+        device = os.stat(directory).st_dev
+        while True:
+            if os.path.basename(directory) == '.git':
+                # Inside of a git directory, leave the details to git
+                return git_discover_toplevel(self.cwd)
+
+            dot_git = os.path.join(directory, '.git')
+            if os.path.isdir(dot_git):
+                git_dir = dot_git
+            elif os.path.isfile(dot_git):
+                git_dir = _read_gitfile(dot_git)
+            else:
+                git_dir = None
+
+            if git_dir is not None:
+                if not _is_git_dir(git_dir) or _config_overrides_worktree(git_dir):
+                    return git_discover_toplevel(self.cwd)
+                return directory
+
+            parent = os.path.dirname(directory)
+            # Note: Like git, discovery stops at filesystem boundaries
+            if parent == directory or os.stat(parent).st_dev != device:
+                return None
+            directory = parent
+
+    @property
+    def is_inside_working_tree(self) -> bool:
+        return self.toplevel is not None
+
+    @property
+    def git_available(self) -> bool:
+        """
+        If git is on the `PATH`, found without running it.
+        """
+        if self._git_available is None:
+            self._git_available = shutil.which('git') is not None
+        return self._git_available
+
+    @property
+    def pit_path(self) -> str:
+        """
+        Where the `.pit` directory should exist, without validating it does.
+        """
+        assert self.toplevel is not None, "Not inside working directory"
+        return os.path.join(self.toplevel, PIT_DIR_NAME)
+
+    @property
+    def is_pit_path_ignored(self) -> bool:
+        """
+        If the `.pit` directory is ignored by git.
+        """
+        if self._pit_path_ignored is None:
+            self._pit_path_ignored = git_check_ignore(self.pit_path, cwd=self.toplevel)
+        return self._pit_path_ignored
+
+    def invalidate_ignored(self):
+        """
+        Forget the remembered ignore state, for after ignore files are modified.
+        """
+        self._pit_path_ignored = None
@@ -1,5 +1,13 @@
 import os
+import time
 import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
 
 class ChDir:
     """A context manager for changing directories"""
@@ -45,4 +53,80 @@ class WithBackUp:
             shutil.move(self._backup_path, self.path)
         else:
             # Remove backup if no error
-            os.remove(self._backup_path)
\ No newline at end of file
+            os.remove(self._backup_path)
+
+class FileLock:
+    """
+    An exclusive advisory lock held on a file, shared between processes. The lock file is created if needed and never removed.
+
+    ```python
+    >>> with FileLock('.pit/log.lock'):
+    ...     ... # Only one process at a time
+    ```
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        assert self._fd is None, "FileLock is not reentrant"
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01) # LK_LOCK gives up after 10 seconds
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        assert self._fd is not None, "FileLock is not held"
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+def atomic_write(path: str, data: bytes, fsync: bool = False):
+    """
+    Replaces the contents of a file such that readers see either the old or the new contents, never a partial or missing file. Data is written to a uniquely named temporary file in the same directory which is then renamed over `path`.
+
+    Args:
+        path (str): The file to write.
+        data (bytes): The new contents.
+        fsync (bool, optional): Flush the data to disk before the rename, so the new contents also survive a crash.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or os.curdir,
+        prefix=os.path.basename(path) + '.',
+        suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,6 +1,9 @@
+from __future__ import annotations
+import os
 import re
 import subprocess
-from typing import List
+from threading import Thread
+from typing import Dict, List, Iterable, Iterator, Optional, Set
 from datetime import datetime
 from dataclasses import dataclass
 
@@ -51,15 +54,41 @@ def git_show_toplevel() -> str:
 
     return result.stdout.decode().replace('\n', '')
 
-def git_check_ignore(path: str) -> bool:
+def git_discover_toplevel(cwd: Optional[str] = None) -> Optional[str]:
+    """
+    Utility for finding the toplevel directory of the working tree with a single git call.
+
+    Args:
+        cwd (Optional[str], optional): The directory to run in, defaults to the current working directory.
+
+    Returns:
+        Optional[str]: The absolute path of the top level directory, `None` if not inside of a working tree.
+    """
+    result = subprocess.run(
+        ['git', 'rev-parse', '--is-inside-work-tree', '--show-toplevel'],
+        cwd=cwd,
+        capture_output=True
+    )
+
+    lines = result.stdout.decode().split('\n')
+    if result.returncode != 0 or lines[0] != 'true':
+        return None
+    return lines[1]
+
+def git_check_ignore(path: str, cwd: Optional[str] = None) -> bool:
     """
     Utility for determining if specified path is ignored by git.
 
+    Args:
+        path (str): The path to check.
+        cwd (Optional[str], optional): The directory to run in, defaults to the current working directory.
+
     Returns:
         bool: Boolean indicating if the specific path is ignored by git.
     """
     result = subprocess.run(
         ['git', 'check-ignore', path, '-q'],
+        cwd=cwd,
         stderr=subprocess.DEVNULL,
         stdout=subprocess.DEVNULL
     )
@@ -68,40 +97,666 @@ def git_check_ignore(path: str) -> bool:
 
     return result.returncode == 0
 
+def git_check_ignore_many(paths: List[str], cwd: Optional[str] = None) -> Set[str]:
+    """
+    Utility for determining which of many paths are ignored by git, with a single git process.
+
+    Args:
+        paths (List[str]): The paths to check, relative to `cwd`.
+        cwd (Optional[str], optional): The directory to run in, defaults to the current working directory.
+
+    Returns:
+        Set[str]: The paths which are ignored.
+    """
+    if len(paths) == 0:
+        return set()
+
+    result = subprocess.run(
+        ['git', 'check-ignore', '-z', '--stdin'],
+        input=b'\0'.join(os.fsencode(p) for p in paths) + b'\0',
+        cwd=cwd,
+        capture_output=True
+    )
+    # Note: Exits with 1 when no path is ignored
+    if result.returncode not in (0, 1):
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+
+    return set(os.fsdecode(p) for p in result.stdout.split(b'\0') if len(p) != 0)
+
+def git_rev_parse_verify(rev: str, cwd: Optional[str] = None) -> Optional[str]:
+    """
+    Utility for resolving a revision to a commit hash.
+
+    Args:
+        rev (str): The revision to resolve, e.g. `HEAD`.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        Optional[str]: The full hash or `None` if the revision does not exist (e.g. `HEAD` on an unborn branch).
+    """
+    result = subprocess.run(
+        ['git', 'rev-parse', '--verify', '-q', f'{rev}^{{commit}}'],
+        cwd=cwd,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return None
+
+    return result.stdout.decode().strip()
+
+def git_config_bool(key: str, default: bool, cwd: Optional[str] = None) -> bool:
+    """
+    Utility for reading a boolean setting of the git config.
+
+    Args:
+        key (str): The setting, e.g. `core.fileMode`.
+        default (bool): The value when the setting is not set.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        bool: The value of the setting.
+    """
+    result = subprocess.run(
+        ['git', 'config', '--type=bool', '--get', key],
+        cwd=cwd,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return default
+
+    return result.stdout.decode().strip() == 'true'
+
+def git_commit_parents(hash: str, cwd: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Utility for reading the parents of a commit.
+
+    Args:
+        hash (str): The commit.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        Optional[List[str]]: The parent hashes in order, `None` if the commit does not exist (e.g. pruned by `git gc`).
+    """
+    result = subprocess.run(
+        ['git', 'rev-list', '--parents', '-n', '1', hash, '--'],
+        cwd=cwd,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return None
+
+    return result.stdout.decode().split()[1:]
+
+def git_write_tree(env: Optional[dict] = None, cwd: Optional[str] = None) -> str:
+    """
+    Utility for writing the tree object of an index.
+
+    Args:
+        env (Optional[dict], optional): Environment for git, used to specify `GIT_INDEX_FILE`.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        str: The hash of the written tree.
+    """
+    result = subprocess.run(
+        ['git', 'write-tree'],
+        env=env,
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    return result.stdout.decode().strip()
+
+def git_quote_path(path: str) -> bytes:
+    """
+    Quotes a path for commands reading a path per line, which unquote those starting with `"` as C strings (e.g. `git hash-object --stdin-paths`).
+
+    Returns:
+        bytes: The path, quoted only if needed.
+    """
+    encoded = os.fsencode(path)
+    if not encoded.startswith(b'"') and b'\n' not in encoded:
+        return encoded
+    return b'"' + encoded.replace(b'\\', b'\\\\').replace(b'"', b'\\"').replace(b'\n', b'\\n') + b'"'
+
+def git_hash_objects(paths: List[str], cwd: Optional[str] = None) -> List[str]:
+    """
+    Utility for hashing files and writing them as blobs to the object database, with a single git process. Files are passed through the same filters (e.g. `.gitattributes`) as `git add`.
+
+    Args:
+        paths (List[str]): The files to write, relative to `cwd`.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        List[str]: The hash of each blob, in the order of `paths`.
+    """
+    result = subprocess.run(
+        ['git', 'hash-object', '-w', '--stdin-paths'],
+        input=b''.join(git_quote_path(p) + b'\n' for p in paths),
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    hashes = result.stdout.decode().split()
+    if len(hashes) != len(paths):
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return hashes
+
+def git_commit_tree(
+    tree: str,
+    parents: List[str],
+    message: str,
+    cwd: Optional[str] = None
+) -> str:
+    """
+    Utility for creating a commit object from a tree without touching any refs.
+
+    Args:
+        tree (str): The hash of the tree to commit.
+        parents (List[str]): The parent commits.
+        message (str): The commit message.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        str: The hash of the new commit.
+    """
+    args = ['git', 'commit-tree', tree]
+    for p in parents:
+        args += ['-p', p]
+
+    result = subprocess.run(
+        args,
+        input=message.encode(),
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    return result.stdout.decode().strip()
+
+def git_ls_files_others(
+    pathspecs: List[str],
+    ignored: bool = False,
+    cwd: Optional[str] = None
+) -> List[str]:
+    """
+    Utility for listing the untracked files under literal pathspecs. Used to expand the untracked directories `git status` collapses.
+
+    Args:
+        pathspecs (List[str]): The paths to list, taken literally.
+        ignored (bool, optional): Include ignored files.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        List[str]: The files, relative to `cwd`.
+    """
+    args = ['git', '--literal-pathspecs', 'ls-files', '-z', '--others']
+    if not ignored:
+        args.append('--exclude-standard')
+    result = subprocess.run(
+        args + ['--'] + pathspecs,
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    return [os.fsdecode(p) for p in result.stdout.split(b'\0') if len(p) != 0]
+
+def git_ls_files_ignored_directories(cwd: Optional[str] = None) -> List[str]:
+    """
+    Utility for listing the directories which git ignores as a whole, those whose contents `git status` never reads.
+
+    Args:
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Returns:
+        List[str]: The directories relative to `cwd`, without a trailing `/`.
+    """
+    result = subprocess.run(
+        ['git', 'ls-files', '-z', '--others', '--ignored', '--exclude-standard', '--directory'],
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    return [os.fsdecode(p[:-1]) for p in result.stdout.split(b'\0') if p.endswith(b'/')]
+
+@dataclass(frozen=True)
+class GitTreeEntry:
+    """
+    A single blob entry of `git ls-tree -r -l`.
+    """
+    mode: str
+    hash: str
+    size: int
+    path: str
+
+def git_ls_tree(
+    commit: str,
+    pathspecs: Optional[List[str]] = None,
+    cwd: Optional[str] = None
+) -> List[GitTreeEntry]:
+    """
+    Utility for listing the blobs of a commit with their sizes.
+
+    Args:
+        commit (str): The commit to list.
+        pathspecs (Optional[List[str]], optional): Limit the listing to these paths, taken literally.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Raises:
+        subprocess.CalledProcessError: If the commit does not exist.
+
+    Returns:
+        List[GitTreeEntry]: The blobs, submodules are excluded.
+    """
+    args = ['git', '--literal-pathspecs', 'ls-tree', '-r', '-l', '-z', '--full-tree', commit]
+    if pathspecs is not None:
+        args += ['--'] + pathspecs
+    result = subprocess.run(
+        args,
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    entries = []
+    for record in result.stdout.split(b'\0'):
+        if len(record) == 0:
+            continue
+        info, path = record.split(b'\t', 1)
+        mode, kind, hash, size = info.split()
+        if kind != b'blob':
+            continue
+        entries.append(GitTreeEntry(
+            mode=mode.decode(),
+            hash=hash.decode(),
+            size=int(size),
+            path=os.fsdecode(path)
+        ))
+    return entries
+
+def git_cat_file_batch(hashes: List[str], cwd: Optional[str] = None) -> Dict[str, bytes]:
+    """
+    Utility for reading many blobs with a single git process, for small blobs as all contents are held in memory.
+
+    Args:
+        hashes (List[str]): The blobs to read.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Raises:
+        ValueError: If an object does not exist.
+
+    Returns:
+        Dict[str, bytes]: The contents keyed by hash.
+    """
+    if len(hashes) == 0:
+        return {}
+
+    result = subprocess.run(
+        ['git', 'cat-file', '--batch'],
+        input=''.join(f'{h}\n' for h in hashes).encode(),
+        cwd=cwd,
+        check=True,
+        capture_output=True
+    )
+
+    contents = {}
+    out = result.stdout
+    pos = 0
+    for h in hashes:
+        end = out.index(b'\n', pos)
+        header = out[pos:end].split()
+        if len(header) != 3:
+            raise ValueError("Unable to read object: %s" % h)
+        size = int(header[2])
+        contents[h] = out[end + 1:end + 1 + size]
+        # Note: Contents are followed by a newline
+        pos = end + 1 + size + 1
+    return contents
+
+@dataclass(frozen=True)
+class GitStatusEntry:
+    """
+    A single entry of `git status --porcelain=v2 -z`.
+
+    Paths are bytes exactly as stored by git and are relative to the repository root.
+    """
+    code: str
+    """
+    The short form status code, e.g. `' M'`, `'R '`, `'??'` or `'!!'`.
+    """
+    path: bytes
+    orig_path: Optional[bytes] = None
+    """
+    The source path of renames and copies.
+    """
+
+class GitStatusParser:
+    """
+    Incremental parser for `git status --porcelain=v2 -z` output.
+
+    Output is fed in arbitrary chunks and entries are returned as soon as they are complete, so memory use is bounded by the longest record rather than the full output.
+    """
+    # Number of space separated fields preceding the path for each record type
+    _FIELDS_BEFORE_PATH = {
+        b'1': 8,
+        b'2': 9,
+        b'u': 10,
+    }
+
+    def __init__(self):
+        self._buffer = b''
+        self._pending: Optional[bytes] = None
+
+    def feed(self, chunk: bytes) -> List[GitStatusEntry]:
+        """
+        Args:
+            chunk (bytes): The next chunk of output.
+
+        Returns:
+            List[GitStatusEntry]: Entries completed by this chunk.
+        """
+        fields = (self._buffer + chunk).split(b'\0')
+        self._buffer = fields.pop()
+
+        entries = []
+        for field in fields:
+            entry = self._parse_field(field)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def close(self):
+        assert self._buffer == b'' and self._pending is None, "Incomplete git status output"
+
+    def _parse_field(self, field: bytes) -> Optional[GitStatusEntry]:
+        if self._pending is not None:
+            # Second field of a rename / copy record is the original path
+            record, self._pending = self._pending, None
+            _, xy, *_, path = record.split(b' ', self._FIELDS_BEFORE_PATH[b'2'])
+            return GitStatusEntry(
+                code=self._short_code(xy),
+                path=path,
+                orig_path=field
+            )
+
+        kind = field[:1]
+        if kind == b'?':
+            return GitStatusEntry(code='??', path=field[2:])
+        elif kind == b'!':
+            return GitStatusEntry(code='!!', path=field[2:])
+        elif kind == b'2':
+            self._pending = field
+            return None
+        elif kind in self._FIELDS_BEFORE_PATH:
+            _, xy, *_, path = field.split(b' ', self._FIELDS_BEFORE_PATH[kind])
+            return GitStatusEntry(code=self._short_code(xy), path=path)
+        elif kind == b'#':
+            return None # Headers
+
+        raise ValueError("Unknown git status record: %r" % field[:40])
+
+    @staticmethod
+    def _short_code(xy: bytes) -> str:
+        return xy.decode().replace('.', ' ')
+
+GIT_STATUS_ARGS = ['status', '--porcelain=v2', '-z']
+"""
+Arguments of the `git status` output parsed by `GitStatusParser`.
+"""
+
+def git_status_porcelain_v2(
+    args: Optional[List[str]] = None,
+    chunk_size: int = 65536,
+    cwd: Optional[str] = None
+) -> Iterator[GitStatusEntry]:
+    """
+    Utility for streaming `git status --porcelain=v2 -z`, entries are yielded as they are read from the pipe.
+
+    Args:
+        args (Optional[List[str]], optional): Additional arguments for `git status`, e.g. `['--ignored']`.
+        chunk_size (int, optional): Size of reads from the pipe.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Raises:
+        subprocess.CalledProcessError: If git exits with a non zero return code.
+
+    Yields:
+        GitStatusEntry: The parsed entries.
+    """
+    cmd = ['git'] + GIT_STATUS_ARGS
+    if args is not None:
+        cmd += args
+
+    proc = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    parser = GitStatusParser()
+    try:
+        while True:
+            chunk = proc.stdout.read1(chunk_size)
+            if len(chunk) == 0:
+                break
+            yield from parser.feed(chunk)
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    parser.close()
+
 @dataclass
 class GitCommitDetails:
     hash: str
     date: datetime
     files_changed: List[str]
 
-def git_commit_details(hash: str) -> GitCommitDetails:
+def git_commit_details(hash: str, cwd: Optional[str] = None) -> GitCommitDetails:
     """
     Utility for parsing relevant details about git commits.
 
     Args:
         hash (str): The git hash to collect details on
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Raises:
+        ValueError: If the commit can not be resolved.
 
     Returns:
         GitCommitDetails: The parsed details
     """
-    result = subprocess.run(
-        [
-            'git', 'show', hash,
-            '--name-only',
-            '--format=format:%cI'
-        ],
-        capture_output=True,
-        check=True
-    )
+    with GitCommitDetailsBatch(cwd=cwd) as batch:
+        return batch.details(hash)
+
+GIT_BATCH_SENTINEL = b'\x1epit-batch-end'
+"""
+Line written after each commit sent to `GitCommitDetailsBatch`. `git diff-tree --stdin` echoes (and flushes) lines which are not object names, so this marks the end of the output for each commit.
+"""
+
+GIT_BATCH_ARGS = [
+    'diff-tree',
+    '--stdin',
+    '--always',
+    '--root',
+    '-r',
+    '--cc',
+    '--name-only',
+    '-z',
+    '--format=format:%H%x00%cI%x00'
+]
+"""
+Arguments of the `git diff-tree` process which resolves `GitCommitDetails`, see `GitCommitDetailsBatch`.
+"""
+
+def git_batch_request(hash: str) -> bytes:
+    """
+    Returns:
+        bytes: The input requesting details of a commit from the `GIT_BATCH_ARGS` process.
+    """
+    return hash.encode() + b'\n' + GIT_BATCH_SENTINEL + b'\n'
+
+def git_parse_batch_record(record: bytes, hash: str) -> GitCommitDetails:
+    """
+    Parses the output of the `GIT_BATCH_ARGS` process for a single commit, up to but excluding the sentinel.
 
-    result = result.stdout.decode().split('\n')
+    Args:
+        record (bytes): The output for the commit.
+        hash (str): The requested hash, for errors.
 
-    # Parse datetime out
-    date = datetime.fromisoformat(result[0])
-    files = list(filter(lambda s: len(s) != 0, result[1:]))
+    Raises:
+        ValueError: If the commit could not be resolved.
+
+    Returns:
+        GitCommitDetails: The parsed details.
+    """
+    # Note: Commits after the first are separated from the previous output by a NUL
+    parts = record.lstrip(b'\0').split(b'\0')
+    if len(parts) < 2:
+        raise ValueError("Unable to resolve commit: %s" % hash)
+
+    files = parts[2:]
+    if len(files) != 0 and files[0].startswith(b'\n'):
+        # Non-merge commits separate the header and file list with a newline
+        files[0] = files[0][1:]
 
     return GitCommitDetails(
-        hash=hash,
-        date=date,
-        files_changed=files
-    )
\ No newline at end of file
+        hash=parts[0].decode(),
+        date=datetime.fromisoformat(parts[1].decode()),
+        files_changed=[os.fsdecode(f) for f in files if len(f) != 0]
+    )
+
+class GitCommitDetailsBatch:
+    """
+    A long running `git diff-tree --stdin` process which resolves `GitCommitDetails` for any number of commits.
+
+    The details produced match those of `git_commit_details(...)`, but only a single git process is used for all lookups.
+
+    ```python
+    >>> with GitCommitDetailsBatch() as batch:
+    ...     for details in batch.iter_details(hashes):
+    ...         print(details.date)
+    ```
+    """
+    def __init__(self, cwd: Optional[str] = None):
+        self._proc = subprocess.Popen(
+            ['git'] + GIT_BATCH_ARGS,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self._buffer = b''
+
+    def __enter__(self) -> GitCommitDetailsBatch:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        # Note: Closing stdout before waiting assures git exits even if output was left unread
+        self._proc.stdout.close()
+        self._proc.wait()
+
+    def _write_request(self, hash: str):
+        self._proc.stdin.write(git_batch_request(hash))
+
+    def _read_details(self, hash: str) -> GitCommitDetails:
+        terminator = GIT_BATCH_SENTINEL + b'\n'
+        while True:
+            pos = self._buffer.find(terminator)
+            if pos != -1:
+                break
+
+            chunk = self._proc.stdout.read1(65536)
+            if len(chunk) == 0:
+                raise RuntimeError("git diff-tree exited unexpectedly")
+            self._buffer += chunk
+
+        record, self._buffer = self._buffer[:pos], self._buffer[pos+len(terminator):]
+        return git_parse_batch_record(record, hash)
+
+    def details(self, hash: str) -> GitCommitDetails:
+        """
+        Resolve details for a single commit.
+
+        Args:
+            hash (str): The git hash to collect details on
+
+        Raises:
+            ValueError: If the commit can not be resolved.
+
+        Returns:
+            GitCommitDetails: The parsed details
+        """
+        self._write_request(hash)
+        self._proc.stdin.flush()
+
+        return self._read_details(hash)
+
+    def iter_details(self, hashes: Iterable[str]) -> Iterator[GitCommitDetails]:
+        """
+        Resolve details for many commits, yielding each as soon as it has been parsed.
+
+        Hashes are written from a background thread so git never blocks on a full output pipe.
+
+        Args:
+            hashes (Iterable[str]): The git hashes to collect details on
+
+        Raises:
+            ValueError: If a commit can not be resolved.
+
+        Yields:
+            GitCommitDetails: The parsed details, in the same order as `hashes`.
+        """
+        hashes = list(hashes)
+
+        def writer():
+            try:
+                for hash in hashes:
+                    self._write_request(hash)
+                self._proc.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                pass # Reader stopped early
+
+        t = Thread(target=writer, daemon=True)
+        t.start()
+
+        for hash in hashes:
+            yield self._read_details(hash)
+
+        t.join()
+
+def git_commit_details_batch(
+    hashes: Iterable[str],
+    cwd: Optional[str] = None
+) -> Iterator[GitCommitDetails]:
+    """
+    Utility for parsing relevant details about many git commits with a single git process.
+
+    Args:
+        hashes (Iterable[str]): The git hashes to collect details on
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+
+    Yields:
+        GitCommitDetails: The parsed details, in the same order as `hashes`.
+    """
+    hashes = list(hashes)
+    if len(hashes) == 0:
+        return
+
+    with GitCommitDetailsBatch(cwd=cwd) as batch:
+        yield from batch.iter_details(hashes)
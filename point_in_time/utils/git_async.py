@@ -0,0 +1,198 @@
+"""
+Asyncio counterparts of the utilities in `point_in_time.utils.git`, output is parsed by the same parsers.
+
+Each utility accepts a `limiter`, a semaphore held for as long as its git process runs, which bounds how many git processes run at once.
+"""
+from __future__ import annotations
+import asyncio
+import subprocess
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, List, Optional
+
+from .git import (
+    GIT_BATCH_ARGS,
+    GIT_BATCH_SENTINEL,
+    GIT_STATUS_ARGS,
+    GitCommitDetails,
+    GitStatusEntry,
+    GitStatusParser,
+    git_batch_request,
+    git_parse_batch_record
+)
+
+@asynccontextmanager
+async def _limit(limiter: Optional[asyncio.Semaphore]):
+    if limiter is None:
+        yield
+    else:
+        async with limiter:
+            yield
+
+async def _stop(proc: asyncio.subprocess.Process):
+    """
+    Kills git if it is still running, for consumers which stopped early or were cancelled.
+    """
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    await proc.wait()
+
+async def git_run_async(
+    args: List[str],
+    input: Optional[bytes] = None,
+    env: Optional[dict] = None,
+    cwd: Optional[str] = None,
+    limiter: Optional[asyncio.Semaphore] = None
+) -> subprocess.CompletedProcess:
+    """
+    Utility for running a git command to completion, the equivalent of `subprocess.run(['git', ...], capture_output=True)`.
+
+    Args:
+        args (List[str]): The git arguments, excluding `git`.
+        input (Optional[bytes], optional): Written to the stdin of git.
+        env (Optional[dict], optional): Environment for git.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+        limiter (Optional[asyncio.Semaphore], optional): Held while git runs.
+
+    Returns:
+        subprocess.CompletedProcess: The return code and captured output, the return code is not checked.
+    """
+    cmd = ['git'] + args
+    async with _limit(limiter):
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=cwd
+        )
+        try:
+            stdout, stderr = await proc.communicate(input)
+        finally:
+            # Note: Cancellation must not leave git running
+            await _stop(proc)
+
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+async def git_status_porcelain_v2_async(
+    args: Optional[List[str]] = None,
+    chunk_size: int = 65536,
+    cwd: Optional[str] = None,
+    limiter: Optional[asyncio.Semaphore] = None
+) -> AsyncIterator[GitStatusEntry]:
+    """
+    Asyncio equivalent of `git_status_porcelain_v2(...)`, entries are yielded as they are read from the pipe.
+
+    Args:
+        args (Optional[List[str]], optional): Additional arguments for `git status`, e.g. `['--ignored']`.
+        chunk_size (int, optional): Size of reads from the pipe.
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+        limiter (Optional[asyncio.Semaphore], optional): Held while git runs.
+
+    Raises:
+        subprocess.CalledProcessError: If git exits with a non zero return code.
+
+    Yields:
+        GitStatusEntry: The parsed entries.
+    """
+    cmd = ['git'] + GIT_STATUS_ARGS
+    if args is not None:
+        cmd += args
+
+    async with _limit(limiter):
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd
+        )
+        parser = GitStatusParser()
+        try:
+            while True:
+                chunk = await proc.stdout.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+                for entry in parser.feed(chunk):
+                    yield entry
+
+            stderr = await proc.stderr.read()
+            returncode = await proc.wait()
+        finally:
+            # Note: Only has an effect if the consumer stopped early
+            await _stop(proc)
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    parser.close()
+
+async def git_commit_details_batch_async(
+    hashes: Iterable[str],
+    cwd: Optional[str] = None,
+    limiter: Optional[asyncio.Semaphore] = None
+) -> AsyncIterator[GitCommitDetails]:
+    """
+    Asyncio equivalent of `git_commit_details_batch(...)`, a single git process resolves all commits and details are yielded as they are parsed.
+
+    Args:
+        hashes (Iterable[str]): The git hashes to collect details on
+        cwd (Optional[str], optional): The directory to run git in, defaults to the current working directory.
+        limiter (Optional[asyncio.Semaphore], optional): Held while git runs.
+
+    Raises:
+        ValueError: If a commit can not be resolved.
+
+    Yields:
+        GitCommitDetails: The parsed details, in the same order as `hashes`.
+    """
+    hashes = list(hashes)
+    if len(hashes) == 0:
+        return
+
+    async with _limit(limiter):
+        proc = await asyncio.create_subprocess_exec(
+            'git', *GIT_BATCH_ARGS,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=cwd
+        )
+
+        async def writer():
+            # Note: Runs alongside the reader so git never blocks on a full output pipe
+            try:
+                for hash in hashes:
+                    proc.stdin.write(git_batch_request(hash))
+                    await proc.stdin.drain()
+                proc.stdin.close()
+            except ConnectionError:
+                pass # Reader stopped early
+
+        write_task = asyncio.ensure_future(writer())
+        terminator = GIT_BATCH_SENTINEL + b'\n'
+        buffer = b''
+        try:
+            for hash in hashes:
+                while True:
+                    pos = buffer.find(terminator)
+                    if pos != -1:
+                        break
+
+                    chunk = await proc.stdout.read(65536)
+                    if len(chunk) == 0:
+                        raise RuntimeError("git diff-tree exited unexpectedly")
+                    buffer += chunk
+
+                record, buffer = buffer[:pos], buffer[pos+len(terminator):]
+                yield git_parse_batch_record(record, hash)
+
+            # Note: Git exits by itself once the writer closes stdin
+            await write_task
+            await proc.wait()
+        finally:
+            write_task.cancel()
+            await _stop(proc)
+            await asyncio.gather(write_task, return_exceptions=True)
@@ -1,22 +1,24 @@
+from __future__ import annotations
 import os
-import subprocess
 from typing import Optional, Union, Dict, List, Tuple, Set
-from contextlib import ExitStack
 
-from pathspec import PathSpec
-from pathspec.patterns import GitWildMatchPattern
-
-from point_in_time.constants.main import PIT_DIR_NAME
-
-from .fs import ChDir
-from .git import git_show_toplevel, git_check_ignore
+from .matcher import PathMatcher
+from .context import RepoContext
+from .git import GitStatusEntry, git_status_porcelain_v2
 
 GIT_STATUS_CODES_W_TUPLE = (
     ' R',
-    'R '
+    'R ',
+    'RM',
+    'RT',
+    'RD',
+    'C ',
+    'CM',
+    'CT',
+    'CD'
 )
 """
-Git short form status 'codes' which indicate that there will be two paths separated by '->'. This can be used with `status_filter_pathspec` to know which keys will have a list of tuple with two items (`Set[Tuple[str]]`) instead of a simple list of of strings (`Set[str]`).
+Git short form status 'codes' of renames and copies, which carry both the original and new path. This can be used with `status_filter_pathspec` to know which keys will have a list of tuple with two items (`Set[Tuple[str]]`) instead of a simple list of of strings (`Set[str]`).
 """
 
 GIT_STATUS_CODES_UNMERGED = (
@@ -57,48 +59,247 @@ def get_pit_path(git_path: Optional[str] = None) -> str:
     Args:
         git_path (Optional[str], optional): Optional path to a git repository, if not provided, the current working directory will be assumed.
 
+    Raises:
+        NotADirectoryError: If `git_path` is not a directory.
+
     Returns:
         str: The path where the pit directory should ~exist~
     """
-    with ExitStack() as e: # For optional ChDir manager
-        if git_path is not None:
-            e.enter_context(ChDir(git_path))
-
-        git_toplevel = git_show_toplevel()
+    return RepoContext.current(git_path).pit_path
 
-        return os.path.join(
-            git_toplevel,
-            PIT_DIR_NAME
-        )
-
-def is_pit_path_ignored() -> bool:
+def is_pit_path_ignored(context: Optional[RepoContext] = None) -> bool:
     """
     General purpose utility for checking if the pit directory is ignored by git.
 
+    Args:
+        context (Optional[RepoContext], optional): The repository to check, defaults to that of the current working directory.
+
     Returns:
         bool: Boolean indicating if the pit dir is ignored by git
     """
-    pit_path = get_pit_path()
-    return git_check_ignore(pit_path)
-
-def find_unescaped_qoute(string: str, start: int) -> int:
-    escaped = False
-    for i in range(start, len(string)):
-        if escaped:
-            escaped = False
-            continue # Ignore anything escaped
+    if context is None:
+        context = RepoContext.current()
+    return context.is_pit_path_ignored
+
+GIT_GLOB_SPECIAL_CHARACTERS = '*?['
+
+def pathspec_to_git_pathspecs(
+    pathspec: List[str]
+) -> Tuple[Optional[List[str]], bool]:
+    """
+    Translates the pattern lines accepted by `status_filter_pathspec` into native git pathspecs (using the `glob` magic) which select a superset of the matching paths. Passing these to `git status` lets git skip whole directories instead of filtering them afterwards.
+
+    ```python
+    >>> pathspec_to_git_pathspecs(['*.py', 'docs/'])
+    ([':(glob)**/*.py', ':(glob)**/*.py/**', ':(glob)**/docs/**'], True)
+    >>> pathspec_to_git_pathspecs(['*', '!secrets.txt'])
+    (None, False)
+    ```
+
+    Negations and escaped patterns have no native equivalent, when present the translation is not exact and the status must still be filtered in python.
+
+    Args:
+        pathspec (List[str]): The pattern lines.
+
+    Returns:
+        Tuple[Optional[List[str]], bool]: The git pathspecs, `None` if the whole worktree must be scanned, and whether the pathspecs select exactly the same paths.
+    """
+    pathspecs = []
+    exact = True
+    match_all = False
+    for line in pathspec:
+        line = line.rstrip('\r').rstrip(' ')
+        if line == '' or line.startswith('#'):
+            continue
+
+        if line.startswith('!'):
+            # Order dependent re-inclusion can't be expressed, negations only narrow the superset
+            exact = False
+            continue
+
+        if '\\' in line:
+            # Escapes have no native equivalent, fall back to scanning everything
+            return None, False
+
+        dir_only = line.endswith('/')
+        pattern = line.strip('/')
+        if pattern == '':
+            continue
+
+        # A slash anywhere but the end anchors the pattern to the root
+        anchored = '/' in line.rstrip('/')
+        if pattern in ('*', '**') and not dir_only:
+            match_all = True
+            continue
+        if not anchored and not pattern.startswith('**/'):
+            pattern = '**/' + pattern
+
+        if not dir_only:
+            pathspecs.append(f':(glob){pattern}')
+        # Matching a directory includes everything below it
+        pathspecs.append(f':(glob){pattern}/**')
+
+    if match_all:
+        return None, exact
+    return pathspecs, exact
+
+class GitStatus:
+    """
+    A single capture of `git status --porcelain=v2 --ignored` which can be filtered by any number of pathspecs in memory.
+
+    Paths are relative to the repository root and decoded with `os.fsdecode`, so `os.fsencode` recovers the exact bytes git reported.
+
+    ```python
+    >>> status = GitStatus.collect()
+    >>> status.filter_pathspec(['*.py'])
+    {' M': ['main.py']}
+    >>> status.filter_pathspec(['docs/'])
+    {'??': ['docs/']}
+    ```
+    """
+    def __init__(
+        self,
+        files_by_code: Dict[str, List[Union[str, Tuple[str]]]],
+        pathspecs: Optional[List[str]] = None
+    ):
+        self.files_by_code = files_by_code
+        self.pathspecs = pathspecs
+        """
+        The git pathspecs the capture was limited to, `None` if the whole worktree was scanned.
+        """
+
+    @classmethod
+    def collect(
+        cls,
+        pathspecs: Optional[List[str]] = None,
+        ignored: str = 'traditional',
+        untracked: str = 'normal',
+        cwd: Optional[str] = None
+    ) -> GitStatus:
+        """
+        Runs and parses `git status`, this is the only part which scans the worktree.
+
+        Args:
+            pathspecs (Optional[List[str]], optional): Native git pathspecs to limit the scan to, git will skip directories which can not match. If not provided the whole worktree is scanned.
+            ignored (str, optional): The `--ignored` mode of `git status`. `no` skips enumerating ignored files entirely, `matching` reports only the paths matched by ignore rules, without walking into ignored directories.
+            untracked (str, optional): The `--untracked-files` mode of `git status`. `all` reports individual files instead of collapsing untracked (and ignored) directories.
+            cwd (Optional[str], optional): The directory to run git in, pathspecs are relative to it. Defaults to the current working directory.
+
+        Returns:
+            GitStatus: The captured status.
+        """
+        status = cls({}, pathspecs=pathspecs)
+        args = cls.collect_args(pathspecs, ignored, untracked)
+        if args is None:
+            return status
+
+        for entry in git_status_porcelain_v2(args, cwd=cwd):
+            status.add_entry(entry)
+
+        return status
+
+    @staticmethod
+    def collect_args(
+        pathspecs: Optional[List[str]] = None,
+        ignored: str = 'traditional',
+        untracked: str = 'normal'
+    ) -> Optional[List[str]]:
+        """
+        The `git status` arguments used by `collect(...)`, for callers which run git themselves (see `point_in_time.async_repo`).
+
+        Returns:
+            Optional[List[str]]: The arguments, `None` if nothing can match and git need not be run.
+        """
+        if pathspecs is not None and len(pathspecs) == 0:
+            # Nothing can match
+            return None
+
+        args = [f'--ignored={ignored}', f'--untracked-files={untracked}']
+        if pathspecs is not None:
+            args += ['--'] + pathspecs
+        return args
+
+    def add_entry(self, entry: GitStatusEntry):
+        """
+        Adds a parsed `git status` entry to the capture.
+        """
+        if entry.code not in self.files_by_code:
+            self.files_by_code[entry.code] = []
+
+        if entry.orig_path is not None:
+            self.files_by_code[entry.code].append((
+                os.fsdecode(entry.orig_path),
+                os.fsdecode(entry.path)
+            ))
         else:
-            if string[i] == '\\': # Evals to a string slash
-                escaped = True
-            if string[i] == '"':
-                return i
-    return -1
+            self.files_by_code[entry.code].append(os.fsdecode(entry.path))
+
+    def filter_pathspec(
+        self,
+        pathspec: Union[List[str], PathMatcher]
+    ) -> Dict[str, List[Union[str, Tuple[str]]]]:
+        """
+        Filters the captured status based on a git [pathspec](https://git-scm.com/docs/gitglossary#Documentation/gitglossary.txt-aiddefpathspecapathspec). See `status_filter_pathspec` for details on the return.
+
+        Args:
+            pathspec (Union[List[str], PathMatcher]): The pathspec lines to filter by, or an already compiled matcher.
+
+        Returns:
+            Dict[str]: The git status filtered by the pathspec file (including ignored files).
+        """
+        # Filter based on specified pathspec
+        files_by_code = {}
+        spec = pathspec if isinstance(pathspec, PathMatcher) else PathMatcher(pathspec)
+        for code, paths in self.files_by_code.items():
+            matched = set()
+            for p in paths:
+                if isinstance(p, tuple):
+                    # Note: There is a design decision here to include both paths if one side is matched.
+                    if spec.match_file(p[0]) or spec.match_file(p[1]):
+                        matched.add(p)
+                elif spec.match_file(p):
+                    matched.add(p)
+
+            files_by_code[code] = matched
+
+        # Normalize by removing codes no items and sorting
+        files_by_code = {
+            k:sorted(v)
+            for k, v in files_by_code.items()
+            if v != set()
+        }
+
+        return files_by_code
+
+    def merge_ignored(self, other: GitStatus):
+        """
+        Replaces the ignored (`!!`) paths of this capture with those of another, for when ignored paths are collected by a separate, more narrowly scoped scan.
+
+        Args:
+            other (GitStatus): The capture to take ignored paths from.
+        """
+        self.files_by_code.pop('!!', None)
+        ignored = other.files_by_code.get('!!', [])
+        if len(ignored) != 0:
+            self.files_by_code['!!'] = ignored
+
+    def all_paths(self) -> Dict[str, List[Union[str, Tuple[str]]]]:
+        """
+        Returns:
+            Dict[str]: All captured paths, normalized in the same way as `filter_pathspec`.
+        """
+        return {
+            k:sorted(v)
+            for k, v in self.files_by_code.items()
+            if len(v) != 0
+        }
 
 def status_filter_pathspec(
     pathspec: List[str],
+    status: Optional[GitStatus] = None
 ) -> Dict[str, List[Union[str, Tuple[str]]]]:
     """
-    This utility parses the output of `git status --short` and filters based on a git [pathspec](https://git-scm.com/docs/gitglossary#Documentation/gitglossary.txt-aiddefpathspecapathspec). See an example return below.
+    This utility collects the git status (see `GitStatus.collect`, which parses the `git status --porcelain=v2 -z` stream) and filters based on a git [pathspec](https://git-scm.com/docs/gitglossary#Documentation/gitglossary.txt-aiddefpathspecapathspec). See an example return below.
 
     ```python
     >>> status_filter_pathspec(...)
@@ -109,88 +310,47 @@ def status_filter_pathspec(
     }
     ```
 
-    As shown above, this function will either return a dictionary with a list of tuple with two items (`Set[Tuple[str]]`) OR a simple list of of strings (`Set[str]`). The git status codes (which are the dictionary keys) which return `Tuple[str]` are indicated by `GIT_STATUS_CODES_W_TUPLE`. Read more about the short form git status [here](https://git-scm.com/docs/git-status#_short_format).
+    As shown above, this function will either return a dictionary with a list of tuple with two items (`Set[Tuple[str]]`) OR a simple list of of strings (`Set[str]`). The keys are the two character short form status codes, which porcelain v2 records are translated to. The codes which return `Tuple[str]` are indicated by `GIT_STATUS_CODES_W_TUPLE`. Read more about the short form git status [here](https://git-scm.com/docs/git-status#_short_format).
 
     **NOTE:** Pathspecs are parsed by [cpburnz/python-pathspec](https://github.com/cpburnz/python-pathspec).
 
     Args:
         pathspec (List[str]): The pathspec to filter by.
+        status (Optional[GitStatus], optional): A previously collected status to filter, if not provided `git status` will be run.
 
     Returns:
         Dict[str]: The git status filtered by the pathspec file (including ignored files).
     """
-    status = subprocess.run(
-        args=['git', 'status', '--short', '--ignored'],
-        check=True,
-        capture_output=True,
-    )
-    status = status.stdout.decode().split('\n')
+    if status is None:
+        status = GitStatus.collect()
 
-    # Parse status into two lists
-    files_by_code: Dict[List] = {}
-    for line in status:
-        if line == '':
-            continue
-        code, rest = line[:2], line[3:]
+    return status.filter_pathspec(pathspec)
 
-        if rest.startswith('"'):
-            pos = find_unescaped_qoute(rest, 1)
-            assert pos != -1, "Found unclosed quote in line: %s" % line
-            path_one, rest = rest[1:pos], rest[pos+2:]
-
-            # Process any escape sequences in the quoted string
-            path_one = bytes(path_one, 'utf-8').decode('unicode_escape')
-        else:
-            pos = rest.find(' ')
-            if pos == -1:
-                pos = len(rest)
-            path_one, rest = rest[0:pos], rest[pos+1:]
+def flatten_status_paths(
+    files_by_code: Dict[str, List[Union[str, Tuple[str]]]],
+    codes: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Flattens the output of `status_filter_pathspec` into a list of paths, expanding the path tuples of renames.
 
-        if not rest.startswith('->'):
-            path_two = None
-        else:
-            if rest[3] == '"':
-                assert rest.endswith('"'), "Found unclosed quote on line: %s" % line
-                path_two = rest[4:-1]
+    Args:
+        files_by_code (Dict[str, List[Union[str, Tuple[str]]]]): Paths keyed by git short form status code.
+        codes (Optional[List[str]], optional): Only flatten the paths of these codes, by default all codes are used.
 
-                # Process any escape sequences in the quoted string
-                path_two = bytes(path_two, 'utf-8').decode('unicode_escape')
+    Returns:
+        List[str]: The flattened paths.
+    """
+    flattened = []
+    for code, paths in files_by_code.items():
+        if codes is not None and code not in codes:
+            continue
+        for p in paths:
+            if isinstance(p, tuple):
+                flattened += p
             else:
-                path_two = rest[3:]
-
-        if code not in files_by_code:
-            files_by_code[code] = []
-
-        if path_two is not None:
-            assert code in (' R', 'R '), "Assumption about '->' broken."
-            files_by_code[code].append((path_one, path_two))
-        else:
-            files_by_code[code].append(path_one)
-
-    # Filter based on specified pathspec
-    spec = PathSpec.from_lines(GitWildMatchPattern, pathspec)
-    for code in files_by_code.keys():
-        if code in GIT_STATUS_CODES_W_TUPLE:
-            # Note: There is a design decision here to include both paths if one side is matched.
-            matched = set()
-            for file_one, file_two in files_by_code[code]:
-                if spec.match_file(file_one) or spec.match_file(file_two):
-                    matched.add((file_one, file_two))
-
-            files_by_code[code] = matched
-        else:
-            files_by_code[code] = set(
-                spec.match_files(files_by_code[code])
-            )
-
-    # Normalize by removing codes no items and sorting
-    files_by_code = {
-        k:sorted(v)
-        for k, v in files_by_code.items()
-        if v != set()
-    }
+                flattened.append(p)
 
-    return files_by_code
+    return flattened
 
 def code_to_status_string(code: str) -> str:
     """
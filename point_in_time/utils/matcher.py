@@ -0,0 +1,191 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pathspec.patterns import GitWildMatchPattern
+
+__all__ = ['PathMatcher']
+
+GLOB_CHARACTERS = '*?[\\'
+
+def literal_prefix(line: str) -> str:
+    """
+    Finds the literal directory prefix of an include pattern, the part which any matched path must start with.
+
+    ```python
+    >>> literal_prefix('src/models/*.py')
+    'src/models'
+    >>> literal_prefix('*.py') # Unanchored patterns match anywhere
+    ''
+    ```
+
+    Args:
+        line (str): The pattern line, without a leading `!`.
+
+    Returns:
+        str: The prefix, empty when the pattern can match anywhere.
+    """
+    # A slash anywhere but the end anchors the pattern to the root
+    if '/' not in line.rstrip('/'):
+        return ''
+
+    components = []
+    for c in line.strip('/').split('/'):
+        if any(g in c for g in GLOB_CHARACTERS):
+            break
+        components.append(c)
+    return '/'.join(components)
+
+class _TrieNode:
+    __slots__ = ('children', 'patterns', 'subtree')
+
+    def __init__(self):
+        self.children: Dict[str, _TrieNode] = {}
+        self.patterns: List[int] = []
+        """Patterns whose literal prefix ends at this node"""
+        self.subtree: List[int] = []
+        """Patterns whose literal prefix ends at or below this node"""
+
+class _DirState:
+    __slots__ = ('include', 'candidates', 'node')
+
+    def __init__(self, include: bool, candidates: Tuple[int], node: Optional[_TrieNode]):
+        self.include = include
+        """Result for paths under the directory if no candidate matches"""
+        self.candidates = candidates
+        """Patterns which may still change the result for paths under the directory, in order"""
+        self.node = node
+        """Trie node of the directory, `None` once the directory is outside of all literal prefixes"""
+
+class PathMatcher:
+    """
+    Compiled matcher for gitignore style pattern lines, as used by the include file. Results match `PathSpec.from_lines(GitWildMatchPattern, lines).match_file(...)`: the last matching pattern decides.
+
+    Patterns are stored in a trie keyed by their literal directory prefix. Evaluation state is computed once per directory:
+    - A pattern which matches a directory matches everything below it, so it decides the result for that subtree and every earlier pattern is dropped.
+    - Anchored patterns whose prefix diverges from the directory can never match below it and are dropped.
+
+    A path is then only tested against the patterns left for its directory, and whole subtrees with none left are decided without testing any pattern. Matching cost scales with the number of distinct directories rather than paths × patterns.
+    """
+    def __init__(self, lines: Iterable[str]):
+        self.lines = list(lines)
+
+        patterns = []
+        for line in self.lines:
+            pattern = GitWildMatchPattern(line)
+            if pattern.include is None:
+                continue # Comment or blank line
+
+            stripped = line.strip()
+            if stripped.startswith('!'):
+                stripped = stripped[1:]
+            prefix = '' if '\\' in stripped else literal_prefix(stripped)
+
+            patterns.append((pattern.regex, pattern.include, prefix))
+
+        self._build(patterns)
+
+    def _build(self, patterns: List[Tuple[re.Pattern, bool, str]]):
+        self._patterns = patterns
+        self._regex = [p[0] for p in patterns]
+        self._include = [p[1] for p in patterns]
+        self._root = _TrieNode()
+
+        for idx, (_, _, prefix) in enumerate(patterns):
+            node = self._root
+            node.subtree.append(idx)
+            if prefix != '':
+                for c in prefix.split('/'):
+                    node = node.children.setdefault(c, _TrieNode())
+                    node.subtree.append(idx)
+            node.patterns.append(idx)
+
+        self._dirs: Dict[str, _DirState] = {
+            '': _DirState(False, tuple(self._root.subtree), self._root)
+        }
+
+    def __getstate__(self):
+        # Note: Directory states are specific to the paths matched so are not kept
+        return {
+            'lines': self.lines,
+            'patterns': [
+                (regex.pattern, regex.flags, include, prefix)
+                for regex, include, prefix in self._patterns
+            ]
+        }
+
+    def __setstate__(self, state):
+        self.lines = state['lines']
+        self._build([
+            (re.compile(pattern, flags), include, prefix)
+            for pattern, flags, include, prefix in state['patterns']
+        ])
+
+    def _dir_state(self, directory: str) -> _DirState:
+        state = self._dirs.get(directory)
+        if state is not None:
+            return state
+
+        parent, _, name = directory.rpartition('/')
+        parent_state = self._dir_state(parent)
+
+        node = None
+        if parent_state.node is not None:
+            node = parent_state.node.children.get(name)
+        # Anchored patterns survive if their prefix is an ancestor of this directory or lies below it
+        compatible = set(self._root.patterns)
+        n = self._root
+        for c in directory.split('/'):
+            n = n.children.get(c)
+            if n is None:
+                break
+            compatible.update(n.patterns)
+        if node is not None:
+            compatible.update(node.subtree)
+
+        include = parent_state.include
+        candidates = []
+        test_path = directory + '/'
+        for idx in parent_state.candidates:
+            if idx not in compatible:
+                continue
+            if self._regex[idx].search(test_path) is not None:
+                # Matches everything under this directory, earlier patterns no longer matter
+                include = self._include[idx]
+                candidates = []
+                continue
+            candidates.append(idx)
+
+        state = _DirState(include, tuple(candidates), node)
+        self._dirs[directory] = state
+        return state
+
+    def match_file(self, path: str) -> bool:
+        """
+        Args:
+            path (str): A path relative to the repository root, directories may have a trailing `/`.
+
+        Returns:
+            bool: If the path is matched.
+        """
+        directory = path.rstrip('/').rpartition('/')[0]
+        state = self._dir_state(directory)
+
+        result = state.include
+        for idx in state.candidates:
+            if self._regex[idx].search(path) is not None:
+                result = self._include[idx]
+        return result
+
+    def may_match_under(self, directory: str) -> bool:
+        """
+        Args:
+            directory (str): A directory relative to the repository root, without a trailing `/`.
+
+        Returns:
+            bool: `False` if no path below the directory can be matched, so it need not be walked.
+        """
+        state = self._dir_state(directory.rstrip('/'))
+        return state.include or any(self._include[idx] for idx in state.candidates)
+
+    def match_files(self, paths: Iterable[str]) -> List[str]:
+        return [p for p in paths if self.match_file(p)]
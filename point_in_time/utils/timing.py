@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+class PhaseTimer:
+    """
+    Accumulates the wall time of the named phases of an operation, e.g. those of a snapshot.
+
+    ```python
+    >>> timer = PhaseTimer()
+    >>> with timer.phase('hash'):
+    ...     ...
+    >>> timer.format()
+    'hash 1.204s, total 1.204s'
+    ```
+    """
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        """
+        Seconds spent in each phase, in the order they were first entered.
+        """
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def merge(self, other: 'PhaseTimer'):
+        """
+        Adds the phases of another timer, e.g. one used by a background thread.
+        """
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def format(self) -> str:
+        parts = [f'{name} {seconds:.3f}s' for name, seconds in self.phases.items()]
+        parts.append(f'total {sum(self.phases.values()):.3f}s')
+        return ', '.join(parts)
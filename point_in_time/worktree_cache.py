@@ -0,0 +1,327 @@
+"""
+Stat cache of the worktree as of the last snapshot, in `.pit/worktree.cache`, which answers "has anything changed since that snapshot?" (`pit snapshot --if-changed`, `PITRepo.is_dirty_since(...)`) without `git status` or building a tree.
+
+When a snapshot is taken the worktree is scanned before its tree is built, and the cache records:
+- The stat information (size, mtime, inode, executable bit) and blob hash of each included file, the hash taken from the snapshot's tree.
+- The mtime and entries of each directory git does not ignore and the include file can match files in, so new files are noticed without reading the rest of the worktree.
+- The stat information of the `.gitignore` files, as they decide which new files are included.
+
+A later check only stats these. Files whose stat information moved are hashed and compared to the snapshot, so a file which was only touched is still unchanged, and directories whose mtime moved are listed for new included files. Whatever was verified is written back so the next check is again stat calls alone.
+
+Files and directories modified within `RACY_NS` of being recorded could change again without their mtime changing, their stat information is not trusted and they are verified on every check.
+"""
+from __future__ import annotations
+import os
+import json
+import stat
+import time
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from point_in_time.chunk_store import RACY_NS
+from point_in_time.constants.main import PIT_DIR_NAME
+from point_in_time.include import IncludeSpec
+from point_in_time.utils.fs import atomic_write
+from point_in_time.utils.git import GitTreeEntry, git_check_ignore_many
+from point_in_time.utils.logging import get_logger
+
+__all__ = ['WorktreeScan', 'WorktreeCache']
+
+logger = get_logger(__name__)
+
+WORKTREE_CACHE_VERSION = 1
+HASH_BLOCK_BYTES = 1024 * 1024
+SKIPPED_NAMES = ('.git', PIT_DIR_NAME)
+"""
+Entries of the repository root which are never part of a snapshot.
+"""
+
+def git_blob_hash(path: str, symlink: bool = False) -> str:
+    """
+    Returns:
+        str: The hash git gives the contents of a file (`git hash-object`), or of a symlink's target.
+    """
+    h = hashlib.sha1()
+    if symlink:
+        data = os.fsencode(os.readlink(path))
+        h.update(b'blob %d\0' % len(data))
+        h.update(data)
+        return h.hexdigest()
+
+    with open(path, 'rb') as f:
+        h.update(b'blob %d\0' % os.fstat(f.fileno()).st_size)
+        while True:
+            block = f.read(HASH_BLOCK_BYTES)
+            if len(block) == 0:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def stat_key(st: os.stat_result, now: int) -> List[Any]:
+    """
+    Returns:
+        List[Any]: The size, mtime, inode and executable bit of a file. The mtime is `None` when too recent to be trusted.
+    """
+    mtime = st.st_mtime_ns if now - st.st_mtime_ns > RACY_NS else None
+    return [st.st_size, mtime, st.st_ino, bool(st.st_mode & stat.S_IXUSR)]
+
+def may_match_under(include: IncludeSpec, directory: str) -> bool:
+    """
+    Returns:
+        bool: Whether the include file or its force section can match a path below the directory.
+    """
+    return include.include.may_match_under(directory) or (include.force is not None and include.force.may_match_under(directory))
+
+class WorktreeScan:
+    """
+    The stat information of the worktree, captured before a snapshot's tree is built so that any change made while it is built is seen as a change by later checks.
+    """
+    def __init__(self, files: Dict[str, List[Any]], dirs: Dict[str, List[Any]]):
+        self.files = files
+        """
+        Stat information of each file by path, see `stat_key`.
+        """
+        self.dirs = dirs
+        """
+        The mtime and sorted entry names of each directory by path, `''` for the root.
+        """
+
+    @classmethod
+    def capture(
+        cls,
+        toplevel: str,
+        ignored_dirs: Iterable[str],
+        extra_files: Iterable[str] = (),
+        include: Optional[IncludeSpec] = None
+    ) -> WorktreeScan:
+        """
+        Args:
+            toplevel (str): The root of the worktree.
+            ignored_dirs (Iterable[str]): Directories which are not scanned, see `git_ls_files_ignored_directories`.
+            extra_files (Iterable[str], optional): Files inside of ignored directories to include, e.g. those forced into the snapshot. Their directories are recorded too.
+            include (Optional[IncludeSpec], optional): Only scan directories which can hold files matched by the include file or its force section, see `may_match_under`. The whole worktree is scanned if not provided.
+
+        Returns:
+            WorktreeScan: The scan.
+        """
+        now = time.time_ns()
+        ignored = set(ignored_dirs)
+        files: Dict[str, List[Any]] = {}
+        dirs: Dict[str, List[Any]] = {}
+
+        def scan_dir(directory: str) -> List[str]:
+            st = os.stat(os.path.join(toplevel, directory))
+            subdirs = []
+            names = []
+            with os.scandir(os.path.join(toplevel, directory)) as it:
+                for entry in it:
+                    names.append(entry.name)
+                    if directory == '' and entry.name in SKIPPED_NAMES:
+                        continue
+                    path = f'{directory}/{entry.name}' if directory else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(path)
+                    else:
+                        files[path] = stat_key(entry.stat(follow_symlinks=False), now)
+            dirs[directory] = [stat_key(st, now)[1], sorted(names)]
+            return subdirs
+
+        stack = ['']
+        while len(stack) != 0:
+            stack += [
+                d for d in scan_dir(stack.pop())
+                if d not in ignored and (include is None or may_match_under(include, d))
+            ]
+
+        for path in extra_files:
+            parent = os.path.dirname(path)
+            while parent not in dirs:
+                scan_dir(parent)
+                parent = os.path.dirname(parent)
+            if path not in files:
+                files[path] = stat_key(os.lstat(os.path.join(toplevel, path)), now)
+
+        return cls(files, dirs)
+
+class WorktreeCache:
+    """
+    The worktree state recorded for a snapshot, see the module documentation.
+
+    ```python
+    >>> cache = WorktreeCache.load(path)
+    >>> cache.matches(tree, head, key) and cache.is_unchanged(toplevel, include)
+    True
+    ```
+    """
+    def __init__(
+        self,
+        tree: str,
+        head: Optional[str],
+        key: List[Any],
+        files: Dict[str, List[Any]],
+        dirs: Dict[str, List[Any]],
+        watched: Dict[str, List[Any]]
+    ):
+        self.tree = tree
+        self.head = head
+        self.key = key
+        """
+        Settings which decide the contents of a snapshot, e.g. the include file's cache key.
+        """
+        self.files = files
+        """
+        Stat information (see `stat_key`) followed by whether it is a symlink and its blob hash, by path. The hash is `None` for files committed as a pointer to the chunk store.
+        """
+        self.dirs = dirs
+        self.watched = watched
+        """
+        Files which are not included but decide what is, the `.gitignore` files, in the same form as `files`.
+        """
+        self.modified = False
+        """
+        Whether `is_unchanged(...)` updated stat information, so the cache should be saved.
+        """
+
+    @classmethod
+    def record(
+        cls,
+        scan: WorktreeScan,
+        tree: str,
+        head: Optional[str],
+        key: List[Any],
+        entries: List[GitTreeEntry],
+        include: IncludeSpec
+    ) -> WorktreeCache:
+        """
+        Args:
+            scan (WorktreeScan): The worktree as scanned before `tree` was built.
+            tree (str): The tree of the snapshot.
+            head (Optional[str]): The commit the snapshot was taken on.
+            key (List[Any]): See `key`.
+            entries (List[GitTreeEntry]): The blobs of `tree`.
+            include (IncludeSpec): The include file the snapshot was taken with.
+
+        Returns:
+            WorktreeCache: The state of the worktree for the snapshot.
+        """
+        blobs = {}
+        files = {}
+        for e in entries:
+            st = scan.files.get(e.path)
+            if st is None:
+                continue # Only in HEAD
+            # Note: A different size means the blob is not the file, e.g. a pointer to the chunk store
+            blobs[e.path] = st + [e.mode == '120000', e.hash if e.size == st[0] else None]
+            if include.include.match_file(e.path) or (include.force is not None and include.force.match_file(e.path)):
+                files[e.path] = blobs[e.path]
+
+        # Note: Those not in the snapshot have no hash to verify against, so any change to their stat information counts
+        watched = {
+            path: blobs.get(path, st + [False, None]) for path, st in scan.files.items()
+            if os.path.basename(path) == '.gitignore'
+        }
+        return cls(tree, head, key, files, scan.dirs, watched)
+
+    def matches(self, tree: str, head: Optional[str], key: List[Any]) -> bool:
+        """
+        Returns:
+            bool: Whether the cache was recorded for a snapshot of `tree` on `head`, with the same settings.
+        """
+        return self.tree == tree and self.head == head and self.key == key
+
+    def is_unchanged(self, toplevel: str, include: IncludeSpec) -> bool:
+        """
+        Checks the worktree still has the recorded contents. Stat information which moved without the contents changing is updated in place, see `modified`.
+
+        Args:
+            toplevel (str): The root of the worktree.
+            include (IncludeSpec): The include file, which must be unchanged since the cache was recorded.
+
+        Returns:
+            bool: `True` if a snapshot would have the recorded contents.
+        """
+        now = time.time_ns()
+        self.modified = False
+
+        for files in (self.watched, self.files):
+            for path, recorded in files.items():
+                full = os.path.join(toplevel, path)
+                try:
+                    st = stat_key(os.lstat(full), now)
+                except FileNotFoundError:
+                    return False
+                if recorded[1] is not None and st == recorded[:4]:
+                    continue
+
+                size, _, _, executable, symlink, blob = recorded
+                if blob is None or st[0] != size or st[3] != executable or os.path.islink(full) != symlink:
+                    return False
+                if git_blob_hash(full, symlink=symlink) != blob:
+                    return False
+                if st[1] is not None:
+                    files[path] = st + [symlink, blob]
+                    self.modified = True
+
+        candidates = []
+        for directory, (mtime, names) in self.dirs.items():
+            full = os.path.join(toplevel, directory)
+            try:
+                st = stat_key(os.stat(full), now)
+            except FileNotFoundError:
+                return False
+            if mtime is not None and st[1] == mtime:
+                continue
+
+            current = sorted(os.listdir(full))
+            for name in set(current) - set(names):
+                if directory == '' and name in SKIPPED_NAMES:
+                    continue
+                path = f'{directory}/{name}' if directory else name
+                if os.path.isdir(os.path.join(full, name)) and not os.path.islink(os.path.join(full, name)):
+                    # Note: Not read, a new directory is treated as a change unless git ignores it or it can not hold included files
+                    if may_match_under(include, path):
+                        candidates.append(path)
+                elif include.include.match_file(path) or (include.force is not None and include.force.match_file(path)):
+                    candidates.append(path)
+            if st[1] is not None:
+                self.dirs[directory] = [st[1], current]
+                self.modified = True
+
+        if len(candidates) != 0:
+            ignored = git_check_ignore_many(candidates, cwd=toplevel)
+            for path in candidates:
+                if path not in ignored:
+                    return False
+                if include.force is not None and (os.path.isdir(os.path.join(toplevel, path)) or include.force.match_file(path)):
+                    return False
+
+        return True
+
+    def save(self, path: str):
+        atomic_write(path, json.dumps({
+            'version': WORKTREE_CACHE_VERSION,
+            'tree': self.tree,
+            'head': self.head,
+            'key': self.key,
+            'files': self.files,
+            'dirs': self.dirs,
+            'watched': self.watched,
+        }).encode())
+
+    @classmethod
+    def load(cls, path: str) -> Optional[WorktreeCache]:
+        """
+        Returns:
+            Optional[WorktreeCache]: The cache, `None` if the file does not exist or is invalid.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = json.loads(f.read())
+            if data['version'] != WORKTREE_CACHE_VERSION:
+                return None
+            return cls(data['tree'], data['head'], data['key'], data['files'], data['dirs'], data['watched'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            logger.debug("Ignoring unreadable worktree cache: %s" % err)
+            return None
@@ -0,0 +1,96 @@
+import os
+import subprocess
+from typing import Callable
+
+import pytest
+
+from point_in_time.constants.main import PIT_NO_DAEMON_ENV
+from point_in_time.constants.return_codes import *
+from point_in_time.constants.strings import WARN_PIT_NOT_IGNORED
+from point_in_time.daemon import daemon_request, daemon_socket_path, DAEMON_PROTOCOL_VERSION
+from point_in_time.daemon.server import PITDaemon
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def run_pit(args, daemon: bool = True) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    if not daemon:
+        env[PIT_NO_DAEMON_ENV] = '1'
+    return subprocess.run(
+        ['pit'] + args,
+        capture_output=True,
+        env=env
+    )
+
+@pytest.fixture
+def with_daemon(with_pit_repo: Callable[[], PitData]):
+    started = []
+    def inner(**kwargs) -> PitData:
+        d = with_pit_repo(**kwargs)
+        subprocess.run(['pit', 'daemon', 'start'], check=True)
+        started.append(d)
+        return d
+
+    yield inner
+
+    for d in started:
+        subprocess.run(['pit', 'daemon', 'stop'], cwd=d.path)
+
+def test_daemon_lifecycle(with_daemon):
+    d = with_daemon(git_spec=GIT_SPEC_ONE)
+    socket_path = daemon_socket_path(d.pit_repo._path)
+    assert os.path.exists(socket_path)
+
+    assert run_pit(['daemon', 'status']).returncode == 0
+    assert run_pit(['daemon', 'start']).returncode == PIT_CODE_DAEMON_RUNNING
+
+    assert run_pit(['daemon', 'stop']).returncode == 0
+    assert not os.path.exists(socket_path)
+    assert run_pit(['daemon', 'status']).returncode == PIT_CODE_DAEMON_NOT_RUNNING
+    assert run_pit(['daemon', 'stop']).returncode == PIT_CODE_DAEMON_NOT_RUNNING
+
+def test_daemon_output_matches(with_daemon):
+    d = with_daemon(git_spec=GIT_SPEC_ONE)
+
+    for _ in range(2):
+        subprocess.run(['pit', 'snapshot', '-y', '--engine', 'index'], check=True)
+    pit_id = list(d.pit_repo._load_log().keys())[0]
+
+    for args in (['status'], ['log'], ['log', '--limit', '1'], ['log', '--offset', '1'], ['show', pit_id], ['show', pit_id, '--verbose'], ['show', 'missing']):
+        served = run_pit(args)
+        local = run_pit(args, daemon=False)
+        assert served.returncode == local.returncode, args
+        assert served.stdout == local.stdout, args
+        assert served.stderr == local.stderr, args
+
+    # Snapshots taken after the daemon started are visible
+    subprocess.run(['pit', 'snapshot', '-y', '--engine', 'index'], check=True)
+    assert run_pit(['log']).stdout == run_pit(['log'], daemon=False).stdout
+
+def test_daemon_handle(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    daemon = PITDaemon(d.pit_repo._path)
+
+    assert daemon.handle({'version': -1, 'command': 'status'})['fallback']
+    assert daemon.handle({'version': DAEMON_PROTOCOL_VERSION, 'command': 'unknown'})['fallback']
+
+    response = daemon.handle({'version': DAEMON_PROTOCOL_VERSION, 'command': 'show', 'args': {'id': 'missing'}})
+    assert response['code'] == PIT_CODE_ID_NOT_FOUND
+    assert response['output'] == ''
+
+    response = daemon.handle({'version': DAEMON_PROTOCOL_VERSION, 'command': 'status', 'args': {}})
+    assert response['code'] == 0
+    assert 'Changes included in snapshots' in response['output']
+    assert response['warnings'] == []
+
+    # Ignore files modified while the daemon runs are picked up
+    with open('.gitignore', 'w') as f:
+        f.write('')
+    response = daemon.handle({'version': DAEMON_PROTOCOL_VERSION, 'command': 'status', 'args': {}})
+    assert response['warnings'] == [WARN_PIT_NOT_IGNORED]
+    daemon._reset_repo()
+
+def test_no_daemon(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo()
+    assert daemon_request(d.pit_repo._path, 'ping') is None
@@ -6,7 +6,7 @@ import pytest
 
 from point_in_time.constants.main import (
     PIT_DIR_NAME,
-    PIT_LOG_NAME
+    PIT_LOG_DIR_NAME
 )
 from point_in_time.constants.return_codes import *
 
@@ -35,10 +35,10 @@ def test_valid_init(
     )
 
     pit_path = os.path.join(d.path, PIT_DIR_NAME)
-    pit_log = os.path.join(pit_path, PIT_LOG_NAME)
+    pit_log = os.path.join(pit_path, PIT_LOG_DIR_NAME)
 
     assert os.path.isdir(pit_path)
-    assert os.path.isfile(pit_log)
+    assert os.path.isdir(pit_log)
 
     if not no_ignore:
         assert os.path.isfile(d.ignore_path)
@@ -0,0 +1,56 @@
+import sys
+import json
+import subprocess
+
+import pytest
+
+STARTUP_BUDGET_SECONDS = 0.25
+"""
+Budget for importing the CLI entry point, generous so slow CI machines pass while still catching a heavy import sneaking back in (importing `point_in_time.repo` alone costs about as much).
+"""
+
+DEFERRED_MODULES = [
+    'pydantic',
+    'pydantic_core',
+    'colorama',
+    'unique_names_generator',
+    'pathspec',
+    'point_in_time.repo',
+]
+
+def measure_import(module: str) -> dict:
+    code = (
+        'import sys, json, time\n'
+        'start = time.perf_counter()\n'
+        f'import {module}\n'
+        'elapsed = time.perf_counter() - start\n'
+        'print(json.dumps({"elapsed": elapsed, "modules": list(sys.modules)}))\n'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        check=True,
+        capture_output=True
+    )
+    return json.loads(result.stdout)
+
+def test_deferred_imports():
+    modules = measure_import('point_in_time.cli.main')['modules']
+
+    for module in DEFERRED_MODULES:
+        assert module not in modules, f"'{module}' is imported by the CLI entry point"
+
+def test_startup_budget():
+    # Best of several runs to reduce noise from the machine
+    elapsed = min(
+        measure_import('point_in_time.cli.main')['elapsed']
+        for _ in range(5)
+    )
+
+    assert elapsed < STARTUP_BUDGET_SECONDS, f"Importing the CLI took {elapsed:.3f}s"
+
+@pytest.mark.parametrize('args', [['--help'], ['log', '--help'], ['snapshot', '--help']])
+def test_help(args):
+    result = subprocess.run(['pit'] + args, capture_output=True)
+
+    assert result.returncode == 0
+    assert result.stdout.startswith(b'Usage:')
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+import pytest
+
+import point_in_time
+from point_in_time.errors import PITInternalError, PITRepoLoadError, PITIdNotFoundError
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+@pytest.fixture
+def no_chdir(monkeypatch):
+    def fail(path):
+        raise AssertionError("Unexpected chdir: %s" % path)
+    monkeypatch.setattr(os, 'chdir', fail)
+
+def test_snapshot(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    s = point_in_time.snapshot(metadata={'run': 1})
+
+    assert d.pit_repo._load_log()[s.pit_id] == s
+    details = point_in_time.show(s.pit_id)
+    assert details.metadata == {'run': 1}
+    assert [e.pit_id for e in point_in_time.log()] == [s.pit_id]
+
+def test_background_snapshot(with_pit_repo: Callable[[], PitData], no_chdir):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    future = point_in_time.snapshot(metadata={'run': 1}, background=True)
+    assert isinstance(future, Future)
+
+    s = future.result(timeout=30)
+    assert d.pit_repo._load_log()[s.pit_id] == s
+
+def test_explicit_path(with_pit_repo: Callable[[], PitData], tmp_path, monkeypatch, no_chdir):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    os.makedirs(os.path.join(d.path, 'sub'))
+    # Note: Leaves the repository without `os.chdir`, which is patched to fail
+    monkeypatch.setattr(os, 'getcwd', lambda: str(tmp_path))
+
+    s = point_in_time.snapshot(os.path.join(d.path, 'sub'), metadata={})
+    assert point_in_time.show(s.pit_id, path=d.path).pit_id == s.pit_id
+
+    with pytest.raises(PITRepoLoadError):
+        point_in_time.snapshot(str(tmp_path))
+    with pytest.raises(PITIdNotFoundError):
+        point_in_time.show('missing', path=d.path)
+
+def test_concurrent_snapshots(with_pit_repo: Callable[[], PitData], no_chdir):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    results = []
+    def worker(i: int):
+        results.append(point_in_time.snapshot(d.path, metadata={'thread': i}))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    log = d.pit_repo._load_log()
+    assert len(results) == 4
+    assert all(log[s.pit_id] == s for s in results)
+    assert len(point_in_time.log(d.path, limit=2)) == 2
+
+def test_background_stash(with_pit_repo: Callable[[], PitData]):
+    with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    with pytest.raises(PITInternalError):
+        point_in_time.snapshot(engine='stash', background=True)
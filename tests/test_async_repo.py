@@ -0,0 +1,198 @@
+import os
+import asyncio
+import subprocess
+from typing import Callable
+
+import pytest
+
+from point_in_time.async_repo import AsyncPITRepo
+from point_in_time.repo import PITRepo
+from point_in_time.errors import PITIdNotFoundError, PITInternalError
+from point_in_time.utils.git import git_status_porcelain_v2
+from point_in_time.utils.git_async import git_status_porcelain_v2_async
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def create_pit_repo(path: str, files: int) -> str:
+    os.makedirs(path)
+    subprocess.run(['git', 'init', '-q'], cwd=path, check=True)
+    subprocess.run(['git', 'config', 'user.email', 'fixture@pytest.com'], cwd=path, check=True)
+    subprocess.run(['git', 'config', 'user.name', 'Pytest Fixture'], cwd=path, check=True)
+    subprocess.run(['pit', 'init'], cwd=path, check=True, capture_output=True)
+    for i in range(files):
+        with open(os.path.join(path, f'file_{i}.txt'), 'w') as f:
+            f.write(str(i))
+    return os.path.join(path, '.pit')
+
+def test_status_matches(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = AsyncPITRepo(d.pit_repo._path)
+
+    async def main():
+        entries = [e async for e in git_status_porcelain_v2_async(['--ignored'], chunk_size=7, cwd=d.path)]
+        return (
+            entries,
+            await repo.get_snapshot_paths(),
+            await repo.get_snapshot_paths_status()
+        )
+    entries, paths, status = asyncio.run(main())
+
+    assert entries == list(git_status_porcelain_v2(['--ignored'], cwd=d.path))
+    assert paths == d.pit_repo.get_snapshot_paths()
+    assert status == d.pit_repo.get_snapshot_paths_status()
+
+    # Partly included untracked directories of a full scan are expanded as well
+    with open(d.pit_repo._include_path, 'w') as f:
+        f.write('*.txt')
+    os.makedirs('sub/deep')
+    for path in ('sub/foo.txt', 'sub/bar.log', 'sub/deep/q.txt'):
+        with open(path, 'w') as f:
+            f.write(path)
+
+    async def full():
+        return await repo.get_snapshot_paths(await repo.get_status())
+    assert asyncio.run(full()) == d.pit_repo.get_snapshot_paths()
+
+def test_snapshot_log_show(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = AsyncPITRepo(d.pit_repo._path)
+
+    async def main():
+        first = await repo.snapshot_included(metadata={'run': 1})
+        second = await repo.snapshot_included(metadata={'run': 2})
+        logged = [s.pit_id async for s in repo.log()]
+        limited = [s.pit_id async for s in repo.log(limit=1)]
+        shown = await repo.show(first.pit_id)
+        return first, second, logged, limited, shown
+    first, second, logged, limited, shown = asyncio.run(main())
+
+    assert logged == [second.pit_id, first.pit_id]
+    assert limited == [second.pit_id]
+    assert shown.metadata == {'run': 1}
+
+    # Identical to the blocking repository
+    expected = d.pit_repo.get_details(d.pit_repo._load_log()[first.pit_id])
+    assert shown.date == expected.date
+    assert shown.files_changed == expected.files_changed
+
+    with pytest.raises(PITIdNotFoundError):
+        asyncio.run(repo.show('missing'))
+    with pytest.raises(PITInternalError):
+        asyncio.run(repo.snapshot([], engine='stash'))
+
+def test_snapshot_records_worktree(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = AsyncPITRepo(d.pit_repo._path)
+
+    async def main():
+        return (
+            await repo.snapshot_included(),
+            await repo.snapshot_included()
+        )
+    first, alias = asyncio.run(main())
+    assert alias.alias_of == first.pit_id
+
+    # Answered from the worktree cache, without building a tree
+    def fail(*args, **kwargs):
+        raise AssertionError("Unexpected tree build")
+    monkeypatch.setattr(PITRepo, '_snapshot_tree', fail)
+    assert not d.pit_repo.is_dirty_since(alias.pit_id)
+
+    with open('file_untracked.txt', 'a') as f:
+        f.write('changed')
+    assert d.pit_repo.is_dirty_since(alias.pit_id)
+
+def test_log_stops_early(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    for i in range(3):
+        d.pit_repo.snapshot(paths=[], metadata={}, engine='index')
+    # Note: Forces the details to be resolved by git
+    os.remove(d.pit_repo._details_cache.path)
+    repo = AsyncPITRepo(d.pit_repo._path)
+
+    async def main():
+        log = repo.log()
+        async for details in log:
+            break
+        await log.aclose()
+        # The git process was released
+        return repo._get_limiter()._value
+    assert asyncio.run(main()) == 8
+
+def test_many_repos_bounded(with_empty_dir, monkeypatch):
+    limiter = None
+    paths = [create_pit_repo(os.path.join(str(with_empty_dir), f'repo_{i}'), files=i + 1) for i in range(6)]
+
+    class CountingSemaphore(asyncio.Semaphore):
+        held = 0
+        async def acquire(self):
+            await super().acquire()
+            self.held += 1
+            return True
+        def release(self):
+            self.held -= 1
+            super().release()
+
+    # Every git process is started while holding the limiter, including those started by the steps run in the executor
+    held_at_start = []
+    create = asyncio.create_subprocess_exec
+    async def counting(*args, **kwargs):
+        held_at_start.append(limiter.held)
+        return await create(*args, **kwargs)
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', counting)
+    class CountingPopen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            held_at_start.append(limiter.held)
+            super().__init__(*args, **kwargs)
+    # Note: `subprocess.run` and asyncio both start processes through `subprocess.Popen`
+    monkeypatch.setattr(subprocess, 'Popen', CountingPopen)
+
+    async def main():
+        nonlocal limiter
+        limiter = CountingSemaphore(2)
+        repos = [AsyncPITRepo(p, limiter=limiter) for p in paths]
+        return await asyncio.gather(*(r.snapshot_included() for r in repos))
+    entries = asyncio.run(main())
+
+    assert len(held_at_start) != 0
+    assert all(1 <= held <= 2 for held in held_at_start)
+
+    # One at a time, each process holds the limiter itself
+    held_at_start.clear()
+    for i, path in enumerate(paths):
+        with open(os.path.join(os.path.dirname(path), f'file_{i}.txt'), 'a') as f:
+            f.write('changed')
+    async def sequential():
+        nonlocal limiter
+        limiter = CountingSemaphore(2)
+        return [await AsyncPITRepo(p, limiter=limiter).snapshot_included() for p in paths]
+    asyncio.run(sequential())
+    monkeypatch.undo()
+
+    assert len(held_at_start) != 0
+    assert held_at_start == [1] * len(held_at_start)
+    for i, (path, s) in enumerate(zip(paths, entries)):
+        files = subprocess.run(
+            ['git', 'ls-tree', '-r', '--name-only', s.git_hash],
+            cwd=os.path.dirname(path),
+            check=True,
+            capture_output=True
+        ).stdout.decode().split()
+        assert files == ['.gitignore'] + [f'file_{j}.txt' for j in range(i + 1)]
+
+def test_large_files(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"large_file_threshold": 100000}')
+    with open('large.bin', 'wb') as f:
+        f.write(os.urandom(300_000))
+
+    s = asyncio.run(AsyncPITRepo(d.pit_repo._path).snapshot_included())
+
+    pointer = subprocess.run(
+        ['git', 'show', f'{s.git_hash}:large.bin'],
+        check=True,
+        capture_output=True
+    ).stdout
+    assert pointer.startswith(b'pit-pointer')
@@ -0,0 +1,87 @@
+import os
+import subprocess
+from typing import Callable
+
+import point_in_time.blob_hasher
+from point_in_time.blob_hasher import hash_blobs, partition_by_size
+from point_in_time.utils.main import flatten_status_paths
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def test_partition_by_size():
+    sizes = {'a': 10, 'b': 7, 'c': 5, 'd': 4, 'e': 1}
+    batches = partition_by_size(sizes, 2)
+    assert sorted(sum(sizes[p] for p in b) for b in batches) == [13, 14]
+    assert sorted(p for b in batches for p in b) == sorted(sizes)
+
+    assert partition_by_size({'a': 1}, 4) == [['a']]
+
+def test_parallel_tree(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    os.makedirs('data/nested')
+    for i in range(10):
+        with open(f'data/nested/{i}.bin', 'wb') as f:
+            f.write(os.urandom(1000 * i))
+    with open('run.sh', 'w') as f:
+        f.write('#!/bin/sh\n')
+    os.chmod('run.sh', 0o755)
+    os.symlink('file_committed.txt', 'link.txt')
+    os.remove('file_committed.txt')
+
+    paths = d.pit_repo.get_snapshot_paths()
+    included = flatten_status_paths(paths, codes=[c for c in paths.keys() if c != '!!'])
+    forced = flatten_status_paths(paths, codes=['!!'])
+
+    def tree(workers: int) -> str:
+        with open(d.pit_repo._config_path, 'w') as f:
+            f.write('{"hash_workers": %d}' % workers)
+        return d.pit_repo._snapshot_tree('HEAD', included, forced)
+
+    monkeypatch.setattr(point_in_time.blob_hasher, 'PARALLEL_HASH_MIN_BYTES', 0)
+    hashed = hash_blobs(d.path, included, forced, workers=4)
+    assert hashed.files > 10 and hashed.workers == 4
+    assert 'data/' not in hashed.paths
+    assert {'link.txt', 'file_committed.txt'} <= set(hashed.paths)
+
+    # The same tree as `git add`, with modes, symlinks and deletions
+    assert tree(4) == tree(1)
+
+def test_file_mode_config(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    subprocess.run(['git', 'update-index', '--chmod=+x', 'file_committed.txt'], check=True)
+    subprocess.run(['git', 'commit', '-q', '-m', 'Executable'], check=True)
+    subprocess.run(['git', 'config', 'core.fileMode', 'false'], check=True)
+
+    # The executable bit of the worktree is ignored, modes are kept from HEAD and new files are not executable
+    os.chmod('file_committed.txt', 0o644)
+    with open('new.sh', 'w') as f:
+        f.write('#!/bin/sh\n')
+    os.chmod('new.sh', 0o755)
+
+    paths = flatten_status_paths(d.pit_repo.get_snapshot_paths())
+
+    def tree(workers: int) -> str:
+        with open(d.pit_repo._config_path, 'w') as f:
+            f.write('{"hash_workers": %d}' % workers)
+        return d.pit_repo._snapshot_tree('HEAD', paths, [])
+
+    monkeypatch.setattr(point_in_time.blob_hasher, 'PARALLEL_HASH_MIN_BYTES', 0)
+    parallel = tree(4)
+    assert parallel == tree(1)
+    modes = subprocess.run(['git', 'ls-tree', parallel], check=True, capture_output=True).stdout.decode()
+    assert '100755 blob' in [l[:11] for l in modes.splitlines() if l.endswith('\tfile_committed.txt')]
+    assert '100644 blob' in [l[:11] for l in modes.splitlines() if l.endswith('\tnew.sh')]
+
+def test_cli_timings(with_pit_repo: Callable[[], PitData]):
+    with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    result = subprocess.run(
+        ['pit', 'snapshot', '-y', '--engine', 'index', '--timings'],
+        check=True,
+        capture_output=True
+    )
+    output = result.stdout.decode() + result.stderr.decode()
+    assert 'Snapshot timings: ' in output
+    assert 'hash ' in output and 'commit ' in output
@@ -0,0 +1,117 @@
+import io
+import os
+import random
+
+import pytest
+
+from point_in_time.chunk_store import ChunkStore, iter_chunks, parse_pointer
+from point_in_time.errors import PITObjectNotFoundError
+
+def random_bytes(n: int, seed: int = 0) -> bytes:
+    return random.Random(seed).getrandbits(n * 8).to_bytes(n, 'little')
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'small',
+    random_bytes(3_000_000),
+    b'line of text\n' * 200_000,
+    bytes(1_000_000),
+])
+def test_iter_chunks(data: bytes):
+    chunks = list(iter_chunks(io.BytesIO(data), block_size=300_000))
+
+    assert b''.join(chunks) == data
+    assert all(16*1024 <= len(c) <= 256*1024 for c in chunks[:-1])
+
+def test_chunks_shared_after_insert():
+    data = random_bytes(4_000_000)
+    edited = data[:2_000_000] + b'inserted' + data[2_000_000:]
+
+    before = set(iter_chunks(io.BytesIO(data)))
+    changed = [c for c in iter_chunks(io.BytesIO(edited)) if c not in before]
+
+    # Only the chunk around the edit differs
+    assert 0 < sum(len(c) for c in changed) <= 2 * 256*1024
+
+def test_binary_chunks_shared_after_insert():
+    # Note: Binary data without newlines, e.g. packed floats, is still split by content
+    data = random_bytes(4_000_000).replace(b'\n', b'')
+    edited = data[:2_000_000] + b'\x00' + data[2_000_000:]
+
+    before = set(iter_chunks(io.BytesIO(data)))
+    after = list(iter_chunks(io.BytesIO(edited)))
+    changed = [c for c in after if c not in before]
+
+    assert len(after) > len(data) // (256*1024) + 1
+    assert 0 < sum(len(c) for c in changed) <= 2 * 256*1024
+
+def test_store_and_materialize(tmp_path):
+    store = ChunkStore(str(tmp_path / 'objects'))
+    source = tmp_path / 'data.bin'
+    source.write_bytes(random_bytes(2_000_000))
+
+    pointer = store.store_file(str(source))
+    assert parse_pointer(pointer)[1] == 2_000_000
+    assert parse_pointer(b'not a pointer') is None
+
+    dest = tmp_path / 'out' / 'data.bin'
+    store.materialize(pointer, str(dest))
+    assert dest.read_bytes() == source.read_bytes()
+
+def test_store_deduplicates(tmp_path):
+    store = ChunkStore(str(tmp_path / 'objects'))
+    data = random_bytes(2_000_000)
+    (tmp_path / 'a.bin').write_bytes(data)
+    (tmp_path / 'b.bin').write_bytes(data[:1_000_000] + b'edit' + data[1_000_000:])
+
+    def stored_bytes() -> int:
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(store.path)
+            for f in files
+        )
+
+    store.store_file(str(tmp_path / 'a.bin'))
+    first = stored_bytes()
+    store.store_file(str(tmp_path / 'b.bin'))
+
+    assert stored_bytes() - first < 600_000
+
+def test_unchanged_files_not_read(tmp_path, monkeypatch):
+    store = ChunkStore(str(tmp_path / 'objects'))
+    source = tmp_path / 'data.bin'
+    source.write_bytes(random_bytes(100_000))
+    # Note: Recently modified files are not cached
+    os.utime(source, (0, 0))
+
+    pointer = store.store_file(str(source))
+    monkeypatch.setattr(store, '_store_file', None)
+    assert store.store_file(str(source)) == pointer
+
+def test_stat_cache_concurrent(tmp_path):
+    first = ChunkStore(str(tmp_path / 'objects'))
+    second = ChunkStore(str(tmp_path / 'objects'))
+    for name in ('a.bin', 'b.bin'):
+        (tmp_path / name).write_bytes(random_bytes(100_000, seed=ord(name[0])))
+        os.utime(tmp_path / name, (0, 0))
+
+    # Another process stores a file while the first is storing its own
+    store_file = first._store_file
+    def interleaved(path: str) -> str:
+        second.store_file(str(tmp_path / 'b.bin'))
+        return store_file(path)
+    first._store_file = interleaved
+    first.store_file(str(tmp_path / 'a.bin'))
+
+    assert set(first._load_stat_cache()) == {str(tmp_path / 'a.bin'), str(tmp_path / 'b.bin')}
+
+def test_corrupt_object(tmp_path):
+    store = ChunkStore(str(tmp_path / 'objects'))
+    oid = store.put(b'contents')
+    with open(store._object_path(oid), 'wb') as f:
+        f.write(b'rother contents')
+
+    with pytest.raises(PITObjectNotFoundError):
+        store.get(oid)
+    with pytest.raises(PITObjectNotFoundError):
+        store.get('0' * 64)
@@ -0,0 +1,84 @@
+import os
+from datetime import datetime, timezone
+
+from point_in_time.details_cache import CommitDetailsCache
+from point_in_time.utils.git import GitCommitDetails
+
+def make_details(i: int) -> GitCommitDetails:
+    return GitCommitDetails(
+        hash=f'{i:040x}',
+        date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        files_changed=[f'dir/file_{i}.txt', 'ünïcode.txt']
+    )
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'details.cache')
+
+    cache = CommitDetailsCache(path)
+    assert cache.get(make_details(0).hash) is None
+    cache.put_many([make_details(0), make_details(1)])
+    cache.put(GitCommitDetails(hash='f' * 40, date=make_details(0).date, files_changed=[]))
+
+    # Read back from disk with a fresh instance
+    cache = CommitDetailsCache(path)
+    assert cache.get(make_details(0).hash) == make_details(0)
+    assert cache.get(make_details(1).hash) == make_details(1)
+    assert cache.get('f' * 40).files_changed == []
+
+def test_eviction(tmp_path):
+    path = str(tmp_path / 'details.cache')
+
+    cache = CommitDetailsCache(path, max_bytes=2048)
+    for i in range(200):
+        cache.put(make_details(i))
+
+    assert os.path.getsize(path) <= 2048
+
+    # Newest entries are kept, oldest evicted
+    cache = CommitDetailsCache(path, max_bytes=2048)
+    assert cache.get(make_details(199).hash) == make_details(199)
+    assert cache.get(make_details(0).hash) is None
+
+def test_torn_tail(tmp_path):
+    path = str(tmp_path / 'details.cache')
+
+    cache = CommitDetailsCache(path)
+    cache.put(make_details(0))
+    with open(path, 'ab') as f:
+        f.write(b'\x00\x00\x01\x00partial')
+
+    cache = CommitDetailsCache(path)
+    assert cache.get(make_details(0).hash) == make_details(0)
+
+    # Appending truncates the torn write rather than writing behind it
+    cache.put(make_details(1))
+    cache = CommitDetailsCache(path)
+    assert cache.get(make_details(1).hash) == make_details(1)
+    assert cache.get(make_details(0).hash) == make_details(0)
+
+def test_eviction_between_writers(tmp_path):
+    path = str(tmp_path / 'details.cache')
+
+    a = CommitDetailsCache(path, max_bytes=2048)
+    i = 0
+    while not os.path.isfile(path) or os.path.getsize(path) < 1500:
+        a.put(make_details(i))
+        i += 1
+
+    # Loaded just before the other writer evicts
+    b = CommitDetailsCache(path, max_bytes=2048)
+    assert b.get(make_details(0).hash) == make_details(0)
+    size = os.path.getsize(path)
+    while os.path.getsize(path) >= size:
+        a.put(make_details(i))
+        i += 1
+
+    # Appends to the rewritten file, rather than behind the offset it loaded
+    b.put(make_details(1000))
+    assert os.path.getsize(path) < size
+
+    cache = CommitDetailsCache(path, max_bytes=2048)
+    assert cache.get(make_details(1000).hash) == make_details(1000)
+    assert cache.get(make_details(i - 1).hash) == make_details(i - 1)
+    assert cache.get(make_details(0).hash) is None
+    assert b.get(make_details(i - 1).hash) == make_details(i - 1)
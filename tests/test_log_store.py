@@ -0,0 +1,258 @@
+import os
+import json
+import multiprocessing
+
+import pytest
+
+from point_in_time.log_store import PITLogStore, encode_record
+from point_in_time.errors import PITLogLoadError, PITLogCollision
+from point_in_time.repo import PITRepo, PITLogEntry
+
+def make_record(i: int) -> dict:
+    return {
+        'pit_id': f'snapshot-{i}',
+        'git_hash': f'{i:040x}',
+        'metadata': {'i': i}
+    }
+
+@pytest.fixture
+def store(tmp_path) -> PITLogStore:
+    s = PITLogStore(str(tmp_path / 'log'), segment_max_bytes=512)
+    s.create()
+    return s
+
+def test_append_and_iterate(store: PITLogStore):
+    records = [make_record(i) for i in range(20)]
+    for r in records:
+        store.append(r)
+
+    assert list(store) == records
+    assert 'snapshot-3' in store
+    assert 'snapshot-20' not in store
+
+def test_segment_rollover(store: PITLogStore):
+    for i in range(20):
+        store.append(make_record(i))
+
+    segments = store.segments()
+    assert len(segments) > 1
+    for segment in segments[:-1]:
+        # Segments are only rolled once full, and are never rewritten
+        assert os.path.getsize(store.segment_path(segment)) >= store.segment_max_bytes
+    assert [r['pit_id'] for r in store] == [f'snapshot-{i}' for i in range(20)]
+
+    # Collision checks of appends only read the active segment
+    assert store.active_segment_contains('pit_id', 'snapshot-19')
+    assert not store.active_segment_contains('pit_id', 'snapshot-0')
+
+def test_torn_tail(store: PITLogStore):
+    store.append(make_record(0))
+
+    path = store.segment_path(store.segments()[-1])
+    with open(path, 'ab') as f:
+        f.write(encode_record(make_record(1))[:-10])
+
+    # Readers skip the partial record
+    assert list(store) == [make_record(0)]
+
+    # Writers truncate it before appending
+    store.append(make_record(2))
+    assert list(store) == [make_record(0), make_record(2)]
+
+def test_checksum_mismatch(store: PITLogStore):
+    store.append(make_record(0))
+    store.append(make_record(1))
+
+    path = store.segment_path(store.segments()[-1])
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data.replace(b'snapshot-0', b'snapshot-9'))
+
+    with pytest.raises(PITLogLoadError):
+        list(store)
+
+def test_migrate_legacy(tmp_path):
+    legacy_path = str(tmp_path / 'log.json')
+    legacy = {r['pit_id']: r for r in (make_record(i) for i in range(50))}
+    with open(legacy_path, 'w') as f:
+        json.dump(legacy, f, indent=2)
+
+    store = PITLogStore(str(tmp_path / 'log'), segment_max_bytes=1024)
+    store.migrate_legacy(legacy_path)
+
+    assert list(store) == list(legacy.values())
+    assert len(store.segments()) > 1
+    assert not os.path.exists(legacy_path)
+    assert os.path.isfile(legacy_path + '.migrated')
+
+def test_repo_migrates_legacy_log(tmp_path):
+    pit_path = tmp_path / '.pit'
+    pit_path.mkdir()
+    with open(pit_path / 'log.json', 'w') as f:
+        json.dump({'snapshot-0': make_record(0)}, f)
+
+    repo = PITRepo(str(pit_path))
+    assert list(repo._load_log().keys()) == ['snapshot-0']
+
+    repo.append_log(PITLogEntry(**make_record(1)))
+    assert list(repo._load_log().keys()) == ['snapshot-0', 'snapshot-1']
+
+    with pytest.raises(PITLogCollision):
+        repo.append_log(PITLogEntry(**make_record(1)))
+
+def group_append_worker(path: str, ids: list) -> int:
+    store = PITLogStore(path, segment_max_bytes=512)
+    collisions = 0
+    for i in ids:
+        try:
+            store.group_append(make_record(i))
+        except PITLogCollision:
+            collisions += 1
+    return collisions
+
+def test_group_append_concurrent(store: PITLogStore):
+    workers = 8
+    per_worker = 25
+    # Every id is appended by two workers, exactly one of each pair must collide
+    ids = [
+        [(w % (workers // 2)) * per_worker + i for i in range(per_worker)]
+        for w in range(workers)
+    ]
+
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        collisions = pool.starmap(group_append_worker, [(store.path, i) for i in ids])
+
+    pit_ids = [r['pit_id'] for r in store]
+    assert sorted(pit_ids) == sorted(f'snapshot-{i}' for i in range(workers // 2 * per_worker))
+    assert sum(collisions) == workers // 2 * per_worker
+    assert os.listdir(store.pending_path) == []
+
+def test_group_append_recovers_pending(store: PITLogStore):
+    store.group_append(make_record(0))
+    os.makedirs(store.pending_path, exist_ok=True)
+
+    # Left by a writer which exited before taking the lock
+    with open(os.path.join(store.pending_path, '1.rec'), 'wb') as f:
+        f.write(encode_record(make_record(1)))
+    # Left by a writer which exited after appending but before cleaning up
+    with open(os.path.join(store.pending_path, '2.committing'), 'wb') as f:
+        f.write(encode_record(make_record(0)))
+
+    store.group_append(make_record(3))
+
+    assert sorted(r['pit_id'] for r in store) == ['snapshot-0', 'snapshot-1', 'snapshot-3']
+    assert os.listdir(store.pending_path) == []
+
+    with pytest.raises(PITLogCollision):
+        store.group_append(make_record(3))
+    assert os.listdir(store.pending_path) == []
+
+def test_index_lookup(store: PITLogStore):
+    # Enough records to grow the index past its initial capacity
+    n = 1200
+    for i in range(0, n, 100):
+        store._append_locked([make_record(j) for j in range(i, i + 100)])
+
+    assert len(store.segments()) > 1
+    assert store.index.indexed_position() == store._records_since(None)[1]
+    for i in (0, 1, 599, n - 1):
+        assert store.get(f'snapshot-{i}') == make_record(i)
+        assert len(store.index.lookup(f'snapshot-{i}')) == 1
+    assert store.get(f'snapshot-{n}') is None
+
+def test_index_catches_up(store: PITLogStore):
+    store.append(make_record(0))
+    # Appended without updating the index, as by a version of pit without one
+    path = store.segment_path(store.segments()[-1])
+    with open(path, 'ab') as f:
+        f.write(encode_record(make_record(1)))
+
+    assert store.index.lookup('snapshot-1') == []
+    assert store.get('snapshot-1') == make_record(1)
+    assert len(store.index.lookup('snapshot-1')) == 1
+
+    store.append(make_record(2))
+    assert 'snapshot-2' in store
+
+def test_field_index(tmp_path):
+    store = PITLogStore(str(tmp_path / 'log'), segment_max_bytes=512, indexes=('tree_hash',))
+    store.create()
+
+    records = [dict(make_record(i), tree_hash=f'tree-{i % 3}') for i in range(10)]
+    store.append_many(records[:5])
+    store.append(make_record(10)) # Records without the field are not indexed
+    # Appended without updating the indexes, as by a version of pit without them
+    with open(store.segment_path(store.segments()[-1]), 'ab') as f:
+        f.write(b''.join(encode_record(r) for r in records[5:]))
+
+    found = store.find('tree_hash', 'tree-1')
+    assert sorted(r['pit_id'] for r in found) == ['snapshot-1', 'snapshot-4', 'snapshot-7']
+    assert store.find('tree_hash', 'tree-3') == []
+    assert store.field_indexes['tree_hash'].indexed_position() == store.index.indexed_position()
+
+@pytest.mark.parametrize('damage', ['remove', 'truncate', 'garbage'])
+def test_index_rebuilt(store: PITLogStore, damage: str):
+    for i in range(10):
+        store.append(make_record(i))
+
+    if damage == 'remove':
+        os.remove(store.index.path)
+    elif damage == 'truncate':
+        with open(store.index.path, 'r+b') as f:
+            f.truncate(10)
+    else:
+        with open(store.index.path, 'wb') as f:
+            f.write(os.urandom(4096))
+
+    assert store.get('snapshot-5') == make_record(5)
+    assert store.get('snapshot-10') is None
+    store.append(make_record(10))
+    assert store.get('snapshot-10') == make_record(10)
+
+def test_index_verifies_positions(store: PITLogStore):
+    for i in range(10):
+        store.append(make_record(i))
+
+    # Point the index at a different record, as if the log had been replaced under it
+    wrong = store.index.lookup('snapshot-1')
+    os.remove(store.index.path)
+    store.index.update([(wrong[0], make_record(2))], store.index.indexed_position() or (0, 0))
+
+    assert store.get('snapshot-2') == make_record(2)
+    assert store.get('snapshot-1') == make_record(1)
+
+def test_index_rebuilt_large(store: PITLogStore):
+    # More records than fit the initial capacity, indexed at once
+    store._append_locked([make_record(i) for i in range(2000)])
+    os.remove(store.index.path)
+
+    assert store.get('snapshot-1999') == make_record(1999)
+
+@pytest.mark.parametrize('block_size', [16, 100, 4096])
+def test_iter_records_reverse(store: PITLogStore, block_size: int):
+    for i in range(20):
+        store.append(make_record(i))
+
+    path = store.segment_path(store.segments()[-1])
+    with open(path, 'ab') as f:
+        f.write(encode_record(make_record(20))[:-10])
+
+    records = []
+    for segment in reversed(store.segments()):
+        records += store.iter_segment_reverse(
+            segment,
+            is_active=(segment == store.segments()[-1]),
+            block_size=block_size
+        )
+    assert records == list(reversed(list(store.iter_records())))
+    assert [r for _, r in store.iter_records_reverse()] == [make_record(i) for i in reversed(range(20))]
+
+def test_repo_iter_log(tmp_path):
+    repo = PITRepo.create_repo(str(tmp_path / '.pit'))
+    for i in range(10):
+        repo.append_log(PITLogEntry(**make_record(i)))
+
+    assert [e.pit_id for e in repo.iter_log(limit=3)] == ['snapshot-9', 'snapshot-8', 'snapshot-7']
+    assert [e.pit_id for e in repo.iter_log(offset=8)] == ['snapshot-1', 'snapshot-0']
+    assert [e.pit_id for e in repo.iter_log(reverse=False, offset=1, limit=2)] == ['snapshot-1', 'snapshot-2']
@@ -0,0 +1,170 @@
+import os
+import math
+import subprocess
+from typing import Callable
+
+import pytest
+
+import point_in_time
+from point_in_time.constants.return_codes import PIT_CODE_QUERY_INVALID
+from point_in_time.errors import PITQueryError
+from point_in_time.metadata_table import MetadataTable
+from point_in_time.query_filter import QueryFilter
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+RECORDS = [
+    {'pit_id': 'a', 'git_hash': 'h1', 'metadata': {'lr': 1e-2, 'opt': {'name': 'adam'}, 'loss': 0.5, 'final': True}},
+    {'pit_id': 'b', 'git_hash': 'h1', 'metadata': {'lr': 1e-3, 'opt': {'name': 'sgd'}, 'loss': 0.3}},
+    {'pit_id': 'c', 'git_hash': 'h2', 'metadata': {'lr': 1e-4, 'opt': {'name': 'adam'}, 'loss': 0.1, 'final': False}},
+    {'pit_id': 'd', 'git_hash': 'h3', 'metadata': {'lr': 'auto', 'opt': {'name': 'adam'}}},
+]
+
+def make_table(records=RECORDS) -> MetadataTable:
+    table = MetadataTable()
+    for r in records:
+        table.append(r)
+    return table
+
+def test_columns():
+    table = make_table(RECORDS[:3])
+    assert table.num_rows == 3
+    assert table.column('metadata.loss').kind == 'number'
+    assert table.column('metadata.final').kind == 'bool'
+    assert table.column('metadata.final').to_list() == [True, None, False]
+    opt = table.column('metadata.opt.name')
+    assert opt.kind == 'string'
+    assert opt.dictionary == ['adam', 'sgd']
+    assert list(opt.values) == [0, 1, 0]
+    assert table.column('metadata.nope') is None
+    with pytest.raises(PITQueryError):
+        table.column('date')
+
+    # A string after numbers turns the column into a string column
+    table.append(RECORDS[3])
+    lr = table.column('metadata.lr')
+    assert lr.kind == 'string'
+    assert lr.to_list() == ['0.01', '0.001', '0.0001', 'auto']
+    assert math.isnan(table.column('metadata.loss').values[3])
+
+def test_select():
+    table = make_table()
+
+    def select(*filters, **kwargs):
+        rows = table.select([QueryFilter.parse(f) for f in filters], **kwargs)
+        return table.column('pit_id').to_list(rows)
+
+    assert select() == ['d', 'c', 'b', 'a']
+    assert select(ascending=True) == ['a', 'b', 'c', 'd']
+    assert select('metadata.opt.name=adam') == ['d', 'c', 'a']
+    assert select('metadata.opt.name~a*', 'metadata.loss<0.4') == ['c']
+    assert select('metadata.loss!=0.3') == ['c', 'a']
+    assert select('metadata.final=true') == ['a']
+    assert select('hash=h1', limit=1) == ['b']
+    assert select('metadata.nope=1') == []
+    assert select(sort='metadata.loss') == ['a', 'b', 'c', 'd']
+    assert select(sort='metadata.loss', ascending=True) == ['c', 'b', 'a', 'd']
+    assert select(sort='metadata.opt.name', ascending=True, offset=1) == ['c', 'a', 'b']
+    with pytest.raises(PITQueryError):
+        select('file~*.py')
+
+    # Filters which do not apply to a value's kind do not match it
+    assert select('metadata.loss~0.*') == []
+    assert select('metadata.final>0') == ['a']
+    assert select('metadata.lr<5e-3') == ['c', 'b']
+    assert select('metadata.lr~a*') == ['d']
+
+def test_group_take():
+    table = make_table()
+    rows = table.select()
+    assert table.group(rows, 'metadata.opt.name') == {'adam': [3, 2, 0], 'sgd': [1]}
+    assert table.group(rows, 'metadata.final') == {None: [3, 1], False: [2], True: [0]}
+
+    columns = table.take([2, 0], ['pit_id', 'metadata.loss', 'metadata.opt.name'])
+    assert list(columns.keys()) == ['pit_id', 'metadata.loss', 'metadata.opt.name']
+    assert list(columns['metadata.loss'].values) == [0.1, 0.5]
+    assert columns['metadata.opt.name'].to_list() == ['adam', 'adam']
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / 'metadata.cache')
+    assert MetadataTable.load(path).num_rows == 0
+
+    table = make_table()
+    table.position = (1, 100)
+    table.save(path)
+
+    loaded = MetadataTable.load(path)
+    assert loaded.num_rows == 4
+    assert loaded.position == (1, 100)
+    for name, column in table.columns.items():
+        assert loaded.column(name).kind == column.kind
+        assert loaded.column(name).to_list() == table.column(name).to_list()
+
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert MetadataTable.load(path).num_rows == 0
+
+def test_repo_metadata_table(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    ids = [point_in_time.snapshot(metadata={'lr': lr}).pit_id for lr in (1e-2, 1e-3)]
+
+    table = d.pit_repo.get_metadata_table()
+    assert table.column('pit_id').to_list() == ids
+    assert os.path.exists(d.pit_repo._metadata_cache_path)
+
+    # Snapshots taken since are added incrementally, also to a table loaded from the cache
+    ids.append(point_in_time.snapshot(metadata={'lr': 1e-4}).pit_id)
+    assert d.pit_repo.get_metadata_table().column('pit_id').to_list() == ids
+    assert MetadataTable.load(d.pit_repo._metadata_cache_path).num_rows == 3
+
+    columns = point_in_time.compare(['metadata.lr<5e-3'], columns=['metadata.lr'], sort='metadata.lr', ascending=True)
+    assert columns['pit_id'].to_list() == [ids[2], ids[1]]
+    assert list(columns['metadata.lr'].values) == [1e-4, 1e-3]
+
+@pytest.mark.parametrize('expression', [
+    'metadata.lr~0.1*',
+    'metadata.lr=abc',
+    'metadata.lr=auto',
+    'metadata.lr<5e-3',
+    'metadata.lr!=0.01',
+    'metadata.loss~0.*',
+    'metadata.loss>=0.3',
+    'metadata.final=true',
+    'metadata.final=True',
+    'metadata.final!=1',
+    'metadata.final<1',
+    'metadata.opt.name>b',
+    'metadata.opt.name!=1',
+    'metadata.version=1.0',
+    'metadata.version<2',
+])
+def test_filters_match_query(with_pit_repo: Callable[[], PitData], expression: str):
+    with_pit_repo(git_spec=GIT_SPEC_ONE)
+    for r in RECORDS + [{'metadata': {'version': '1.0'}}]:
+        point_in_time.snapshot(metadata=r['metadata'])
+
+    # `pit query` and `pit compare` select the same snapshots
+    queried = [s.pit_id for s in point_in_time.query([expression])]
+    compared = point_in_time.compare([expression], columns=[])['pit_id'].to_list()
+    assert compared == queried
+
+def test_cli_compare(with_pit_repo: Callable[[], PitData]):
+    with_pit_repo(git_spec=GIT_SPEC_ONE)
+    ids = [point_in_time.snapshot(metadata=r['metadata']).pit_id for r in RECORDS[:3]]
+
+    result = subprocess.run(['pit', 'compare', 'metadata.loss<0.4', '-c', 'metadata.loss'], capture_output=True, check=True)
+    lines = result.stdout.decode().splitlines()
+    assert lines[0].split() == ['pit_id', 'loss']
+    assert [l.split() for l in lines[1:]] == [[ids[2], '0.1'], [ids[1], '0.3']]
+
+    result = subprocess.run(['pit', 'compare', '--group-by', 'metadata.opt.name', '-c', 'metadata.loss'], capture_output=True, check=True)
+    lines = result.stdout.decode().splitlines()
+    assert [l.split() for l in lines] == [
+        ['metadata.opt.name', 'count', 'mean(loss)'],
+        ['adam', '2', '0.3'],
+        ['sgd', '1', '0.3'],
+    ]
+
+    result = subprocess.run(['pit', 'compare', 'date>2024-01-01'], capture_output=True)
+    assert result.returncode == PIT_CODE_QUERY_INVALID
@@ -0,0 +1,100 @@
+import os
+import subprocess
+from typing import Callable
+
+import pytest
+
+import point_in_time
+from point_in_time.constants.return_codes import PIT_CODE_QUERY_INVALID
+from point_in_time.errors import PITQueryError
+from point_in_time.query_index import PITQueryIndex, QueryFilter, flatten_metadata
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+RUNS = [
+    {'hostname': 'gpu-01', 'username': 'ada', 'lr': 1e-2, 'opt': {'name': 'adam'}, 'tags': ['a']},
+    {'hostname': 'gpu-02', 'username': 'ada', 'lr': 1e-3, 'opt': {'name': 'sgd'}, 'final': True},
+    {'hostname': 'gpu-01', 'username': 'bob', 'lr': 1e-4, 'opt': {'name': 'adam'}, 'version': '1.0'},
+]
+
+def test_flatten_metadata():
+    assert list(flatten_metadata({'opt': {'lr': 0.1}, 'tag': 'sweep', 'ok': True, 'ids': [1, 2], 'none': None})) == [
+        ('metadata.opt.lr', 0.1, None),
+        ('metadata.tag', None, 'sweep'),
+        ('metadata.ok', 1, 'true'),
+        ('metadata.ids', None, '[1, 2]'),
+        ('metadata.none', None, None),
+    ]
+
+@pytest.mark.parametrize('expression', ['lr>1', 'metadata.>1', 'metadata.lr', '=1', 'file'])
+def test_filter_invalid(expression: str):
+    with pytest.raises(PITQueryError):
+        QueryFilter.parse(expression)
+
+def test_query(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    ids = [point_in_time.snapshot(metadata=m).pit_id for m in RUNS]
+
+    index = PITQueryIndex(d.pit_repo)
+    assert index.sync() == 3
+    assert index.sync() == 0
+
+    def query(*filters, **kwargs):
+        return index.query([QueryFilter.parse(f) for f in filters], **kwargs)
+
+    assert query() == ids[::-1]
+    assert query('metadata.lr>=1e-3') == [ids[1], ids[0]]
+    assert query('host=gpu-01') == [ids[2], ids[0]]
+    assert query('host=gpu-01', 'user=ada') == [ids[0]]
+    assert query('origin=bob@gpu-01') == [ids[2]]
+    assert query('metadata.opt.name=adam', 'metadata.lr<1e-3') == [ids[2]]
+    assert query('metadata.final=true') == query('metadata.final=1') == [ids[1]]
+    assert query('metadata.version=1.0') == [ids[2]]
+    assert query('host~gpu-*', limit=1) == [ids[2]]
+    assert query('date>=2000-01-01', 'date<2999-01-01') == ids[::-1]
+    assert query('date<2000-01-01') == []
+    assert query(f'pit_id={ids[1]}') == [ids[1]]
+    assert query('file~*') == ids[::-1]
+
+    assert query(sort='metadata.lr') == ids
+    assert query(sort='metadata.lr', ascending=True) == ids[::-1]
+    assert query(sort='host', ascending=True, limit=2, offset=1) == [ids[2], ids[1]]
+    with pytest.raises(PITQueryError):
+        query(sort='file')
+    with pytest.raises(PITQueryError):
+        query('date>yesterday')
+
+    # Snapshots taken since the last sync are indexed incrementally
+    new = point_in_time.snapshot(metadata={'lr': 1}).pit_id
+    assert [s.pit_id for s in point_in_time.query(['metadata.lr>0.5'])] == [new]
+    assert index.sync() == 0
+
+def test_query_rebuilt(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    ids = [point_in_time.snapshot(metadata=m).pit_id for m in RUNS]
+
+    index = PITQueryIndex(d.pit_repo)
+    index.sync()
+    os.remove(index.path)
+    assert index.sync() == 3
+
+    # A position past the end of the log, as if the log was replaced
+    conn = index._connect()
+    conn.execute('UPDATE state SET offset = offset + 1000')
+    conn.close()
+    assert index.sync() == 3
+    assert index.query([QueryFilter.parse('host=gpu-02')]) == [ids[1]]
+
+def test_cli_query(with_pit_repo: Callable[[], PitData]):
+    with_pit_repo(git_spec=GIT_SPEC_ONE)
+    ids = [point_in_time.snapshot(metadata=m).pit_id for m in RUNS]
+
+    result = subprocess.run(['pit', 'query', 'host=gpu-01', '--ids'], capture_output=True, check=True)
+    assert result.stdout.decode().split() == [ids[2], ids[0]]
+
+    result = subprocess.run(['pit', 'query', 'host=gpu-02'], capture_output=True, check=True)
+    assert f'snapshot {ids[1]}' in result.stdout.decode()
+
+    result = subprocess.run(['pit', 'query', 'nope=1'], capture_output=True)
+    assert result.returncode == PIT_CODE_QUERY_INVALID
@@ -0,0 +1,257 @@
+import os
+import subprocess
+from typing import Callable
+
+import pytest
+
+import threading
+
+from point_in_time.repo import PITRepo, SpeculativeSnapshot
+from point_in_time.utils.main import flatten_status_paths
+from point_in_time.errors import PITMaterializeError, PITSnapshotCancelledError
+from point_in_time.constants.return_codes import PIT_CODE_SNAPSHOT_ABORTED
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def ls_tree(commit: str) -> set:
+    result = subprocess.run(
+        ['git', 'ls-tree', '-r', '-z', '--name-only', commit],
+        check=True,
+        capture_output=True
+    )
+    return set(os.fsdecode(p) for p in result.stdout.split(b'\0') if p != b'')
+
+def worktree_state(path: str) -> dict:
+    state = {}
+    for root, dirs, files in os.walk(path):
+        for ignored in ('.git', '.pit'):
+            if ignored in dirs:
+                dirs.remove(ignored)
+        for f in files:
+            p = os.path.join(root, f)
+            state[p] = os.stat(p).st_mtime_ns
+    return state
+
+def test_index_engine(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = d.pit_repo
+
+    paths = repo.get_snapshot_paths()
+    before = worktree_state(d.path)
+    with open('.git/index', 'rb') as f:
+        index_before = f.read()
+
+    s = repo.snapshot(
+        paths=flatten_status_paths(paths),
+        metadata={'engine': 'index'},
+        engine='index'
+    )
+
+    # Nothing in the worktree, index or stash is touched
+    assert worktree_state(d.path) == before
+    with open('.git/index', 'rb') as f:
+        assert f.read() == index_before
+    assert subprocess.run(
+        ['git', 'stash', 'list'],
+        check=True,
+        capture_output=True
+    ).stdout == b''
+
+    # Snapshot contains the committed, staged and untracked files
+    expected = set(GIT_SPEC_ONE.spec_fattened(exclude_codes=['!!']))
+    assert ls_tree(s.git_hash) == expected
+
+    assert repo._load_log()[s.pit_id] == s
+    assert repo.get_details(s).files_changed == sorted(
+        expected - set(GIT_SPEC_ONE.spec_dict['99'])
+    )
+
+def test_index_engine_force(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=['file_committed.txt']
+    )
+
+    # Modify a committed file
+    with open('file_committed.txt', 'w') as f:
+        f.write('modified')
+
+    s = d.pit_repo.snapshot(
+        paths=['file_committed.txt'],
+        force_paths=['ignored_dir/'],
+        engine='index'
+    )
+
+    assert ls_tree(s.git_hash) == {
+        'file_committed.txt',
+        'ignored_dir/file_one.txt',
+        'ignored_dir/file_two.txt',
+    }
+    assert subprocess.run(
+        ['git', 'show', f'{s.git_hash}:file_committed.txt'],
+        check=True,
+        capture_output=True
+    ).stdout == b'modified'
+
+@pytest.mark.parametrize('engine', ['stash', 'index'])
+def test_cli_snapshot(with_pit_repo: Callable[[], PitData], engine: str):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    subprocess.run(
+        ['pit', 'snapshot', '-y', '--engine', engine],
+        check=True
+    )
+
+    log = d.pit_repo._load_log()
+    assert len(log) == 1
+
+def test_large_files(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"large_file_threshold": 100000}')
+
+    os.makedirs('data')
+    large = os.urandom(300_000)
+    with open('data/large.bin', 'wb') as f:
+        f.write(large)
+    with open('data/small.txt', 'w') as f:
+        f.write('small')
+    with open('ignored_dir/large.bin', 'wb') as f:
+        f.write(large)
+
+    paths = d.pit_repo.get_snapshot_paths()
+    s = d.pit_repo.snapshot(
+        paths=flatten_status_paths(paths),
+        force_paths=['ignored_dir/'],
+        engine='index'
+    )
+
+    tree = ls_tree(s.git_hash)
+    assert {'data/large.bin', 'data/small.txt', 'ignored_dir/large.bin'} <= tree
+    blob = subprocess.run(
+        ['git', 'show', f'{s.git_hash}:data/large.bin'],
+        check=True,
+        capture_output=True
+    ).stdout
+    assert len(blob) < 256
+
+    # Nothing to overwrite with
+    with pytest.raises(PITMaterializeError):
+        d.pit_repo.materialize(s)
+
+    os.remove('data/large.bin')
+    subprocess.run(['pit', 'materialize', s.pit_id, 'data'], check=True)
+    with open('data/large.bin', 'rb') as f:
+        assert f.read() == large
+
+    subprocess.run(['pit', 'materialize', s.pit_id, '-o', 'restored'], check=True)
+    with open('restored/ignored_dir/large.bin', 'rb') as f:
+        assert f.read() == large
+    assert not os.path.exists('restored/data/small.txt')
+
+@pytest.mark.parametrize('engine', ['stash', 'index'])
+def test_dedup(with_pit_repo: Callable[[], PitData], engine: str):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = d.pit_repo
+
+    def snapshot(dedup=True, **kwargs):
+        paths = repo.get_snapshot_paths()
+        return repo.snapshot(paths=flatten_status_paths(paths), engine=engine, dedup=dedup, **kwargs)
+
+    s = snapshot(metadata={'run': 1})
+    assert s.tree_hash is not None
+
+    # The same contents again only record an alias, with its own metadata
+    alias = snapshot(metadata={'run': 2})
+    assert alias.pit_id != s.pit_id
+    assert alias.git_hash == s.git_hash
+    assert alias.alias_of == s.pit_id
+    assert repo.get_entry(alias.pit_id).metadata == {'run': 2}
+    assert 'tree_hash' not in repo._open_log().get(alias.pit_id)
+    assert f'Alias of: {s.pit_id}' in repo.get_details(alias).format()
+
+    assert snapshot(dedup=False).alias_of is None
+
+    with open('file_committed.txt', 'w') as f:
+        f.write('modified')
+    changed = snapshot()
+    assert changed.git_hash != s.git_hash
+    assert changed.alias_of is None
+
+    # Only the index engine builds the tree to look for an existing snapshot by default
+    default = repo.snapshot(paths=flatten_status_paths(repo.get_snapshot_paths()), engine=engine)
+    assert (default.alias_of == changed.pit_id) == (engine == 'index')
+
+@pytest.mark.parametrize('engine', ['stash', 'index'])
+def test_speculative(with_pit_repo: Callable[[], PitData], engine: str):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = d.pit_repo
+    paths = flatten_status_paths(repo.get_snapshot_paths())
+
+    s = SpeculativeSnapshot(repo, paths, engine=engine, dedup=True).commit({'run': 1})
+    assert repo.get_entry(s.pit_id).metadata == {'run': 1}
+    assert 'file_committed.txt' in ls_tree(s.git_hash)
+
+    # Changed after the snapshot was prepared, it is prepared again
+    speculative = SpeculativeSnapshot(repo, paths, engine=engine, dedup=True)
+    speculative._thread.join()
+    with open('file_staged.txt', 'w') as f:
+        f.write('changed while prompting')
+    changed = speculative.commit()
+    assert changed.alias_of is None
+    assert 'verify' in speculative.timer.phases
+    shown = subprocess.run(
+        ['git', 'show', f'{changed.git_hash}:file_staged.txt'],
+        check=True,
+        capture_output=True
+    ).stdout
+    assert shown == b'changed while prompting'
+
+    # Discarded snapshots are never recorded
+    speculative = SpeculativeSnapshot(repo, paths, engine=engine, dedup=True)
+    speculative.discard()
+    assert len(repo._load_log()) == 2
+
+def test_speculative_own_repo(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    repo = PITRepo(d.pit_repo._path)
+    paths = flatten_status_paths(d.pit_repo.get_snapshot_paths())
+
+    # The caches of the repository are left to the calling thread, the phases of the preparation are added to its timer
+    speculative = SpeculativeSnapshot(repo, paths, engine='index')
+    speculative._thread.join()
+    assert repo._include_spec is None
+    assert repo._log_cache is None
+    s = speculative.commit()
+    assert s.tree_hash is not None
+    assert 'scan' in speculative.timer.phases
+
+    # Stash snapshots without dedup have nothing to prepare
+    assert PITRepo.prepares_tree('index')
+    assert PITRepo.prepares_tree('stash', dedup=True)
+    assert not PITRepo.prepares_tree('stash')
+    prepared = repo.prepare_snapshot(paths, engine='stash')
+    assert prepared.tree is None and prepared.scan is None
+
+def test_prepare_cancelled(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(PITSnapshotCancelledError):
+        d.pit_repo.prepare_snapshot(
+            flatten_status_paths(d.pit_repo.get_snapshot_paths()),
+            engine='index',
+            cancel=cancel
+        )
+
+@pytest.mark.parametrize('engine', ['stash', 'index'])
+def test_cli_snapshot_prompt(with_pit_repo: Callable[[], PitData], engine: str):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    result = subprocess.run(['pit', 'snapshot', '--engine', engine], input=b'n\n', capture_output=True)
+    assert result.returncode == PIT_CODE_SNAPSHOT_ABORTED
+    assert len(d.pit_repo._load_log()) == 0
+
+    subprocess.run(['pit', 'snapshot', '--engine', engine], input=b'y\n', capture_output=True, check=True)
+    assert len(d.pit_repo._load_log()) == 1
@@ -1,7 +1,12 @@
+import os
+import subprocess
 from typing import Callable, Dict
 
 import pytest
 
+from point_in_time.repo import PITRepo
+from point_in_time.include import IncludeSpec
+
 from test_resources.fixtures import PitData
 from test_resources.git_specs import (
     GIT_SPEC_ONE
@@ -56,4 +61,119 @@ def test_repo_status(with_pit_repo: Callable[[], PitData], test_spec: Dict):
         include_lines=test_spec['include_lines']
     )
 
-    assert test_spec['expected_status'] == d.pit_repo.get_snapshot_paths_status()
\ No newline at end of file
+    assert test_spec['expected_status'] == d.pit_repo.get_snapshot_paths_status()
+
+def test_single_status_scan(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d: PitData = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=STATUS_TEST_SPEC_TWO['include_lines']
+    )
+
+    calls = []
+    original_popen = subprocess.Popen
+    def popen(args, *pargs, **kwargs):
+        calls.append(args)
+        return original_popen(args, *pargs, **kwargs)
+    monkeypatch.setattr(subprocess, 'Popen', popen)
+
+    git_status = d.pit_repo.get_status()
+    paths = d.pit_repo.get_snapshot_paths(git_status)
+    status = d.pit_repo.get_snapshot_paths_status(paths, git_status=git_status)
+
+    assert status == STATUS_TEST_SPEC_TWO['expected_status']
+    assert len([a for a in calls if 'status' in a]) == 1
+
+def test_force_section(with_pit_repo: Callable[[], PitData]):
+    d: PitData = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=[
+            'file_staged.txt',
+            '# force',
+            'ignored_dir/'
+        ]
+    )
+
+    # Note: The scoped scan uses `--ignored=matching`, which reports the individually ignored files rather than their directory
+    assert d.pit_repo.get_snapshot_paths() == {
+        'A ': ['file_staged.txt'],
+        '!!': ['ignored_dir/file_one.txt', 'ignored_dir/file_two.txt']
+    }
+
+@pytest.mark.parametrize('include_lines, ignored_scan', [
+    (['*'], None),
+    (['*', '# force', 'ignored_dir/'], [':(glob)**/ignored_dir/**']),
+])
+def test_ignored_scan_scope(
+    with_pit_repo: Callable[[], PitData],
+    monkeypatch,
+    include_lines,
+    ignored_scan
+):
+    d: PitData = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=include_lines
+    )
+
+    calls = []
+    original_popen = subprocess.Popen
+    def popen(args, *pargs, **kwargs):
+        calls.append(args)
+        return original_popen(args, *pargs, **kwargs)
+    monkeypatch.setattr(subprocess, 'Popen', popen)
+
+    d.pit_repo.get_status()
+
+    status_calls = [a for a in calls if 'status' in a]
+    assert '--ignored=no' in status_calls[0]
+    if ignored_scan is None:
+        assert len(status_calls) == 1
+    else:
+        assert len(status_calls) == 2
+        assert '--ignored=traditional' in status_calls[1]
+        assert status_calls[1][status_calls[1].index('--')+1:] == ignored_scan
+
+def test_include_cache(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d: PitData = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=['*', '!file_untracked.txt']
+    )
+    first = d.pit_repo.get_snapshot_paths()
+    assert os.path.isfile(d.pit_repo._include_cache_path)
+
+    # A new repo object loads the compiled include file from the on disk cache
+    def fail(*args, **kwargs):
+        raise AssertionError("Include file was recompiled")
+    monkeypatch.setattr(IncludeSpec, 'parse', fail)
+    assert PITRepo(d.pit_repo._path).get_snapshot_paths() == first
+    monkeypatch.undo()
+
+    # Changing the include file invalidates both caches
+    with open(d.pit_repo._include_path, 'w') as f:
+        f.write('\n'.join(['*']))
+    assert 'file_untracked.txt' not in first['??']
+    assert 'file_untracked.txt' in d.pit_repo.get_snapshot_paths()['??']
+
+@pytest.mark.parametrize('include_lines', [
+    ['*.txt'],
+    ['*.txt', '!foo.txt'],
+    ['deep/'],
+    ['*'],
+])
+def test_scoped_matches_full_scan(with_pit_repo: Callable[[], PitData], include_lines):
+    d: PitData = with_pit_repo(
+        git_spec=GIT_SPEC_ONE,
+        include_lines=include_lines
+    )
+    os.makedirs('sub/deep')
+    for path in ('sub/foo.txt', 'sub/bar.log', 'sub/deep/q.txt'):
+        with open(path, 'w') as f:
+            f.write(path)
+
+    scoped = d.pit_repo.get_snapshot_paths(d.pit_repo.get_status(scoped=True))
+    full = d.pit_repo.get_snapshot_paths(d.pit_repo.get_status())
+    assert scoped == full
+
+    # Partly included untracked directories are expanded to their included files
+    if include_lines == ['*.txt']:
+        assert {'sub/foo.txt', 'sub/deep/q.txt'} <= set(full['??'])
+        assert 'sub/' not in full['??']
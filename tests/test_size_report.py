@@ -0,0 +1,111 @@
+import os
+import subprocess
+from typing import Callable
+
+import pytest
+
+from point_in_time.constants.return_codes import PIT_CODE_SIZE_BUDGET_EXCEEDED, PIT_CODE_REPO_LOAD_FAILED
+from point_in_time.errors import PITSizeBudgetError
+from point_in_time.size_report import format_bytes
+from point_in_time.utils.main import flatten_status_paths
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def write_data():
+    os.makedirs('data/nested')
+    with open('data/nested/checkpoint.bin', 'wb') as f:
+        f.write(b'\0' * 50_000)
+    with open('data/small.txt', 'w') as f:
+        f.write('small')
+    with open('file_ignored.txt', 'wb') as f:
+        f.write(b'\0' * 20_000)
+
+def snapshot_paths(repo):
+    paths = repo.get_snapshot_paths()
+    return (
+        flatten_status_paths(paths, codes=[c for c in paths.keys() if c != '!!']),
+        ['file_ignored.txt']
+    )
+
+def test_format_bytes():
+    assert format_bytes(0) == '0 B'
+    assert format_bytes(1536) == '1.5 KiB'
+    assert format_bytes(3 * 1024 ** 3) == '3.0 GiB'
+
+def test_size_report(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    write_data()
+
+    paths, force_paths = snapshot_paths(d.pit_repo)
+    assert 'data/' in paths
+    report = d.pit_repo.get_size_report(paths, force_paths)
+
+    # Untracked directories are expanded to their files, largest first
+    assert report.files[:2] == [('data/nested/checkpoint.bin', 50_000), ('file_ignored.txt', 20_000)]
+    assert ('data/small.txt', 5) in report.files
+    assert report.total == sum(size for _, size in report.files)
+    assert report.violations() == []
+    assert report.format()[1] == 'Largest included files:'
+
+    # Including ignored files of forced directories
+    forced = d.pit_repo.get_size_report([], ['ignored_dir/'])
+    assert ('ignored_dir/file_one.txt', 0) in forced.files
+
+def test_size_budget(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    write_data()
+    paths, force_paths = snapshot_paths(d.pit_repo)
+
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"max_file_bytes": 30000}')
+    with pytest.raises(PITSizeBudgetError) as err:
+        d.pit_repo.snapshot(paths, force_paths=force_paths, engine='index')
+    assert 'data/nested/checkpoint.bin' in err.value.msg
+    assert 'file_ignored.txt' not in err.value.msg
+    assert len(d.pit_repo._load_log()) == 0
+
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"max_snapshot_bytes": 60000}')
+    with pytest.raises(PITSizeBudgetError):
+        d.pit_repo.snapshot(paths, force_paths=force_paths, engine='index')
+    assert d.pit_repo.check_size_budget(paths) is not None
+
+    d.pit_repo.snapshot(paths, force_paths=force_paths, engine='index', check_budget=False)
+    assert len(d.pit_repo._load_log()) == 1
+
+def test_cli_size_budget(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    write_data()
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"max_file_bytes": 30000}')
+
+    result = subprocess.run(['pit', 'status'], capture_output=True, check=True)
+    assert 'Largest included files:' in result.stdout.decode()
+    assert 'data/nested/checkpoint.bin' in result.stdout.decode()
+
+    for args, input in ((['-y'], None), ([], b'y\n')):
+        result = subprocess.run(['pit', 'snapshot', '--engine', 'index'] + args, input=input, capture_output=True)
+        assert result.returncode == PIT_CODE_SIZE_BUDGET_EXCEEDED
+    assert 'over the per file budget' in result.stdout.decode()
+    assert len(d.pit_repo._load_log()) == 0
+
+    subprocess.run(['pit', 'snapshot', '--engine', 'index', '-y', '--ignore-budget'], check=True)
+    assert len(d.pit_repo._load_log()) == 1
+
+def test_cli_malformed_config(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    subprocess.run(['pit', 'snapshot', '--engine', 'index', '-y'], check=True, capture_output=True)
+    with open(d.pit_repo._config_path, 'w') as f:
+        f.write('{"max_file_bytes": "big"}')
+
+    for args, input in (
+        (['status'], None),
+        (['snapshot', '--engine', 'index'], b'y\n'),
+        (['snapshot', '--engine', 'index', '-y'], None),
+        (['snapshot', '--engine', 'index', '-y', '--if-changed'], None),
+    ):
+        result = subprocess.run(['pit'] + args, input=input, capture_output=True)
+        assert result.returncode == PIT_CODE_REPO_LOAD_FAILED, args
+        assert 'Traceback' not in result.stderr.decode()
+    assert len(d.pit_repo._load_log()) == 1
@@ -0,0 +1,168 @@
+import os
+import subprocess
+import time
+from typing import Callable
+
+import pytest
+
+from point_in_time.repo import PITRepo
+from point_in_time.errors import PITIdNotFoundError
+from point_in_time.utils.main import flatten_status_paths
+from point_in_time.worktree_cache import WorktreeCache, git_blob_hash
+
+from test_resources.fixtures import PitData
+from test_resources.git_specs import GIT_SPEC_ONE
+
+def age_worktree(path: str):
+    # Note: Stat information is only trusted once older than `RACY_NS`
+    past = time.time() - 60
+    for root, dirs, files in os.walk(path):
+        for skipped in ('.git', '.pit'):
+            if skipped in dirs:
+                dirs.remove(skipped)
+        for name in files + dirs:
+            os.utime(os.path.join(root, name), (past, past))
+    os.utime(path, (past, past))
+
+def snapshot(repo: PITRepo, engine: str = 'index'):
+    paths = repo.get_snapshot_paths()
+    # Note: The stash engine only records the tree, and so the worktree cache, with dedup
+    return repo.snapshot(
+        paths=flatten_status_paths(paths, codes=[c for c in paths.keys() if c != '!!']),
+        force_paths=flatten_status_paths(paths, codes=['!!']),
+        engine=engine,
+        dedup=True
+    )
+
+def no_tree(monkeypatch):
+    # Checks answered from the worktree cache never build a tree
+    def fail(*args, **kwargs):
+        raise AssertionError("Unexpected tree build")
+    monkeypatch.setattr(PITRepo, '_snapshot_tree', fail)
+
+def test_git_blob_hash(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(b'contents\n')
+    expected = subprocess.run(['git', 'hash-object', str(path)], check=True, capture_output=True).stdout.decode().strip()
+    assert git_blob_hash(str(path)) == expected
+
+@pytest.mark.parametrize('engine', ['stash', 'index'])
+def test_unchanged(with_pit_repo: Callable[[], PitData], engine: str, monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    with open('.gitignore', 'a') as f:
+        f.write('\n*.log\nbuild/\n')
+    age_worktree(d.path)
+    s = snapshot(d.pit_repo, engine=engine)
+    age_worktree(d.path)
+
+    with monkeypatch.context() as m:
+        no_tree(m)
+        assert not d.pit_repo.is_dirty_since(s.pit_id)
+
+        # Touched without changing, the file is hashed once and its new stat information recorded
+        os.utime('file_committed.txt', None)
+        assert not d.pit_repo.is_dirty_since(s.pit_id)
+
+        # New files and directories which git ignores
+        with open('run.log', 'w') as f:
+            f.write('ignored')
+        with open('.gitignore', 'a') as f:
+            pass
+        os.makedirs('build/out')
+        assert not d.pit_repo.is_dirty_since(s.pit_id)
+
+    with pytest.raises(PITIdNotFoundError):
+        d.pit_repo.is_dirty_since('missing')
+
+def test_changed(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    s = snapshot(d.pit_repo)
+    no_tree(monkeypatch)
+
+    assert not d.pit_repo.is_dirty_since(s.pit_id)
+    with open('dir/file_one.txt', 'a') as f:
+        f.write('changed')
+    assert d.pit_repo.is_dirty_since(s.pit_id)
+
+@pytest.mark.parametrize('change', ['new', 'new_dir', 'remove', 'chmod', 'head'])
+def test_changes_detected(with_pit_repo: Callable[[], PitData], change: str):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    age_worktree(d.path)
+    s = snapshot(d.pit_repo)
+    age_worktree(d.path)
+    assert not d.pit_repo.is_dirty_since(s.pit_id)
+
+    if change == 'new':
+        with open('dir/file_three.txt', 'w') as f:
+            f.write('new')
+    elif change == 'new_dir':
+        os.makedirs('new_dir')
+        with open('new_dir/file.txt', 'w') as f:
+            f.write('new')
+    elif change == 'remove':
+        os.remove('file_untracked.txt')
+    elif change == 'chmod':
+        os.chmod('file_committed.txt', 0o755)
+    elif change == 'head':
+        subprocess.run(['git', 'commit', '-q', '--allow-empty', '-m', 'empty'], check=True)
+    assert d.pit_repo.is_dirty_since(s.pit_id)
+
+def test_scan_pruned(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE, include_lines=['/dir/'])
+    os.makedirs('other/deep')
+    with open('other/deep/file.txt', 'w') as f:
+        f.write('not included')
+    age_worktree(d.path)
+    s = snapshot(d.pit_repo)
+
+    # Only directories which can hold included files are scanned
+    cache = WorktreeCache.load(d.pit_repo._worktree_cache_path)
+    assert 'dir' in cache.dirs
+    assert 'other' not in cache.dirs and 'other/deep' not in cache.dirs
+
+    no_tree(monkeypatch)
+    with open('other/deep/new.txt', 'w') as f:
+        f.write('not included')
+    os.makedirs('other_new')
+    assert not d.pit_repo.is_dirty_since(s.pit_id)
+
+    with open('dir/file_three.txt', 'w') as f:
+        f.write('included')
+    assert d.pit_repo.is_dirty_since(s.pit_id)
+
+def test_cache_rebuilt(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+    s = snapshot(d.pit_repo)
+    alias = snapshot(d.pit_repo)
+    assert alias.alias_of == s.pit_id
+
+    # Without the cache the tree is compared, and the cache recorded again
+    os.remove(d.pit_repo._worktree_cache_path)
+    assert not d.pit_repo.is_dirty_since(alias.pit_id)
+    cache = WorktreeCache.load(d.pit_repo._worktree_cache_path)
+    assert cache is not None and cache.tree == s.tree_hash
+    assert 'file_committed.txt' in cache.files
+    assert 'file_ignored.txt' not in cache.files
+
+    # Changing the include file changes what is included
+    with open(d.pit_repo._include_path, 'w') as f:
+        f.write('dir/\n')
+    assert d.pit_repo.is_dirty_since(s.pit_id)
+
+def test_cli_if_changed(with_pit_repo: Callable[[], PitData]):
+    d = with_pit_repo(git_spec=GIT_SPEC_ONE)
+
+    for _ in range(2):
+        subprocess.run(['pit', 'snapshot', '-y', '--if-changed'], check=True)
+    assert len(d.pit_repo._load_log()) == 1
+
+    with open('file_untracked.txt', 'a') as f:
+        f.write('changed')
+    subprocess.run(['pit', 'snapshot', '-y', '--if-changed'], check=True)
+    assert len(d.pit_repo._load_log()) == 2
+
+    # Changes always include untracked files
+    result = subprocess.run(['pit', 'snapshot', '-y', '--if-changed', '--no-untracked'], capture_output=True)
+    assert result.returncode == 2
+    assert '--no-untracked' in result.stderr.decode()
+    assert len(d.pit_repo._load_log()) == 2
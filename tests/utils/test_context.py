@@ -0,0 +1,130 @@
+import os
+import shutil
+import subprocess
+from typing import Callable
+
+import pytest
+
+from point_in_time.utils.context import RepoContext
+
+from test_resources.fixtures import GitData, GitSpec, PitData
+
+def git_toplevel(cwd: str):
+    result = subprocess.run(
+        ['git', 'rev-parse', '--show-toplevel'],
+        cwd=cwd,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode().strip()
+
+@pytest.fixture
+def no_subprocess(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("Unexpected subprocess: %s" % (args,))
+
+    def inner():
+        monkeypatch.setattr(subprocess, 'run', fail)
+        monkeypatch.setattr(subprocess, 'Popen', fail)
+    return inner
+
+def commit_all(cwd: str):
+    subprocess.run(['git', 'add', '-A'], cwd=cwd, check=True)
+    subprocess.run(['git', 'commit', '-q', '-m', 'Commit'], cwd=cwd, check=True)
+
+def test_discovery(with_git_repo: Callable[[], GitData], no_subprocess):
+    d = with_git_repo()
+    os.makedirs('a/b')
+
+    no_subprocess()
+    for cwd in (d.path, os.path.join(d.path, 'a', 'b')):
+        context = RepoContext(cwd)
+        assert context.toplevel == d.path
+        assert context.pit_path == os.path.join(d.path, '.pit')
+    assert RepoContext.current('a') is RepoContext.current('a')
+
+def test_not_a_repo(with_empty_dir, no_subprocess):
+    os.makedirs('a')
+    no_subprocess()
+
+    context = RepoContext(os.getcwd())
+    assert not context.is_inside_working_tree
+
+    with pytest.raises(NotADirectoryError):
+        RepoContext(os.path.join(os.getcwd(), 'missing'))
+
+def test_inside_git_dir(with_git_repo: Callable[[], GitData]):
+    d = with_git_repo()
+
+    assert not RepoContext(os.path.join(d.path, '.git')).is_inside_working_tree
+
+def test_linked_worktree(with_git_repo: Callable[[], GitData], no_subprocess):
+    d = with_git_repo(GitSpec({'99': {'file.txt'}}))
+    worktree = os.path.join(d.path, 'linked')
+    subprocess.run(['git', 'worktree', 'add', '-q', worktree], check=True)
+    os.makedirs(os.path.join(worktree, 'sub'))
+    expected = git_toplevel(os.path.join(worktree, 'sub'))
+
+    no_subprocess()
+    assert RepoContext(os.path.join(worktree, 'sub')).toplevel == expected == worktree
+
+def test_separate_git_dir(with_empty_dir, no_subprocess):
+    root = os.getcwd()
+    subprocess.run(
+        ['git', 'init', '-q', '--separate-git-dir', os.path.join(root, 'gitdir'), 'repo'],
+        check=True
+    )
+    assert os.path.isfile(os.path.join(root, 'repo', '.git'))
+    expected = git_toplevel(os.path.join(root, 'repo'))
+
+    no_subprocess()
+    assert RepoContext(os.path.join(root, 'repo')).toplevel == expected
+
+def test_git_dir_env(with_git_repo: Callable[[], GitData], monkeypatch):
+    d = with_git_repo()
+    os.makedirs('a')
+    monkeypatch.setenv('GIT_DIR', os.path.join(d.path, '.git'))
+
+    # Note: With only GIT_DIR set git treats the current directory as the toplevel
+    cwd = os.path.join(d.path, 'a')
+    assert RepoContext(cwd).toplevel == git_toplevel(cwd) == cwd
+
+def test_ignore_state_remembered(with_pit_repo: Callable[[], PitData], monkeypatch):
+    d = with_pit_repo()
+    context = RepoContext(d.path)
+
+    assert context.is_pit_path_ignored
+
+    # Remembered without asking git again
+    monkeypatch.setattr(subprocess, 'run', None)
+    assert context.is_pit_path_ignored
+    monkeypatch.undo()
+
+    with open(d.git_data.ignore_path, 'w') as f:
+        f.write('')
+    context.invalidate_ignored()
+    assert not context.is_pit_path_ignored
+
+def test_cli_git_calls(with_pit_repo: Callable[[], PitData], tmp_path):
+    """
+    Repository discovery and the standard checks cost at most one git call per command.
+    """
+    with_pit_repo()
+
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    calls = tmp_path / 'calls'
+    shim = bin_dir / 'git'
+    shim.write_text(
+        '#!/bin/sh\n'
+        f'echo "$1" >> "{calls}"\n'
+        f'exec "{shutil.which("git")}" "$@"\n'
+    )
+    shim.chmod(0o755)
+
+    env = dict(os.environ)
+    env['PATH'] = f'{bin_dir}{os.pathsep}{env["PATH"]}'
+    subprocess.run(['pit', 'log'], env=env, check=True, capture_output=True)
+
+    assert calls.read_text().split() == ['check-ignore']
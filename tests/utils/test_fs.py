@@ -1,7 +1,9 @@
 import os
+import time
+import multiprocessing
 from pathlib import Path
 
-from point_in_time.utils.fs import ChDir
+from point_in_time.utils.fs import ChDir, FileLock, atomic_write
 
 def test_chdir(tmpdir: Path):
     origin = os.path.abspath(os.path.curdir)
@@ -18,4 +20,28 @@ def test_chdir(tmpdir: Path):
             raise RuntimeError()
     except RuntimeError:
         pass
-    assert os.path.abspath(os.path.curdir) == origin
\ No newline at end of file
+    assert os.path.abspath(os.path.curdir) == origin
+
+def test_atomic_write(tmp_path: Path):
+    path = str(tmp_path / 'file')
+    atomic_write(path, b'first')
+    atomic_write(path, b'second', fsync=True)
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'second'
+    assert os.listdir(tmp_path) == ['file']
+
+def hold_lock(path: str, hold: float) -> float:
+    with FileLock(path):
+        acquired = time.monotonic()
+        time.sleep(hold)
+    return acquired
+
+def test_file_lock(tmp_path: Path):
+    path = str(tmp_path / 'lock')
+
+    with multiprocessing.get_context('fork').Pool(2) as pool:
+        acquired = sorted(pool.starmap(hold_lock, [(path, 0.2), (path, 0.2)]))
+
+    # The second process only acquired the lock once the first released it
+    assert acquired[1] - acquired[0] >= 0.2
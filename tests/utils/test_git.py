@@ -1,8 +1,19 @@
+import subprocess
+
+import pytest
+
 from point_in_time.utils.git import (
     git_is_command,
     git_is_inside_working_tree,
     git_show_toplevel,
     git_check_ignore,
+    git_hash_objects,
+    git_commit_details,
+    git_commit_details_batch,
+    GitCommitDetailsBatch,
+    GitStatusEntry,
+    GitStatusParser,
+    git_status_porcelain_v2,
 )
 
 from test_resources.fixtures import GitSpec
@@ -34,4 +45,108 @@ def test_ignore_true(with_git_repo):
         GitSpec({'!!': {'my_file'}})
     )
 
-    assert git_check_ignore('my_file') == True
\ No newline at end of file
+    assert git_check_ignore('my_file') == True
+
+def test_hash_objects(with_git_repo):
+    with_git_repo()
+
+    # Names git would otherwise unquote or split
+    paths = ['plain.txt', '"quoted\\".txt', 'new\nline.txt']
+    for i, p in enumerate(paths):
+        with open(p, 'w') as f:
+            f.write(str(i))
+
+    expected = [
+        subprocess.run(['git', 'hash-object', '--', p], check=True, capture_output=True).stdout.decode().strip()
+        for p in paths
+    ]
+    assert git_hash_objects(paths) == expected
+    for h in expected:
+        subprocess.run(['git', 'cat-file', '-e', h], check=True)
+
+def test_commit_details_batch(with_git_repo):
+    with_git_repo()
+
+    hashes = []
+    for i in range(3):
+        with open(f'file_{i}.txt', 'w') as f:
+            f.write(str(i))
+        subprocess.run(['git', 'add', '-A'], check=True)
+        subprocess.run(['git', 'commit', '-m', f'Commit {i}'], check=True)
+        hashes.append(subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            check=True,
+            capture_output=True
+        ).stdout.decode().strip())
+
+    # Include a stash commit, which are merge commits
+    with open('file_0.txt', 'w') as f:
+        f.write('modified')
+    subprocess.run(['git', 'stash', 'push', '--include-untracked'], check=True)
+    hashes.append(subprocess.run(
+        ['git', 'rev-parse', 'stash@{0}'],
+        check=True,
+        capture_output=True
+    ).stdout.decode().strip())
+
+    # Repeated hashes are resolved each time
+    hashes = hashes + hashes[:1]
+
+    expected = [git_commit_details(h) for h in hashes]
+    assert [d.files_changed for d in expected] == [
+        ['file_0.txt'],
+        ['file_1.txt'],
+        ['file_2.txt'],
+        ['file_0.txt'],
+        ['file_0.txt']
+    ]
+    assert list(git_commit_details_batch(hashes)) == expected
+
+    with GitCommitDetailsBatch() as batch:
+        assert batch.details(hashes[1]) == expected[1]
+        with pytest.raises(ValueError):
+            batch.details('0' * 40)
+        # Process is still usable after a failed lookup
+        assert batch.details(hashes[2]) == expected[2]
+
+def test_status_parser_chunked():
+    output = (
+        b'1 .M N... 100644 100644 100644 aaaa aaaa with space.txt\0'
+        b'2 R. N... 100644 100644 100644 bbbb bbbb R100 new name.txt\0old name.txt\0'
+        b'u UU N... 100644 100644 100644 100644 cccc dddd eeee conflict.txt\0'
+        b'? \xc3\xbcn\xc3\xafcode.txt\0'
+        b'! ignored_dir/\0'
+    )
+    expected = [
+        GitStatusEntry(' M', b'with space.txt'),
+        GitStatusEntry('R ', b'new name.txt', b'old name.txt'),
+        GitStatusEntry('UU', b'conflict.txt'),
+        GitStatusEntry('??', 'ünïcode.txt'.encode()),
+        GitStatusEntry('!!', b'ignored_dir/'),
+    ]
+
+    # Entries are the same regardless of how the output is split
+    for chunk_size in (1, 7, len(output)):
+        parser = GitStatusParser()
+        entries = []
+        for i in range(0, len(output), chunk_size):
+            entries += parser.feed(output[i:i+chunk_size])
+        parser.close()
+
+        assert entries == expected
+
+def test_status_porcelain_v2(with_git_repo):
+    with_git_repo(
+        GitSpec({
+            '??': ['ünïcode.txt', 'dir/file.txt'],
+            '!!': ['ignored.txt']
+        })
+    )
+
+    entries = set(git_status_porcelain_v2(['--ignored']))
+    assert entries == {
+        GitStatusEntry('??', 'ünïcode.txt'.encode()),
+        GitStatusEntry('??', b'dir/'),
+        GitStatusEntry('??', b'.gitignore'),
+        GitStatusEntry('!!', b'ignored.txt'),
+    }
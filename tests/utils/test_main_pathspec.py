@@ -6,7 +6,14 @@ from functools import reduce
 
 import pytest
 
-from point_in_time.utils.main import status_filter_pathspec
+from pathspec import PathSpec
+from pathspec.patterns import GitWildMatchPattern
+
+from point_in_time.utils.main import (
+    GitStatus,
+    status_filter_pathspec,
+    pathspec_to_git_pathspecs
+)
 
 from test_resources.fixtures import GitSpec, GIT_CODE_COMMITTED
 from test_resources.git_specs import GIT_SPEC_ONE
@@ -132,4 +139,59 @@ def test_with_rm(pathspec_fixture_all_committed, file: str):
         '!!': GIT_SPEC_ONE.git_status_spec['!!'],
         'D ': [file]
     }
-    assert files == expect
\ No newline at end of file
+    assert files == expect
+
+def test_non_ascii_paths(with_git_repo):
+    with_git_repo(
+        GitSpec({'??': ['ünïcode.txt', 'data/日本語.csv']})
+    )
+
+    files = status_filter_pathspec(['*.txt', 'data/'])
+    assert files == {
+        '??': ['data/', 'ünïcode.txt']
+    }
+
+@pytest.mark.parametrize('lines, expected', [
+    (['*'], (None, True)),
+    (['*', '!file_untracked.txt'], (None, False)),
+    (['# comment', ''], ([], True)),
+    (['*.txt'], ([':(glob)**/*.txt', ':(glob)**/*.txt/**'], True)),
+    (['dir/'], ([':(glob)**/dir/**'], True)),
+    (['/dir/file_one.txt'], ([':(glob)dir/file_one.txt', ':(glob)dir/file_one.txt/**'], True)),
+    (['dir/**/*.txt'], ([':(glob)dir/**/*.txt', ':(glob)dir/**/*.txt/**'], True)),
+    (['\\#hash.txt'], (None, False)),
+])
+def test_git_pathspec_translation(lines, expected):
+    assert pathspec_to_git_pathspecs(lines) == expected
+
+@pytest.mark.parametrize('lines', [
+    ['dir'],
+    ['dir/'],
+    ['file_staged.txt', 'dir/file_one.txt'],
+    ['*.txt', '!dir/file_one.txt'],
+    ['white   space.txt'],
+])
+def test_scoped_status(pathspec_fixture, lines):
+    pathspec_fixture()
+
+    pathspecs, exact = pathspec_to_git_pathspecs(lines)
+    scoped = GitStatus.collect(pathspecs=pathspecs)
+
+    files = scoped.filter_pathspec(lines)
+    if exact:
+        assert scoped.all_paths() == files
+
+    # Every included file is covered by the scoped result, which may be more granular than a full scan
+    full = status_filter_pathspec(['*'])
+    expected = set(
+        p for p in GIT_SPEC_ONE.spec_fattened(exclude_codes=[GIT_CODE_COMMITTED])
+        if PathSpec.from_lines(GitWildMatchPattern, lines).match_file(p)
+    )
+    covered = set()
+    for paths in files.values():
+        for p in paths:
+            covered |= set(
+                e for e in expected if e == p or (p.endswith('/') and e.startswith(p))
+            )
+    assert covered == expected
+    assert set(files.keys()) <= set(full.keys())
@@ -0,0 +1,120 @@
+import pickle
+import random
+
+import pytest
+
+from pathspec import PathSpec
+from pathspec.patterns import GitWildMatchPattern
+
+from point_in_time.utils.matcher import PathMatcher, literal_prefix
+
+PATHS = [
+    'a.py',
+    'a.txt',
+    'src/a.py',
+    'src/models/b.py',
+    'src/models/b.txt',
+    'src/models/deep/c.py',
+    'src/data/d.csv',
+    'data/raw/e.csv',
+    'data/raw/f.bin',
+    'data/processed/g.csv',
+    'docs/index.md',
+    'docs/src/h.py',
+    'build/',
+    'build/out.o',
+    'file with spaces.txt',
+    '"quotes".txt',
+]
+
+PATTERN_SETS = [
+    ['*'],
+    ['*', '!*.txt'],
+    ['src/'],
+    ['src', '!src/models/'],
+    ['/src/models/*.py'],
+    ['src/**/*.py', '!src/models/deep'],
+    ['*.py', '!docs/', 'docs/src/h.py'],
+    ['data/', '!data/raw/*.bin', '!data/processed'],
+    ['**/raw/**'],
+    ['# comment', '', 'docs/*.md'],
+    ['*', '!build/', 'build/out.o'],
+    ['file\\ with\\ spaces.txt', '"quotes".txt'],
+    ['s?c/', '!src/[md]*/'],
+]
+
+@pytest.mark.parametrize('lines', PATTERN_SETS)
+def test_matches_pathspec(lines):
+    spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+    matcher = PathMatcher(lines)
+
+    for path in PATHS:
+        assert matcher.match_file(path) == spec.match_file(path), path
+
+def test_matches_pathspec_randomized():
+    rng = random.Random(0)
+    components = ['src', 'data', 'raw', 'a', 'b.py', 'c.txt']
+    globs = ['*', '**', '*.py', 'r?w', '[ab]*']
+
+    def random_path():
+        return '/'.join(rng.choice(components) for _ in range(rng.randint(1, 4)))
+
+    def random_line():
+        parts = [rng.choice(components + globs) for _ in range(rng.randint(1, 3))]
+        line = '/'.join(parts)
+        if rng.random() < 0.3:
+            line = '/' + line
+        if rng.random() < 0.3:
+            line = line + '/'
+        if rng.random() < 0.3:
+            line = '!' + line
+        return line
+
+    paths = [random_path() for _ in range(200)]
+    for _ in range(100):
+        lines = [random_line() for _ in range(rng.randint(1, 5))]
+        spec = PathSpec.from_lines(GitWildMatchPattern, lines)
+        matcher = PathMatcher(lines)
+        for path in paths:
+            assert matcher.match_file(path) == spec.match_file(path), (lines, path)
+
+def test_subtree_decided():
+    matcher = PathMatcher(['*.py', 'data/', '!data/raw/'])
+
+    assert matcher.match_file('data/raw/x/y.csv') is False
+    # Once a directory pattern matches no candidates are left to test below it
+    assert matcher._dir_state('data/raw/x').candidates == ()
+    assert matcher._dir_state('data/raw/x').include is False
+
+def test_may_match_under():
+    matcher = PathMatcher(['src/models/*.py', '/data/', '!data/raw/'])
+
+    assert matcher.may_match_under('src')
+    assert matcher.may_match_under('src/models')
+    assert not matcher.may_match_under('src/utils')
+    assert not matcher.may_match_under('docs')
+    assert matcher.may_match_under('data/processed')
+    assert not matcher.may_match_under('data/raw/x')
+
+    # Unanchored patterns can match anywhere
+    assert PathMatcher(['*.py']).may_match_under('docs/deep')
+    assert PathMatcher(['data/']).may_match_under('docs/deep')
+
+def test_pickle():
+    lines = ['src/', '!src/models/']
+    matcher = pickle.loads(pickle.dumps(PathMatcher(lines)))
+
+    assert matcher.lines == lines
+    assert matcher.match_file('src/a.py')
+    assert not matcher.match_file('src/models/b.py')
+
+@pytest.mark.parametrize('line, expected', [
+    ('*.py', ''),
+    ('src/', ''),
+    ('src/models/*.py', 'src/models'),
+    ('/src/', 'src'),
+    ('/src/models/', 'src/models'),
+    ('**/raw', ''),
+])
+def test_literal_prefix(line, expected):
+    assert literal_prefix(line) == expected